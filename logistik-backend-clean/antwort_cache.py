@@ -0,0 +1,263 @@
+"""
+Antwort-Cache für selten geänderte Stammdaten (/fahrzeugtypen, /benutzer, /zeitfenster, /distanzmatrix)
+
+Fertig serialisierte Antworten (JSON-Bytes + Header) liegen unter Pfad + Query im Cache.
+Ein Treffer braucht weder Datenbank noch Pydantic. Jeder Eintrag hängt an Tags
+(z.B. "fahrzeugtypen"); schreibende Endpunkte erhöhen die Generation des Tags, damit
+sind alle Einträge mit der alten Generation ungültig. ETag (Hash des Inhalts) und
+Last-Modified erlauben 304-Antworten.
+
+Backend: im Prozess (LRU + TTL) oder mit CACHE_URL=redis://... geteilt zwischen allen
+Workern. Das Backend lässt sich per backend_setzen() austauschen, z.B. gegen einen
+lokalen Ersatz für Tests. CACHE_TTL_S=0 schaltet den Cache ab.
+"""
+import hashlib
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+CACHE_TTL_S = float(os.getenv("CACHE_TTL_S", "300"))
+CACHE_MAX_EINTRAEGE = int(os.getenv("CACHE_MAX_EINTRAEGE", "1000"))
+CACHE_URL = os.getenv("CACHE_URL", "")
+
+# Header der ursprünglichen Antwort, die mit gespeichert werden
+GESPEICHERTE_HEADER = ("X-Next-Cursor",)
+
+logger = logging.getLogger("antwort_cache")
+
+Eintrag = namedtuple("Eintrag", "inhalt etag geaendert kopfzeilen")
+
+
+# -------------------- BACKENDS --------------------
+class SpeicherBackend:
+    """LRU mit TTL im Prozess; Tag-Generationen werden nicht verdrängt"""
+
+    name = "speicher"
+
+    def __init__(self, max_eintraege=CACHE_MAX_EINTRAEGE, uhr=time.monotonic):
+        self._lock = threading.Lock()
+        self._eintraege = OrderedDict()
+        self._zaehler = {}
+        self.max_eintraege = max_eintraege
+        self.uhr = uhr
+
+    def holen(self, schluessel):
+        with self._lock:
+            gefunden = self._eintraege.get(schluessel)
+            if gefunden is None:
+                return None
+            wert, ablauf = gefunden
+            if ablauf <= self.uhr():
+                del self._eintraege[schluessel]
+                return None
+            self._eintraege.move_to_end(schluessel)
+            return wert
+
+    def setzen(self, schluessel, wert, ttl_s):
+        with self._lock:
+            self._eintraege[schluessel] = (wert, self.uhr() + ttl_s)
+            self._eintraege.move_to_end(schluessel)
+            while len(self._eintraege) > self.max_eintraege:
+                self._eintraege.popitem(last=False)
+
+    def zaehler(self, schluessel):
+        """Aktuelle Werte der Zähler (Liste von Schlüsseln), 0 wenn noch nie erhöht"""
+        with self._lock:
+            return [self._zaehler.get(s, 0) for s in schluessel]
+
+    def erhoehen(self, schluessel):
+        with self._lock:
+            self._zaehler[schluessel] = self._zaehler.get(schluessel, 0) + 1
+            return self._zaehler[schluessel]
+
+    def leeren(self):
+        with self._lock:
+            self._eintraege.clear()
+
+    def __len__(self):
+        return len(self._eintraege)
+
+
+class RedisBackend:
+    """
+    Geteilter Cache für mehrere Worker (optional, benötigt das Paket redis)
+    Fällt Redis aus, gilt jede Abfrage als Fehlversuch und die Endpunkte lesen aus der DB
+    """
+
+    name = "redis"
+
+    def __init__(self, url, praefix="logistik:cache:"):
+        import redis
+        self._fehler = redis.RedisError
+        self._redis = redis.Redis.from_url(url, socket_timeout=0.5)
+        self.praefix = praefix
+
+    def holen(self, schluessel):
+        try:
+            wert = self._redis.get(self.praefix + schluessel)
+        except self._fehler as e:
+            logger.warning("Redis nicht erreichbar: %s", e)
+            return None
+        return pickle.loads(wert) if wert is not None else None
+
+    def setzen(self, schluessel, wert, ttl_s):
+        try:
+            self._redis.set(self.praefix + schluessel, pickle.dumps(wert), px=max(int(ttl_s * 1000), 1))
+        except self._fehler as e:
+            logger.warning("Redis nicht erreichbar: %s", e)
+
+    def zaehler(self, schluessel):
+        try:
+            werte = self._redis.mget([self.praefix + s for s in schluessel])
+        except self._fehler as e:
+            logger.warning("Redis nicht erreichbar: %s", e)
+            # Unbekannte Generation: Schlüssel, der garantiert nicht im Cache liegt
+            return [f"x{time.time_ns()}"] * len(schluessel)
+        return [int(w) if w is not None else 0 for w in werte]
+
+    def erhoehen(self, schluessel):
+        try:
+            return self._redis.incr(self.praefix + schluessel)
+        except self._fehler as e:
+            # Andere Worker sehen die Änderung dann erst nach Ablauf der TTL
+            logger.error("Cache-Invalidierung %s fehlgeschlagen: %s", schluessel, e)
+            return None
+
+    def leeren(self):
+        try:
+            for schluessel in self._redis.scan_iter(self.praefix + "antwort:*"):
+                self._redis.delete(schluessel)
+        except self._fehler as e:
+            logger.warning("Redis nicht erreichbar: %s", e)
+
+
+def backend_erstellen(url=CACHE_URL):
+    if url.startswith("redis"):
+        return RedisBackend(url)
+    return SpeicherBackend()
+
+
+# -------------------- CACHE --------------------
+def _validieren(modell, objekt):
+    """ORM-Objekt -> Schema, mit Pydantic 1 und 2"""
+    if hasattr(modell, "model_validate"):
+        return modell.model_validate(objekt, from_attributes=True)
+    return modell.from_orm(objekt)
+
+def _etag_passt(kopf, etag):
+    return any(t.strip() in (etag, "*") for t in kopf.split(","))
+
+def _nicht_geaendert(request: Request, eintrag):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_passt(if_none_match, eintrag.etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return eintrag.geaendert <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+class AntwortCache:
+    def __init__(self, backend=None, ttl_s=CACHE_TTL_S):
+        self.backend = backend if backend is not None else backend_erstellen()
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._statistik = {}
+        self.invalidierungen = 0
+
+    def backend_setzen(self, backend):
+        self.backend = backend
+
+    def _zaehlen(self, tag, art):
+        with self._lock:
+            werte = self._statistik.setdefault(tag, {"treffer": 0, "fehlversuche": 0, "nicht_geaendert": 0})
+            werte[art] += 1
+
+    def _schluessel(self, request: Request, tags):
+        generationen = self.backend.zaehler([f"tag:{t}" for t in tags])
+        query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+        tag_teil = ",".join(f"{t}={g}" for t, g in zip(tags, generationen))
+        return f"antwort:{request.url.path}?{query}|{tag_teil}"
+
+    def antwort(self, request: Request, tags, laden, modell=None):
+        """
+        Gecachte Antwort für einen GET-Endpunkt
+        laden(response) liefert die Daten (ORM-Objekte oder dicts), modell das Pydantic-Schema dazu
+        """
+        if self.ttl_s <= 0:
+            return self._antwort_bauen(request, self._serialisieren(laden, modell))
+        schluessel = self._schluessel(request, tags)
+        eintrag = self.backend.holen(schluessel)
+        if eintrag is None:
+            self._zaehlen(tags[0], "fehlversuche")
+            eintrag = self._serialisieren(laden, modell)
+            self.backend.setzen(schluessel, eintrag, self.ttl_s)
+        else:
+            self._zaehlen(tags[0], "treffer")
+        antwort = self._antwort_bauen(request, eintrag)
+        if antwort.status_code == 304:
+            self._zaehlen(tags[0], "nicht_geaendert")
+        return antwort
+
+    def _serialisieren(self, laden, modell):
+        kopf = Response()
+        daten = laden(kopf)
+        if modell is not None:
+            daten = [_validieren(modell, d) for d in daten] if isinstance(daten, list) else _validieren(modell, daten)
+        inhalt = json.dumps(jsonable_encoder(daten), ensure_ascii=False, separators=(",", ":")).encode()
+        etag = f'"{hashlib.sha1(inhalt).hexdigest()[:20]}"'
+        kopfzeilen = {k: kopf.headers[k] for k in GESPEICHERTE_HEADER if k in kopf.headers}
+        return Eintrag(inhalt, etag, int(time.time()), kopfzeilen)
+
+    def _antwort_bauen(self, request: Request, eintrag):
+        kopfzeilen = {
+            **eintrag.kopfzeilen,
+            "ETag": eintrag.etag,
+            "Last-Modified": formatdate(eintrag.geaendert, usegmt=True),
+            "Cache-Control": "no-cache",
+        }
+        if _nicht_geaendert(request, eintrag):
+            return Response(status_code=304, headers=kopfzeilen)
+        return Response(content=eintrag.inhalt, media_type="application/json", headers=kopfzeilen)
+
+    def invalidieren(self, *tags):
+        """Nach dem Commit aufrufen: alle Einträge mit diesen Tags sind ab jetzt ungültig"""
+        for tag in tags:
+            self.backend.erhoehen(f"tag:{tag}")
+        with self._lock:
+            self.invalidierungen += len(tags)
+
+    def leeren(self):
+        self.backend.leeren()
+
+    def statistik(self):
+        """Zähler gelten pro Prozess, die Einträge je nach Backend auch workerübergreifend"""
+        with self._lock:
+            pro_tag = {tag: dict(werte) for tag, werte in self._statistik.items()}
+        treffer = sum(w["treffer"] for w in pro_tag.values())
+        fehlversuche = sum(w["fehlversuche"] for w in pro_tag.values())
+        status = {
+            "backend": self.backend.name if hasattr(self.backend, "name") else type(self.backend).__name__,
+            "ttl_s": self.ttl_s,
+            "treffer": treffer,
+            "fehlversuche": fehlversuche,
+            "trefferquote": round(treffer / (treffer + fehlversuche), 3) if treffer + fehlversuche else 0.0,
+            "invalidierungen": self.invalidierungen,
+            "pro_tag": pro_tag,
+        }
+        if isinstance(self.backend, SpeicherBackend):
+            status["eintraege"] = len(self.backend)
+        return status
+
+
+antwort_cache = AntwortCache()
@@ -0,0 +1,168 @@
+"""
+Automatische Archivierung abgeschlossener und vergangener Transporte
+
+Verschiebt Transporte in Stapeln per INSERT ... SELECT und DELETE nach
+archiv_transporte, jeder Stapel in einer eigenen kurzen Transaktion. Dazu eine
+Aufbewahrungsfrist in Monaten für das Archiv selbst.
+
+Im API-Prozess läuft die Archivierung als Hintergrund-Thread (ARCHIV_INTERVALL_MIN),
+einmalig von Hand: python archivierung.py
+"""
+import logging
+import os
+import threading
+from datetime import date, datetime, timedelta
+from sqlalchemy import select, insert, delete, literal, or_, func, text
+from database import engine
+from models import Transport, ArchivTransport
+import auslastung
+
+logger = logging.getLogger("logistik.archiv")
+
+ABGESCHLOSSENE_STATUS = tuple(
+    s.strip() for s in os.getenv("ARCHIV_STATUS", "abgeschlossen,erledigt,storniert").split(",") if s.strip()
+)
+# Transporte, deren Datum mindestens so viele Tage zurückliegt, werden archiviert (1 = ab gestern)
+ARCHIV_NACH_TAGEN = int(os.getenv("ARCHIV_NACH_TAGEN", "1"))
+# 0 = Archiv unbegrenzt aufbewahren
+AUFBEWAHRUNG_MONATE = int(os.getenv("ARCHIV_AUFBEWAHRUNG_MONATE", "0"))
+STAPEL_GROESSE = int(os.getenv("ARCHIV_STAPEL", "1000"))
+# 0 = kein Hintergrund-Thread
+INTERVALL_MIN = float(os.getenv("ARCHIV_INTERVALL_MIN", "60"))
+
+ARCHIV_LOCK_ID = 4712
+
+# Spalten im Archiv und woher sie im Transport kommen
+_ARCHIV_SPALTEN = ["transport_id", "von_id", "nach_id", "fahrzeugtyp", "status", "begruendung",
+                   "datum", "startzeit", "weg_min", "fahrer_id", "mehrfachtransport_id", "abgeschlossen_am"]
+
+
+def _archivierbar(stichtag):
+    return or_(Transport.status.in_(ABGESCHLOSSENE_STATUS), Transport.datum <= stichtag)
+
+def monat_abziehen(tag, monate):
+    jahr, monat = divmod(tag.year * 12 + tag.month - 1 - monate, 12)
+    return date(jahr, monat + 1, 1)
+
+def stapel_archivieren(conn, stichtag, zeitpunkt, groesse=STAPEL_GROESSE):
+    """Einen Stapel verschieben, gibt die Anzahl verschobener Transporte zurück"""
+    ids = conn.execute(
+        select(Transport.id).where(_archivierbar(stichtag)).order_by(Transport.id).limit(groesse)
+    ).scalars().all()
+    if not ids:
+        return 0
+    quelle = select(
+        Transport.id, Transport.von_id, Transport.nach_id, Transport.fahrzeugtyp, Transport.status,
+        Transport.begruendung, Transport.datum, Transport.startzeit, Transport.weg_min,
+        Transport.fahrer_id, Transport.mehrfachtransport_id, literal(zeitpunkt, ArchivTransport.abgeschlossen_am.type),
+    ).where(Transport.id.in_(ids))
+    # Archivierte Transporte belegen in der Zeitleiste nichts mehr, die Auslastung zieht nach
+    tage = conn.execute(
+        select(Transport.fahrzeugtyp, Transport.datum).distinct()
+        .where(Transport.id.in_(ids), Transport.mehrfachtransport_id.is_(None))
+    ).all()
+    conn.execute(insert(ArchivTransport).from_select(_ARCHIV_SPALTEN, quelle))
+    conn.execute(delete(Transport).where(Transport.id.in_(ids)))
+    if auslastung.AUSLASTUNG_AKTIV:
+        auslastung.tage_nachziehen(conn, tage)
+    return len(ids)
+
+def archiv_bereinigen(conn, grenze, groesse=STAPEL_GROESSE):
+    """Einen Stapel Archiv-Einträge vor dem Monat 'grenze' löschen"""
+    ids = conn.execute(
+        select(ArchivTransport.id).where(ArchivTransport.abgeschlossen_am < grenze)
+        .order_by(ArchivTransport.id).limit(groesse)
+    ).scalars().all()
+    if ids:
+        conn.execute(delete(ArchivTransport).where(ArchivTransport.id.in_(ids)))
+    return len(ids)
+
+def archivieren(bind=None, heute=None):
+    """Kompletter Lauf: alle archivierbaren Transporte verschieben, dann Aufbewahrung anwenden"""
+    bind = bind or engine
+    heute = heute or date.today()
+    stichtag = heute - timedelta(days=ARCHIV_NACH_TAGEN)
+    zeitpunkt = datetime.now()
+    archiviert = 0
+    geloescht = 0
+
+    with bind.connect() as lock_conn:
+        # Bei mehreren Workern archiviert nur einer gleichzeitig
+        if bind.dialect.name == "postgresql":
+            if not lock_conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": ARCHIV_LOCK_ID}).scalar():
+                return {"archiviert": 0, "geloescht_aus_archiv": 0}
+            lock_conn.commit()
+        try:
+            while True:
+                with bind.begin() as conn:
+                    anzahl = stapel_archivieren(conn, stichtag, zeitpunkt)
+                archiviert += anzahl
+                if anzahl < STAPEL_GROESSE:
+                    break
+            if AUFBEWAHRUNG_MONATE > 0:
+                grenze = monat_abziehen(heute, AUFBEWAHRUNG_MONATE)
+                while True:
+                    with bind.begin() as conn:
+                        anzahl = archiv_bereinigen(conn, grenze)
+                    geloescht += anzahl
+                    if anzahl < STAPEL_GROESSE:
+                        break
+        finally:
+            if bind.dialect.name == "postgresql":
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": ARCHIV_LOCK_ID})
+                lock_conn.commit()
+
+    if archiviert or geloescht:
+        logger.info("Archivierung: %d Transporte archiviert, %d alte Archiv-Einträge gelöscht",
+                    archiviert, geloescht)
+    return {"archiviert": archiviert, "geloescht_aus_archiv": geloescht}
+
+def archiv_monate(conn):
+    """Anzahl Archiv-Einträge je Monat (Grundlage für die Aufbewahrung nach Monaten)"""
+    if conn.dialect.name == "postgresql":
+        monat = func.to_char(ArchivTransport.abgeschlossen_am, "YYYY-MM")
+    else:
+        monat = func.strftime("%Y-%m", ArchivTransport.abgeschlossen_am)
+    zeilen = conn.execute(
+        select(monat.label("monat"), func.count().label("anzahl"))
+        .where(ArchivTransport.abgeschlossen_am.isnot(None))
+        .group_by(monat).order_by(monat)
+    ).all()
+    return [{"monat": z.monat, "anzahl": z.anzahl} for z in zeilen]
+
+
+class Archivierer:
+    """Hintergrund-Thread, der archivieren() alle INTERVALL_MIN Minuten ausführt"""
+
+    def __init__(self, intervall_min=INTERVALL_MIN):
+        self.intervall_s = intervall_min * 60
+        self._stopp = threading.Event()
+        self._thread = None
+
+    def starten(self):
+        if self.intervall_s <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._schleife, name="archivierer", daemon=True)
+        self._thread.start()
+
+    def stoppen(self):
+        self._stopp.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def _schleife(self):
+        while not self._stopp.wait(self.intervall_s):
+            try:
+                archivieren()
+            except Exception:
+                logger.exception("Archivierung fehlgeschlagen")
+
+
+archivierer = Archivierer()
+
+
+if __name__ == "__main__":
+    ergebnis = archivieren()
+    print(f"Archivierung abgeschlossen! {ergebnis['archiviert']} Transporte archiviert, "
+          f"{ergebnis['geloescht_aus_archiv']} alte Archiv-Einträge gelöscht.")
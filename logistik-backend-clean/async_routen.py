@@ -0,0 +1,88 @@
+"""
+async-Varianten der Endpunkte mit der meisten Last (DB_ASYNC=1)
+
+Die Router-Routen werden in main.py vor den sync-Routen registriert und haben
+deshalb Vorrang. Alle übrigen Endpunkte laufen weiter sync über den Threadpool.
+"""
+import asyncio
+from datetime import date
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import SessionLocal, get_async_db
+from models import Transport
+from distanz_cache import distanz_cache
+import cache_stand
+from standorte import standorte, verzeichnis_pruefen
+from ereignisse import aenderung_melden, transport_daten
+from disposition import fahrer_konflikte, konflikte_behandeln
+from verfuegbarkeit import zeitleiste_laden_async, verfuegbarkeit_antwort, slot_bereich
+from reservierung import reservierung_async, fahrer_gesperrt_async
+from paginierung import STANDARD_LIMIT, MAX_LIMIT
+from schnelle_listen import seite_antwort_async, transport_filter
+from messung import MessRoute
+import schemas
+
+router = APIRouter(route_class=MessRoute, dependencies=[Depends(verzeichnis_pruefen)])
+
+
+def distanz_cache_laden():
+    """Lädt den Distanz-Cache mit einer sync Session; im Worker-Thread aufrufen, nicht im Event-Loop"""
+    with SessionLocal() as db:
+        distanz_cache.sicherstellen(db)
+
+
+@router.get("/verfuegbare-zeiten/{fahrzeugtyp}/{datum}")
+async def verfuegbare_zeiten(fahrzeugtyp: str, datum: date, dauer_min: Optional[float] = Query(None, gt=0),
+                             db: AsyncSession = Depends(get_async_db)):
+    return verfuegbarkeit_antwort(await zeitleiste_laden_async(db, fahrzeugtyp, datum), dauer_min)
+
+
+@router.post("/transporte", response_model=schemas.TransportOut)
+async def transport_erstellen(transport: schemas.TransportCreate, response: Response,
+                              konflikte: str = Query("ablehnen", pattern="^(ablehnen|warnen)$"),
+                              db: AsyncSession = Depends(get_async_db)):
+    if not distanz_cache.aktuell(await db.run_sync(cache_stand.lesen, cache_stand.DISTANZEN)):
+        # Noch leer oder von einem anderen Worker geändert; Floyd-Warshall/npz-Lesen blockiert sonst alle Anfragen
+        await asyncio.to_thread(distanz_cache_laden)
+    try:
+        if standorte.bekannt(transport.von, transport.nach):
+            von_id, nach_id = standorte.aufloesen(transport.von, transport.nach)
+        else:
+            # Unbekannter Name oder Verzeichnis noch leer: einmal (sync) nachladen, sonst 400
+            von_id, nach_id = await asyncio.to_thread(standorte.aufloesen, transport.von, transport.nach)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    weg_min = distanz_cache.weg_min(von_id, nach_id)
+    try:
+        slot_bereich(transport.startzeit, weg_min)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Ungültige Startzeit: {transport.startzeit}")
+    fahrer_id = transport.fahrer_id if transport.mehrfachtransport_id is None else None
+    t = Transport(**transport.dict(exclude={"von", "nach", "fahrer_id"}), von_id=von_id, nach_id=nach_id,
+                  weg_min=weg_min, fahrer_id=fahrer_id)
+    # Fahrer bis zum Commit sperren, Prüfung und Speichern in derselben Transaktion
+    async with fahrer_gesperrt_async(db, [(fahrer_id, t.datum)]):
+        if fahrer_id is not None:
+            gefunden = await db.run_sync(fahrer_konflikte, fahrer_id, t.datum, t.startzeit, weg_min)
+            konflikte_behandeln(gefunden, konflikte, response)
+        if transport.mehrfachtransport_id is None:
+            async with reservierung_async(db, t.fahrzeugtyp, t.datum, t.startzeit, weg_min) as frei:
+                if not frei:
+                    raise HTTPException(status_code=409,
+                                        detail=f"Kein {t.fahrzeugtyp} frei am {t.datum} um {t.startzeit}")
+                db.add(t)
+                await db.commit()
+        else:
+            db.add(t)
+            await db.commit()
+    await db.refresh(t)
+    await db.run_sync(aenderung_melden, "transport", "angelegt", transport_daten(t), t.datum, t.fahrzeugtyp)
+    return t
+
+
+@router.get("/transporte", response_model=list[schemas.TransportOut])
+async def alle_transporte(limit: int = Query(STANDARD_LIMIT, ge=1, le=MAX_LIMIT),
+                          after_id: Optional[int] = None, bedingungen: list = Depends(transport_filter),
+                          db: AsyncSession = Depends(get_async_db)):
+    return await seite_antwort_async(db, Transport, schemas.TransportOut, bedingungen, limit, after_id)
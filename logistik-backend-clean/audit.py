@@ -0,0 +1,250 @@
+"""
+Automatisches Audit-Log in logbuch (write-behind)
+
+Session-Events erfassen jedes Anlegen, Ändern und Löschen von ORM-Objekten mit den
+geänderten Feldern (geändert: [alt, neu]). Erst nach dem Commit kommen die Einträge in
+einen Puffer im Speicher, bei Rollback werden sie verworfen. Ein Hintergrund-Thread
+schreibt den Puffer gesammelt in logbuch, sobald AUDIT_STAPEL Einträge warten oder
+AUDIT_INTERVALL_S vergangen ist, beim Herunterfahren den Rest. Der Request wartet auf
+keinen zusätzlichen Commit.
+
+Wer geändert hat, kommt aus dem Header X-Benutzer-Id (AuditMiddleware).
+Sammel-Statements über die Session (insert(Transport) usw.) werden je Statement mit der
+Zeilenzahl erfasst, Core-Zugriffe ohne Session (Archivierung, Migrationen) nicht.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import date, datetime
+from sqlalchemy import event, insert, inspect
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from database import engine
+from models import Logbuch
+
+AUDIT_AKTIV = os.getenv("AUDIT", "1") == "1"
+AUDIT_STAPEL = int(os.getenv("AUDIT_STAPEL", "500"))
+AUDIT_INTERVALL_S = float(os.getenv("AUDIT_INTERVALL_S", "2"))
+# Läuft der Puffer voll (DB länger nicht erreichbar), fallen die ältesten Einträge weg
+AUDIT_MAX_PUFFER = int(os.getenv("AUDIT_MAX_PUFFER", "100000"))
+
+# Tabellen, die nicht protokolliert werden (das Logbuch selbst)
+OHNE_AUDIT = {Logbuch.__tablename__}
+
+logger = logging.getLogger("logistik.audit")
+
+_benutzer = ContextVar("audit_benutzer", default=None)
+
+
+class AuditMiddleware:
+    """Setzt den Benutzer der Anfrage aus X-Benutzer-Id für die Session-Events"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        wert = dict(scope["headers"]).get(b"x-benutzer-id", b"")
+        token = _benutzer.set(int(wert) if wert.isdigit() else None)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _benutzer.reset(token)
+
+
+# -------------------- ERFASSEN --------------------
+def _json_wert(wert):
+    if isinstance(wert, (date, datetime)):
+        return wert.isoformat()
+    return str(wert)
+
+def _eintrag(tabelle, datensatz_id, aktion, aenderungen):
+    return {
+        "aktion": aktion,
+        "zeitpunkt": datetime.now(),
+        "benutzer_id": _benutzer.get(),
+        "tabelle": tabelle,
+        "datensatz_id": datensatz_id,
+        "aenderungen": json.dumps(aenderungen, default=_json_wert, ensure_ascii=False, separators=(",", ":")),
+    }
+
+def _spalten(mapper):
+    """Spalten-Attribute ohne die Versionsspalte (ändert sich bei jedem UPDATE)"""
+    return [attr for attr in mapper.column_attrs if attr.columns[0] is not mapper.version_id_col]
+
+def _objekt_eintrag(objekt, aktion):
+    zustand = inspect(objekt)
+    mapper = zustand.mapper
+    tabelle = mapper.local_table.name
+    if tabelle in OHNE_AUDIT:
+        return None
+    if aktion == "geaendert":
+        aenderungen = {}
+        for attr in _spalten(mapper):
+            verlauf = zustand.attrs[attr.key].history
+            if verlauf.has_changes():
+                aenderungen[attr.key] = [verlauf.deleted[0] if verlauf.deleted else None,
+                                         verlauf.added[0] if verlauf.added else None]
+        if not aenderungen:
+            return None
+    else:
+        # Nur geladene Werte: ein gelöschtes Objekt kann nichts mehr nachladen
+        aenderungen = {attr.key: zustand.dict[attr.key] for attr in _spalten(mapper)
+                       if zustand.dict.get(attr.key) is not None}
+    # Neue Objekte haben im after_flush schon ihren Primärschlüssel, aber noch keine identity
+    primaerschluessel = mapper.primary_key
+    datensatz_id = None
+    if len(primaerschluessel) == 1:
+        datensatz_id = zustand.dict.get(mapper.get_property_by_column(primaerschluessel[0]).key)
+    return _eintrag(tabelle, datensatz_id, aktion, aenderungen)
+
+def _vormerken(session, eintraege):
+    session.info.setdefault("audit", []).extend(e for e in eintraege if e is not None)
+
+def _nach_flush(session, flush_context):
+    # Neu/geändert/gelöscht und die Attribut-Historie zeigen hier noch den Stand vor dem Flush
+    _vormerken(session, [_objekt_eintrag(o, "angelegt") for o in session.new]
+               + [_objekt_eintrag(o, "geaendert") for o in session.dirty]
+               + [_objekt_eintrag(o, "geloescht") for o in session.deleted])
+
+def _orm_statement(ausfuehrung):
+    """insert()/update()/delete() über die Session: ein Eintrag je Statement"""
+    if not (ausfuehrung.is_insert or ausfuehrung.is_update or ausfuehrung.is_delete):
+        return
+    mapper = ausfuehrung.bind_mapper
+    if mapper is None or mapper.local_table.name in OHNE_AUDIT:
+        return
+    if ausfuehrung.is_insert:
+        parameter = ausfuehrung.parameters
+        aktion, aenderungen = "sammel_angelegt", {"zeilen": len(parameter) if isinstance(parameter, list) else 1}
+    else:
+        bedingung = ausfuehrung.statement.whereclause
+        aktion = "sammel_geaendert" if ausfuehrung.is_update else "sammel_geloescht"
+        aenderungen = {"bedingung": str(bedingung) if bedingung is not None else None}
+    _vormerken(ausfuehrung.session, [_eintrag(mapper.local_table.name, None, aktion, aenderungen)])
+
+def _nach_commit(session):
+    eintraege = session.info.pop("audit", None)
+    if eintraege:
+        audit_puffer.hinzufuegen(eintraege)
+
+def _transaktion_beendet(session, transaktion):
+    # Nach Rollback oder close() ohne Commit: vorgemerkte Einträge verwerfen
+    if transaktion.parent is None:
+        session.info.pop("audit", None)
+
+
+# -------------------- PUFFER --------------------
+class AuditPuffer:
+    """Einträge im Speicher sammeln und im Hintergrund gesammelt in logbuch schreiben"""
+
+    def __init__(self, stapel=AUDIT_STAPEL, intervall_s=AUDIT_INTERVALL_S, max_eintraege=AUDIT_MAX_PUFFER,
+                 bind=None):
+        self.stapel = stapel
+        self.intervall_s = intervall_s
+        self.max_eintraege = max_eintraege
+        self.bind = bind or engine
+        self._eintraege = deque()
+        self._lock = threading.Lock()
+        self._schreib_lock = threading.Lock()
+        self._voll = threading.Event()
+        self._stopp = threading.Event()
+        self._thread = None
+        self.geschrieben = 0
+        self.verworfen = 0
+        self.fehler = 0
+        self.letzter_stapel_ms = 0.0
+
+    def hinzufuegen(self, eintraege):
+        with self._lock:
+            self._eintraege.extend(eintraege)
+            while len(self._eintraege) > self.max_eintraege:
+                self._eintraege.popleft()
+                self.verworfen += 1
+            voll = len(self._eintraege) >= self.stapel
+        if voll:
+            self._voll.set()
+
+    def starten(self):
+        if self._thread is not None:
+            return
+        self._stopp.clear()
+        self._thread = threading.Thread(target=self._schleife, name="audit", daemon=True)
+        self._thread.start()
+
+    def stoppen(self):
+        """Thread beenden und alles Gepufferte schreiben"""
+        self._stopp.set()
+        self._voll.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+        self.schreiben()
+
+    def _schleife(self):
+        while not self._stopp.is_set():
+            self._voll.wait(self.intervall_s)
+            self._voll.clear()
+            self.schreiben()
+
+    def schreiben(self):
+        """Puffer in Stapeln schreiben; schlägt ein Stapel fehl, bleibt er für den nächsten Versuch"""
+        with self._schreib_lock:
+            while True:
+                with self._lock:
+                    stapel = [self._eintraege.popleft() for _ in range(min(self.stapel, len(self._eintraege)))]
+                if not stapel:
+                    return
+                start = time.perf_counter()
+                try:
+                    with self.bind.begin() as conn:
+                        conn.execute(insert(Logbuch), stapel)
+                except SQLAlchemyError:
+                    logger.exception("Audit-Einträge konnten nicht geschrieben werden")
+                    with self._lock:
+                        self.fehler += 1
+                        self._eintraege.extendleft(reversed(stapel))
+                    return
+                with self._lock:
+                    self.geschrieben += len(stapel)
+                    self.letzter_stapel_ms = (time.perf_counter() - start) * 1000
+
+    def statistik(self):
+        with self._lock:
+            return {
+                "aktiv": self._thread is not None,
+                "gepuffert": len(self._eintraege),
+                "geschrieben": self.geschrieben,
+                "verworfen": self.verworfen,
+                "fehler": self.fehler,
+                "letzter_stapel_ms": round(self.letzter_stapel_ms, 2),
+            }
+
+
+audit_puffer = AuditPuffer()
+_registriert = False
+
+
+def aktivieren():
+    """Session-Events registrieren (gilt für alle Sessions, auch AsyncSession) und den Puffer starten"""
+    global _registriert
+    if not AUDIT_AKTIV:
+        return
+    if not _registriert:
+        event.listen(Session, "after_flush", _nach_flush)
+        event.listen(Session, "do_orm_execute", _orm_statement)
+        event.listen(Session, "after_commit", _nach_commit)
+        event.listen(Session, "after_transaction_end", _transaktion_beendet)
+        # Skripte ohne Shutdown-Event verlieren beim Beenden nichts
+        atexit.register(audit_puffer.stoppen)
+        _registriert = True
+    audit_puffer.starten()
+
+def stoppen():
+    audit_puffer.stoppen()
@@ -0,0 +1,259 @@
+"""
+Auslastung je Fahrzeugtyp, Tag und Slot (Tabelle auslastung)
+
+Je (fahrzeugtyp, datum, slot): belegte Fahrzeug-Minuten, Anzahl beginnender Fahrten
+und die Spitze gleichzeitig belegter Fahrzeuge, gezählt wie in der Zeitleiste
+(Einzeltransporte ohne Tour und Mehrfachtransporte, archivierte Transporte nicht).
+Die Archivierung rechnet die Tage der verschobenen Transporte nach (archivierung.py).
+Nur Slots mit Belegung haben eine Zeile.
+
+Die Spitze lässt sich nicht aufaddieren. Deshalb merken sich Session-Events die Tage,
+die ein Flush berührt (alter und neuer Tag), und vor dem Commit werden genau diese Tage
+in derselben Transaktion neu berechnet. Auf Postgres sperrt dabei ein Advisory-Lock je
+Tag, damit parallele Commits sich nicht gegenseitig überschreiben.
+
+Sammel-Updates/-Deletes über die Session erfassen die Tage vor dem Statement; Core-Zugriffe
+ohne Session und Sammel-Updates, die Fahrzeugtyp oder Datum setzen, nicht. Dafür und für
+Nachträge: python auslastung.py [--von 2025-01-01] [--bis 2025-02-01] [--fahrzeugtyp LKW]
+"""
+import argparse
+import math
+import os
+from datetime import date
+from operator import eq, ge, lt
+from sqlalchemy import event, func, inspect, select, text
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.operators import in_op
+from models import Auslastung, Transport, Mehrfachtransport, Fahrzeugtyp
+from paginierung import filter_anwenden
+from reservierung import sperr_schluessel
+from verfuegbarkeit import SLOT_MIN, TAG_MIN, Zeitleiste, minuten_zu_zeit
+
+AUSLASTUNG_AKTIV = os.getenv("AUSLASTUNG", "1") == "1"
+EINFUEGEN_STAPEL = 5000
+
+# Änderungen an diesen Feldern verschieben die Belegung
+_FELDER = {
+    Transport: ("fahrzeugtyp", "datum", "startzeit", "weg_min", "mehrfachtransport_id"),
+    Mehrfachtransport: ("fahrzeugtyp", "datum", "startzeit", "gesamt_weg_min"),
+}
+# Eigener Slot -1 neben den Slot-Sperren aus reservierung.py
+_SPERRE = text("SELECT pg_advisory_xact_lock(:schluessel, -1)")
+_tabelle = Auslastung.__table__
+
+
+# -------------------- BERECHNEN --------------------
+def _buchungen(von=None, bis=None, typen=None, daten=None):
+    """select() je Quelle: (fahrzeugtyp, datum, startzeit, dauer_min), dieselben Buchungen wie die Zeitleiste"""
+    for modell, dauer in ((Transport, Transport.weg_min), (Mehrfachtransport, Mehrfachtransport.gesamt_weg_min)):
+        stmt = filter_anwenden(
+            select(modell.fahrzeugtyp, modell.datum, modell.startzeit, dauer),
+            (modell.datum, ge, von),
+            (modell.datum, lt, bis),
+            (modell.fahrzeugtyp, in_op, typen),
+            (modell.datum, in_op, daten),
+        )
+        if modell is Transport:
+            # Touren-Transporte sind über den Mehrfachtransport bereits belegt
+            stmt = stmt.where(modell.mehrfachtransport_id.is_(None))
+        yield stmt
+
+def tageswerte(buchungen):
+    """[(startzeit, dauer_min)] -> [(slot, belegte_min, fahrten, spitze)] für Slots mit Belegung"""
+    zeitleiste = Zeitleiste(0)
+    for startzeit, dauer_min in buchungen:
+        zeitleiste.buchung_hinzufuegen(startzeit, dauer_min)
+    anzahl = TAG_MIN // SLOT_MIN
+    belegt = [0.0] * anzahl
+    fahrten = [0] * anzahl
+    for start, ende in zeitleiste.intervalle:
+        fahrten[start // SLOT_MIN] += 1
+        for slot in range(start // SLOT_MIN, math.ceil(ende / SLOT_MIN)):
+            belegt[slot] += min(ende, (slot + 1) * SLOT_MIN) - max(start, slot * SLOT_MIN)
+    spitze = zeitleiste.belegung_pro_slot()
+    return [(slot, belegt[slot], fahrten[slot], spitze[slot]) for slot in range(anzahl) if spitze[slot]]
+
+def _schreiben(bind, tage):
+    """{(fahrzeugtyp, datum): [(startzeit, dauer_min)]} als Zeilen einfügen"""
+    zeilen = [{"fahrzeugtyp": typ, "datum": datum, "slot": slot, "belegte_min": belegt,
+               "fahrten": fahrten, "spitze": spitze}
+              for (typ, datum), buchungen in tage.items()
+              for slot, belegt, fahrten, spitze in tageswerte(buchungen)]
+    for i in range(0, len(zeilen), EINFUEGEN_STAPEL):
+        bind.execute(_tabelle.insert(), zeilen[i:i + EINFUEGEN_STAPEL])
+    return len(zeilen)
+
+def tage_aktualisieren(bind, tage):
+    """Die Tage [(fahrzeugtyp, datum)] aus den Buchungen neu berechnen (bind: Session oder Connection)"""
+    tage = {(typ, datum) for typ, datum in tage if typ is not None and datum is not None}
+    if not tage:
+        return 0
+    # Typen x Tage ist eine Obermenge (bei Sammelbuchungen), sie wird komplett neu geschrieben
+    typen = sorted({typ for typ, _ in tage})
+    daten = sorted({datum for _, datum in tage})
+    neu = {}
+    for stmt in _buchungen(typen=typen, daten=daten):
+        for typ, datum, startzeit, dauer_min in bind.execute(stmt):
+            neu.setdefault((typ, datum), []).append((startzeit, dauer_min))
+    bind.execute(_tabelle.delete().where(in_op(_tabelle.c.fahrzeugtyp, typen), in_op(_tabelle.c.datum, daten)))
+    return _schreiben(bind, neu)
+
+def tage_nachziehen(bind, tage):
+    """Wie tage_aktualisieren, vorher auf Postgres die Tage sperren (Session oder Connection)"""
+    verbindung = bind.get_bind() if isinstance(bind, Session) else bind
+    if verbindung.dialect.name == "postgresql":
+        for schluessel in sorted({sperr_schluessel(typ, datum) for typ, datum in tage}):
+            bind.execute(_SPERRE, {"schluessel": schluessel})
+    return tage_aktualisieren(bind, tage)
+
+def neu_aufbauen(bind, von=None, bis=None, fahrzeugtyp=None):
+    """Zeitraum [von, bis) komplett aus den Buchungen neu aufbauen, gibt die Zeilenzahl zurück"""
+    tage = {}
+    for stmt in _buchungen(von, bis, [fahrzeugtyp] if fahrzeugtyp is not None else None):
+        for typ, datum, startzeit, dauer_min in bind.execute(stmt):
+            if typ is not None and datum is not None:
+                tage.setdefault((typ, datum), []).append((startzeit, dauer_min))
+    bind.execute(filter_anwenden(
+        _tabelle.delete(),
+        (_tabelle.c.datum, ge, von),
+        (_tabelle.c.datum, lt, bis),
+        (_tabelle.c.fahrzeugtyp, eq, fahrzeugtyp),
+    ))
+    return _schreiben(bind, tage)
+
+
+# -------------------- SESSION-EVENTS --------------------
+def _vormerken(session, tage):
+    session.info.setdefault("auslastung_tage", set()).update(
+        (typ, datum) for typ, datum in tage if typ is not None and datum is not None)
+
+def _alter_wert(zustand, feld):
+    verlauf = zustand.attrs[feld].history
+    if verlauf.deleted:
+        return verlauf.deleted[0]
+    return verlauf.unchanged[0] if verlauf.unchanged else zustand.dict.get(feld)
+
+def _objekt_tage(objekt, geaendert):
+    felder = _FELDER.get(type(objekt))
+    if felder is None:
+        return []
+    zustand = inspect(objekt)
+    neu = (zustand.dict.get("fahrzeugtyp"), zustand.dict.get("datum"))
+    if not geaendert:
+        return [neu]
+    if not any(zustand.attrs[feld].history.has_changes() for feld in felder):
+        return []
+    return [neu, (_alter_wert(zustand, "fahrzeugtyp"), _alter_wert(zustand, "datum"))]
+
+def _nach_flush(session, flush_context):
+    # Die Attribut-Historie zeigt hier noch den Stand vor dem Flush
+    tage = []
+    for objekt in session.new:
+        tage += _objekt_tage(objekt, False)
+    for objekt in session.dirty:
+        tage += _objekt_tage(objekt, True)
+    for objekt in session.deleted:
+        tage += _objekt_tage(objekt, False)
+    _vormerken(session, tage)
+
+def _orm_statement(ausfuehrung):
+    """insert()/update()/delete() über die Session auf Transport oder Mehrfachtransport"""
+    if not (ausfuehrung.is_insert or ausfuehrung.is_update or ausfuehrung.is_delete):
+        return
+    mapper = ausfuehrung.bind_mapper
+    if mapper is None or mapper.class_ not in _FELDER:
+        return
+    modell = mapper.class_
+    if ausfuehrung.is_insert:
+        parameter = ausfuehrung.parameters or []
+        if isinstance(parameter, dict):
+            parameter = [parameter]
+        tage = [(p.get("fahrzeugtyp"), p.get("datum")) for p in parameter]
+    else:
+        # Betroffene Tage vor dem Statement lesen
+        stmt = select(modell.fahrzeugtyp, modell.datum).distinct()
+        if ausfuehrung.statement.whereclause is not None:
+            stmt = stmt.where(ausfuehrung.statement.whereclause)
+        tage = ausfuehrung.session.execute(stmt).all()
+    _vormerken(ausfuehrung.session, tage)
+
+def _vor_commit(session):
+    # Erst alles flushen, damit auch die letzten Änderungen ihre Tage vormerken
+    session.flush()
+    tage = session.info.pop("auslastung_tage", None)
+    if not tage:
+        return
+    tage_nachziehen(session, tage)
+
+def _transaktion_beendet(session, transaktion):
+    # Rollback oder close() ohne Commit: nichts nachzuziehen
+    if transaktion.parent is None:
+        session.info.pop("auslastung_tage", None)
+
+_registriert = False
+
+def aktivieren():
+    """Session-Events registrieren (alle Sessions, auch AsyncSession); Skripte ohne Aufruf: neu_aufbauen"""
+    global _registriert
+    if not AUSLASTUNG_AKTIV or _registriert:
+        return
+    event.listen(Session, "after_flush", _nach_flush)
+    event.listen(Session, "do_orm_execute", _orm_statement)
+    event.listen(Session, "before_commit", _vor_commit)
+    event.listen(Session, "after_transaction_end", _transaktion_beendet)
+    _registriert = True
+
+
+# -------------------- ABFRAGE --------------------
+GRUPPIERUNGEN = ("zeitraum", "tag", "slot")
+
+def statistik(db: Session, von: date, bis: date, fahrzeugtyp=None, gruppierung="tag"):
+    """
+    Summen aus der Tabelle auslastung je Fahrzeugtyp (und Tag bzw. Slot) im Zeitraum [von, bis)
+    auslastung: belegte Minuten / (Kapazität x verfügbare Minuten), spitzen_auslastung: Spitze / Kapazität
+    Tage und Slots ohne Buchung fehlen
+    """
+    gruppe = [Auslastung.fahrzeugtyp]
+    if gruppierung in ("tag", "slot"):
+        gruppe.append(Auslastung.datum)
+    if gruppierung == "slot":
+        gruppe.append(Auslastung.slot)
+    stmt = filter_anwenden(
+        select(*gruppe, Fahrzeugtyp.anzahl_verfuegbar,
+               func.sum(Auslastung.belegte_min).label("belegte_min"),
+               func.sum(Auslastung.fahrten).label("fahrten"),
+               func.max(Auslastung.spitze).label("spitze"))
+        .outerjoin(Fahrzeugtyp, Fahrzeugtyp.name == Auslastung.fahrzeugtyp)
+        .where(Auslastung.datum >= von, Auslastung.datum < bis),
+        (Auslastung.fahrzeugtyp, eq, fahrzeugtyp),
+    ).group_by(*gruppe, Fahrzeugtyp.anzahl_verfuegbar).order_by(*gruppe)
+
+    minuten = {"zeitraum": (bis - von).days * TAG_MIN, "tag": TAG_MIN, "slot": SLOT_MIN}[gruppierung]
+    ergebnis = []
+    for zeile in db.execute(stmt):
+        kapazitaet = zeile.anzahl_verfuegbar
+        ergebnis.append({
+            "fahrzeugtyp": zeile.fahrzeugtyp,
+            "datum": zeile.datum if gruppierung != "zeitraum" else None,
+            "zeit": minuten_zu_zeit(zeile.slot * SLOT_MIN) if gruppierung == "slot" else None,
+            "kapazitaet": kapazitaet,
+            "belegte_min": round(zeile.belegte_min, 1),
+            "fahrten": zeile.fahrten,
+            "spitze": zeile.spitze,
+            "auslastung": round(zeile.belegte_min / (kapazitaet * minuten), 4) if kapazitaet else None,
+            "spitzen_auslastung": round(zeile.spitze / kapazitaet, 4) if kapazitaet else None,
+        })
+    return ergebnis
+
+
+if __name__ == "__main__":
+    from database import engine
+
+    parser = argparse.ArgumentParser(description="Tabelle auslastung aus den Buchungen neu aufbauen")
+    parser.add_argument("--von", type=date.fromisoformat, help="erster Tag (Standard: alle)")
+    parser.add_argument("--bis", type=date.fromisoformat, help="Tag nach dem letzten (exklusiv)")
+    parser.add_argument("--fahrzeugtyp")
+    args = parser.parse_args()
+    with engine.begin() as conn:
+        zeilen = neu_aufbauen(conn, args.von, args.bis, args.fahrzeugtyp)
+    print(f"Auslastung neu aufgebaut: {zeilen} Zeilen.")
@@ -0,0 +1,425 @@
+"""
+Benchmark-Suite für die Buchungs-API
+
+Befüllt eine Benchmark-Datenbank mit realistischen Mengen (Standorte und Strecken in
+der distanzmatrix, ein Jahr transporte, mehrfachtransporte und logbuch), startet die
+API per uvicorn dagegen und misst Durchsatz und p50/p95/p99-Latenzen der wichtigsten
+Endpunkte. Danach wird die Laufzeit des Excel-Imports aus import_distanzmatrix.py mit
+einer erzeugten Matrix gemessen und ein Tag mit 300 offenen Transporten geplant (tagesplanung.py).
+
+Standard ist eine frische SQLite-Datei im Temp-Verzeichnis. Mit --db postgresql://...
+läuft der Benchmark gegen eine lokale, leere Postgres-Datenbank, die danach verworfen
+werden sollte. Gleicher --seed = gleiche Daten und Anfragen.
+
+Das Ergebnis ist JSON (stdout bzw. --ausgabe). Mit --vergleich alt.json werden
+Durchsatz, p95 und Importdauer gegen einen früheren Lauf geprüft. Ist einer der Werte
+um mehr als --toleranz schlechter, endet das Skript mit Exit-Code 1.
+
+Aufruf: python benchmark_api.py [--db URL] [--standorte 1000] [--transporte-pro-tag 200]
+        [--anfragen 500] [--parallel 20] [--ausgabe ergebnis.json] [--vergleich alt.json]
+Benötigt: uvicorn, httpx, pandas, openpyxl
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+import httpx
+
+PORT = 8767
+BASIS_URL = f"http://127.0.0.1:{PORT}"
+VERZEICHNIS = os.path.dirname(os.path.abspath(__file__))
+JAHR_START = date(2031, 1, 1)
+TAGE = 365
+# Fahrzeugtyp -> Anzahl; großzügig, damit die Buchungen im Benchmark nicht an der Kapazität scheitern
+FAHRZEUGTYPEN = {"LKW": 40, "Transporter": 60, "Stapler": 30, "Sattelzug": 20}
+STATUS = ["offen", "geplant", "unterwegs", "abgeschlossen"]
+STAPEL = 10000
+
+
+def perzentil(werte, p):
+    werte = sorted(werte)
+    if not werte:
+        return None
+    index = min(int(round(p / 100 * (len(werte) - 1))), len(werte) - 1)
+    return werte[index]
+
+def standort(i):
+    return f"Bau {i // 100:02d}-{i % 100:02d}"
+
+def startzeit(rng):
+    """Startzeit im Tagesgeschäft 06:00 - 17:30"""
+    minuten = rng.randrange(6 * 60, 18 * 60, 30)
+    return f"{minuten // 60:02d}:{minuten % 60:02d}"
+
+
+# -------------------- DATEN --------------------
+def strecken_erzeugen(rng, anzahl_standorte):
+    """
+    Standorte als Gitter mit Nachbarstrecken (zusammenhängend) plus einige Abkürzungen
+    Liefert {(von, nach): weg_min}
+    """
+    breite = math.ceil(math.sqrt(anzahl_standorte))
+    strecken = {}
+    for i in range(anzahl_standorte):
+        for j in (i + 1, i + breite):
+            if j < anzahl_standorte and (j != i + 1 or j % breite != 0):
+                strecken[(standort(i), standort(j))] = round(rng.uniform(8, 25), 1)
+    for _ in range(anzahl_standorte // 10):
+        i, j = rng.sample(range(anzahl_standorte), 2)
+        strecken.setdefault((standort(i), standort(j)), round(rng.uniform(20, 60), 1))
+    return strecken
+
+def _einfuegen(conn, tabelle, zeilen):
+    for i in range(0, len(zeilen), STAPEL):
+        conn.execute(tabelle.insert(), zeilen[i:i + STAPEL])
+
+def standorte_anlegen(conn, namen):
+    """Fehlende Standorte anlegen, Rückgabe {name: id} über alle Standorte"""
+    from sqlalchemy import select
+    from models import Standort
+    from standorte import schluessel
+
+    vorhanden = set(conn.execute(select(Standort.schluessel)).scalars())
+    _einfuegen(conn, Standort.__table__, [{"name": name, "schluessel": schluessel(name)}
+                                          for name in dict.fromkeys(namen) if schluessel(name) not in vorhanden])
+    return dict(conn.execute(select(Standort.name, Standort.id)).all())
+
+def standort_ids_einsetzen(zeilen, ids):
+    """von/nach (Namen) in den Zeilen durch von_id/nach_id ersetzen"""
+    for zeile in zeilen:
+        zeile["von_id"], zeile["nach_id"] = ids[zeile.pop("von")], ids[zeile.pop("nach")]
+    return zeilen
+
+def datenbank_befuellen(engine, rng, args):
+    """Legt das Schema per Migration an und schreibt alle Stammdaten und Bewegungsdaten gesammelt"""
+    from sqlalchemy import func, select
+    from migrationen import migrieren
+    from models import (Benutzer, Fahrzeugtyp, Transport, Mehrfachtransport, MehrfachtransportRoute,
+                        Zeitfenster, Logbuch, Distanz)
+
+    migrieren(engine)
+    with engine.connect() as conn:
+        if conn.execute(select(func.count()).select_from(Transport)).scalar():
+            raise SystemExit("Ziel-Datenbank ist nicht leer, Benchmark nur gegen eine leere Datenbank laufen lassen")
+
+    start = time.perf_counter()
+    strecken = strecken_erzeugen(rng, args.standorte)
+    paare = list(strecken)
+    benutzer = [{"vorname": f"Vorname {i}", "nachname": f"Nachname {i}",
+                 "rolle": "fahrer" if i % 5 else "disponent", "email": f"benutzer{i}@example.org"}
+                for i in range(100)]
+    transporte, touren, routen, logbuch, zeitfenster = [], [], [], [], []
+    for tag in range(TAGE):
+        datum = JAHR_START + timedelta(days=tag)
+        for _ in range(args.transporte_pro_tag):
+            von, nach = rng.choice(paare) if rng.random() < 0.5 else (
+                standort(rng.randrange(args.standorte)), standort(rng.randrange(args.standorte)))
+            zeit = startzeit(rng)
+            transporte.append({
+                "von": von, "nach": nach, "fahrzeugtyp": rng.choice(list(FAHRZEUGTYPEN)), "datum": datum,
+                "startzeit": zeit, "weg_min": round(rng.uniform(8, 60), 1),
+                "zeitfenster": datetime.combine(datum, datetime.strptime(zeit, "%H:%M").time()),
+                "status": rng.choice(STATUS), "fahrer_id": rng.randrange(1, 101) if rng.random() < 0.3 else None,
+                "version": 1,
+            })
+        for _ in range(max(args.transporte_pro_tag // 20, 1)):
+            stopps = [standort(rng.randrange(args.standorte)) for _ in range(4)]
+            touren.append({"name": " - ".join(stopps), "fahrzeugtyp": rng.choice(list(FAHRZEUGTYPEN)),
+                           "datum": datum, "startzeit": startzeit(rng), "status": rng.choice(STATUS),
+                           "gesamt_weg_min": round(rng.uniform(30, 120), 1), "erstellt_am": datetime.now(),
+                           "version": 1})
+            # Tour-Nummer, wird nach dem INSERT durch die echte ID ersetzt
+            routen += [{"mehrfachtransport_id": len(touren) - 1, "reihenfolge": i + 1, "von": stopps[i],
+                        "nach": stopps[i + 1], "weg_min": round(rng.uniform(8, 40), 1)} for i in range(3)]
+        for _ in range(args.logbuch_pro_tag):
+            logbuch.append({"aktion": f"Transport {rng.randrange(1, 10**6)} {rng.choice(STATUS)}",
+                            "zeitpunkt": datetime.combine(datum, datetime.min.time()) + timedelta(
+                                seconds=rng.randrange(86400)),
+                            "benutzer_id": rng.randrange(1, 101)})
+        morgens = datetime.combine(datum, datetime.min.time())
+        zeitfenster += [{"start": morgens + timedelta(hours=h), "ende": morgens + timedelta(hours=h + 4),
+                         "verfuegbar": "true"} for h in (6, 12)]
+
+    with engine.begin() as conn:
+        _einfuegen(conn, Fahrzeugtyp.__table__, [{"name": n, "anzahl_verfuegbar": a} for n, a in FAHRZEUGTYPEN.items()])
+        _einfuegen(conn, Benutzer.__table__, benutzer)
+        ids = standorte_anlegen(conn, [standort(i) for i in range(args.standorte)])
+        _einfuegen(conn, Distanz.__table__, [{"von_id": ids[v], "nach_id": ids[n], "weg_min": w}
+                                             for (v, n), w in strecken.items()])
+        _einfuegen(conn, Transport.__table__, standort_ids_einsetzen(transporte, ids))
+        _einfuegen(conn, Mehrfachtransport.__table__, touren)
+        tour_ids = conn.execute(select(Mehrfachtransport.id).order_by(Mehrfachtransport.id)).scalars().all()
+        for route in routen:
+            route["mehrfachtransport_id"] = tour_ids[route["mehrfachtransport_id"]]
+        _einfuegen(conn, MehrfachtransportRoute.__table__, standort_ids_einsetzen(routen, ids))
+        _einfuegen(conn, Logbuch.__table__, logbuch)
+        _einfuegen(conn, Zeitfenster.__table__, zeitfenster)
+    return {
+        "standorte": args.standorte,
+        "strecken": len(strecken),
+        "transporte": len(transporte),
+        "mehrfachtransporte": len(touren),
+        "logbuch": len(logbuch),
+        "zeitfenster": len(zeitfenster),
+        "befuellen_s": round(time.perf_counter() - start, 2),
+    }, strecken
+
+
+# -------------------- LAST --------------------
+def server_starten(env):
+    start = time.perf_counter()
+    prozess = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(PORT), "--log-level", "warning"],
+        cwd=VERZEICHNIS, env=env,
+    )
+    # Beim ersten Start wird das Wegenetz (Floyd-Warshall) berechnet, das kann dauern
+    for _ in range(3000):
+        try:
+            httpx.get(BASIS_URL + "/", timeout=1)
+            return prozess, round(time.perf_counter() - start, 2)
+        except httpx.HTTPError:
+            if prozess.poll() is not None:
+                break
+            time.sleep(0.1)
+    prozess.terminate()
+    raise RuntimeError("API-Server ist nicht gestartet")
+
+async def last_erzeugen(client, anfragen, parallel, anfrage_bauen, aufwaermen):
+    semaphore = asyncio.Semaphore(parallel)
+    latenzen = []
+    status = {}
+
+    async def eine(anfrage, messen=True):
+        methode, pfad, body = anfrage
+        async with semaphore:
+            start = time.perf_counter()
+            antwort = await client.request(methode, pfad, json=body)
+            dauer_ms = (time.perf_counter() - start) * 1000
+        if messen:
+            latenzen.append(dauer_ms)
+            status[antwort.status_code] = status.get(antwort.status_code, 0) + 1
+
+    # Anfragen vorab bauen, damit der Zufall nicht von der Reihenfolge der Antworten abhängt
+    vorab = [anfrage_bauen() for _ in range(aufwaermen)]
+    gemessen = [anfrage_bauen() for _ in range(anfragen)]
+    await asyncio.gather(*(eine(a, messen=False) for a in vorab))
+    start = time.perf_counter()
+    await asyncio.gather(*(eine(a) for a in gemessen))
+    dauer = time.perf_counter() - start
+    ok = sum(n for code, n in status.items() if code < 400)
+    return {
+        "anfragen": anfragen,
+        "ok": ok,
+        # 409 = Slot voll / Konflikt, fachlich erwartet und getrennt von echten Fehlern gezählt
+        "abgelehnt_409": status.get(409, 0),
+        "fehler": anfragen - ok - status.get(409, 0),
+        "req_pro_s": round(anfragen / dauer, 1),
+        "mittel_ms": round(sum(latenzen) / len(latenzen), 2),
+        "p50_ms": round(perzentil(latenzen, 50), 2),
+        "p95_ms": round(perzentil(latenzen, 95), 2),
+        "p99_ms": round(perzentil(latenzen, 99), 2),
+        "max_ms": round(max(latenzen), 2),
+    }
+
+def szenarien(rng, strecken, daten):
+    """Name -> Funktion, die die nächste Anfrage (methode, pfad, body) baut"""
+    paare = list(strecken)
+    nachbarn = {}
+    for von, nach in paare:
+        nachbarn.setdefault(von, []).append(nach)
+    typen = list(FAHRZEUGTYPEN)
+
+    def tag():
+        return str(JAHR_START + timedelta(days=rng.randrange(TAGE)))
+
+    def transport():
+        von, nach = rng.choice(paare)
+        datum, zeit = tag(), startzeit(rng)
+        return "POST", "/transporte", {
+            "von": von, "nach": nach, "fahrzeugtyp": rng.choice(typen), "datum": datum,
+            "startzeit": zeit, "zeitfenster": f"{datum}T{zeit}:00",
+        }
+
+    def tour():
+        von, nach = rng.choice(paare)
+        weiter = rng.choice(nachbarn.get(nach) or [von])
+        return "POST", "/mehrfachtransporte", {
+            "name": "Benchmark-Tour", "fahrzeugtyp": rng.choice(typen), "datum": tag(), "startzeit": startzeit(rng),
+            "routen": [{"von": von, "nach": nach, "reihenfolge": 1}, {"von": nach, "nach": weiter, "reihenfolge": 2}],
+        }
+
+    def seite(pfad, anzahl, limit=100):
+        return "GET", f"{pfad}?limit={limit}&after_id={rng.randrange(max(anzahl - limit, 1))}", None
+
+    return {
+        "POST /transporte": transport,
+        "POST /mehrfachtransporte": tour,
+        "GET /verfuegbare-zeiten": lambda: ("GET", f"/verfuegbare-zeiten/{rng.choice(typen)}/{tag()}", None),
+        "GET /transporte?datum": lambda: ("GET", f"/transporte?datum={tag()}&limit=1000", None),
+        "GET /transporte": lambda: seite("/transporte", daten["transporte"]),
+        "GET /transporte/export": lambda: ("GET", f"/transporte/export?datum={tag()}&format=csv", None),
+        "GET /mehrfachtransporte": lambda: seite("/mehrfachtransporte", daten["mehrfachtransporte"]),
+        "GET /logbuch": lambda: seite("/logbuch", daten["logbuch"]),
+        "GET /distanzmatrix": lambda: seite("/distanzmatrix", daten["strecken"], limit=1000),
+        "GET /fahrzeugtypen": lambda: ("GET", "/fahrzeugtypen", None),
+    }
+
+async def endpunkte_messen(env, rng, strecken, daten, args):
+    prozess, start_s = server_starten(env)
+    try:
+        ergebnis = {"serverstart_s": start_s}
+        async with httpx.AsyncClient(base_url=BASIS_URL, timeout=60) as client:
+            for name, anfrage_bauen in szenarien(rng, strecken, daten).items():
+                ergebnis[name] = await last_erzeugen(client, args.anfragen, args.parallel, anfrage_bauen,
+                                                     aufwaermen=min(20, args.anfragen))
+        return ergebnis
+    finally:
+        prozess.terminate()
+        prozess.wait()
+
+
+# -------------------- IMPORT --------------------
+def import_messen(rng, arbeitsverzeichnis, anzahl):
+    """Excel-Matrix anzahl x anzahl (Meter, ~20 % leer) erzeugen und zweimal importieren: neu und Upsert"""
+    import pandas as pd
+    import import_distanzmatrix
+
+    orte = [f"Import {i:04d}" for i in range(anzahl)]
+    werte = [[None if i == j or rng.random() < 0.2 else rng.randrange(100, 5000) for j in range(anzahl)]
+             for i in range(anzahl)]
+    datei = os.path.join(arbeitsverzeichnis, "benchmark_matrix.xlsx")
+    pd.DataFrame(werte, index=orte, columns=orte).to_excel(datei)
+
+    ergebnis = {"standorte": anzahl, "zellen": anzahl * anzahl}
+    for lauf in ("neu_s", "upsert_s"):
+        ausgabe = io.StringIO()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(ausgabe):
+            import_distanzmatrix.import_excel_matrix_to_distanzmatrix(datei)
+        ergebnis[lauf] = round(time.perf_counter() - start, 2)
+        if "Import abgeschlossen" not in ausgabe.getvalue():
+            raise RuntimeError(f"Excel-Import fehlgeschlagen: {ausgabe.getvalue().strip()}")
+    return ergebnis
+
+
+# -------------------- TAGESPLANUNG --------------------
+def planung_messen(engine, rng, strecken, anzahl, zeitbudget_ms):
+    """Einen Tag hinter dem Benchmark-Jahr mit anzahl offenen LKW-Transporten planen (im Prozess)"""
+    from database import SessionLocal
+    from models import Transport
+    import tagesplanung
+
+    datum = JAHR_START + timedelta(days=TAGE)
+    paare = list(strecken)
+    transporte = []
+    for _ in range(anzahl):
+        von, nach = rng.choice(paare)
+        zeit = startzeit(rng)
+        beginn = datetime.combine(datum, datetime.strptime(zeit, "%H:%M").time())
+        transporte.append({"von": von, "nach": nach, "fahrzeugtyp": "LKW", "datum": datum, "startzeit": zeit,
+                           "weg_min": strecken[(von, nach)], "status": "offen", "version": 1,
+                           "zeitfenster": beginn + timedelta(minutes=rng.randrange(90, 300))})
+    with engine.begin() as conn:
+        ids = standorte_anlegen(conn, [ort for paar in paare for ort in paar])
+        _einfuegen(conn, Transport.__table__, standort_ids_einsetzen(transporte, ids))
+    with SessionLocal() as db:
+        plan = tagesplanung.tagesplan(db, datum, "LKW", zeitbudget_ms=zeitbudget_ms)
+    return {key: plan[key] for key in ("auftraege", "eingeplant", "fahrzeuge_genutzt", "leerfahrt_min",
+                                        "iterationen", "laufzeit_ms")}
+
+
+# -------------------- VERGLEICH --------------------
+def vergleichen(alt, neu, toleranz):
+    """Verschlechterungen gegenüber einem früheren Lauf (Durchsatz, p95, Importdauer)"""
+    regressionen = []
+    for name, werte in neu["endpunkte"].items():
+        vorher = alt.get("endpunkte", {}).get(name)
+        if not isinstance(werte, dict) or not isinstance(vorher, dict):
+            continue
+        if werte["req_pro_s"] < vorher["req_pro_s"] * (1 - toleranz):
+            regressionen.append(f"{name}: Durchsatz {vorher['req_pro_s']} -> {werte['req_pro_s']} req/s")
+        if werte["p95_ms"] > vorher["p95_ms"] * (1 + toleranz):
+            regressionen.append(f"{name}: p95 {vorher['p95_ms']} -> {werte['p95_ms']} ms")
+    for lauf in ("neu_s", "upsert_s"):
+        vorher = alt.get("excel_import", {}).get(lauf)
+        jetzt = neu.get("excel_import", {}).get(lauf)
+        if vorher and jetzt and jetzt > vorher * (1 + toleranz):
+            regressionen.append(f"Excel-Import {lauf}: {vorher} -> {jetzt} s")
+    return regressionen
+
+def git_stand():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=VERZEICHNIS, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark-Suite für die Buchungs-API")
+    parser.add_argument("--db", help="Datenbank-URL, Standard: frische SQLite-Datei im Temp-Verzeichnis")
+    parser.add_argument("--standorte", type=int, default=1000)
+    parser.add_argument("--transporte-pro-tag", type=int, default=200)
+    parser.add_argument("--logbuch-pro-tag", type=int, default=300)
+    parser.add_argument("--anfragen", type=int, default=500, help="gemessene Anfragen je Endpunkt")
+    parser.add_argument("--parallel", type=int, default=20)
+    parser.add_argument("--import-standorte", type=int, default=200, help="Excel-Matrix n x n, 0 = ohne Import")
+    parser.add_argument("--planung-auftraege", type=int, default=300, help="offene Transporte für die Tagesplanung, 0 = ohne")
+    parser.add_argument("--planung-budget-ms", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--ausgabe", help="Ergebnis zusätzlich als JSON-Datei schreiben")
+    parser.add_argument("--vergleich", help="früheres Ergebnis; Exit-Code 1 bei Verschlechterung")
+    parser.add_argument("--toleranz", type=float, default=0.2, help="erlaubte Verschlechterung (0.2 = 20 %%)")
+    args = parser.parse_args()
+
+    arbeitsverzeichnis = tempfile.mkdtemp(prefix="logistik-benchmark-")
+    url = args.db or f"sqlite:///{os.path.join(arbeitsverzeichnis, 'benchmark.db')}"
+    # Vor dem Import von database.py setzen: Engine und Wegenetz-Datei werden beim Import festgelegt
+    os.environ["DATABASE_URL"] = url
+    os.environ["WEGENETZ_DATEI"] = os.path.join(arbeitsverzeichnis, "wegenetz.npz")
+    sys.path.insert(0, VERZEICHNIS)
+    from database import engine
+
+    rng = random.Random(args.seed)
+    daten, strecken = datenbank_befuellen(engine, rng, args)
+    env = dict(os.environ, ARCHIV_INTERVALL_MIN="0")
+    ergebnis = {
+        "zeitpunkt": datetime.now().isoformat(timespec="seconds"),
+        "git": git_stand(),
+        "python": platform.python_version(),
+        "datenbank": engine.dialect.name,
+        "db_async": env.get("DB_ASYNC", "0") == "1",
+        "parameter": {"anfragen": args.anfragen, "parallel": args.parallel, "seed": args.seed},
+        "daten": daten,
+        "endpunkte": asyncio.run(endpunkte_messen(env, rng, strecken, daten, args)),
+    }
+    if args.import_standorte > 0:
+        ergebnis["excel_import"] = import_messen(rng, arbeitsverzeichnis, args.import_standorte)
+    if args.planung_auftraege > 0:
+        ergebnis["tagesplanung"] = planung_messen(engine, rng, strecken, args.planung_auftraege, args.planung_budget_ms)
+
+    regressionen = []
+    if args.vergleich:
+        with open(args.vergleich, encoding="utf-8") as f:
+            regressionen = vergleichen(json.load(f), ergebnis, args.toleranz)
+        ergebnis["regressionen"] = regressionen
+
+    text = json.dumps(ergebnis, indent=2, ensure_ascii=False)
+    print(text)
+    if args.ausgabe:
+        with open(args.ausgabe, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    sys.exit(1 if regressionen else 0)
+
+if __name__ == "__main__":
+    main()
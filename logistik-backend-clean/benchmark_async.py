@@ -0,0 +1,116 @@
+"""
+Lastbenchmark sync vs. async (DB_ASYNC)
+
+Startet die API zweimal per uvicorn (DB_ASYNC=0 und DB_ASYNC=1) gegen die in
+database.py konfigurierte Datenbank und misst Durchsatz und Latenzen für
+POST /transporte und GET /verfuegbare-zeiten.
+Achtung: legt Testdaten an (Fahrzeugtyp "Benchmark", Transporte am 01.01.2030),
+also nur gegen eine Test- oder lokale Datenbank laufen lassen.
+
+Aufruf: python benchmark_async.py [anfragen] [parallel]
+Benötigt: uvicorn, httpx (und asyncpg/aiosqlite für den async-Modus)
+"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import httpx
+
+PORT = 8765
+BASIS_URL = f"http://127.0.0.1:{PORT}"
+FAHRZEUGTYP = "Benchmark"
+DATUM = "2030-01-01"
+
+
+def perzentil(werte, p):
+    werte = sorted(werte)
+    if not werte:
+        return None
+    index = min(int(round(p / 100 * (len(werte) - 1))), len(werte) - 1)
+    return werte[index]
+
+def server_starten(async_modus):
+    env = dict(os.environ, DB_ASYNC="1" if async_modus else "0", SCHEMA_MIGRIEREN="1")
+    prozess = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(PORT), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+    )
+    for _ in range(100):
+        try:
+            httpx.get(BASIS_URL + "/", timeout=1)
+            return prozess
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    prozess.terminate()
+    raise RuntimeError("API-Server ist nicht gestartet")
+
+async def last_erzeugen(client, anfragen, parallel, anfrage_bauen):
+    semaphore = asyncio.Semaphore(parallel)
+    latenzen = []
+    fehler = 0
+
+    async def eine(i):
+        nonlocal fehler
+        methode, pfad, body = anfrage_bauen(i)
+        async with semaphore:
+            start = time.perf_counter()
+            antwort = await client.request(methode, pfad, json=body)
+            latenzen.append((time.perf_counter() - start) * 1000)
+            if antwort.status_code >= 400:
+                fehler += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(eine(i) for i in range(anfragen)))
+    dauer = time.perf_counter() - start
+    return {
+        "anfragen": anfragen,
+        "fehler": fehler,
+        "req_pro_s": round(anfragen / dauer, 1),
+        "p50_ms": round(perzentil(latenzen, 50), 2),
+        "p99_ms": round(perzentil(latenzen, 99), 2),
+    }
+
+def transport_anfrage(i):
+    startzeit = f"{(i // 2) % 24:02d}:{'00' if i % 2 == 0 else '30'}"
+    return "POST", "/transporte", {
+        "von": "Bau 01-01", "nach": "Bau 02-01", "fahrzeugtyp": FAHRZEUGTYP,
+        "datum": DATUM, "startzeit": startzeit, "zeitfenster": f"{DATUM}T12:00:00",
+    }
+
+def verfuegbarkeit_anfrage(i):
+    return "GET", f"/verfuegbare-zeiten/{FAHRZEUGTYP}/{DATUM}", None
+
+async def modus_messen(async_modus, anfragen, parallel):
+    prozess = server_starten(async_modus)
+    try:
+        async with httpx.AsyncClient(base_url=BASIS_URL, timeout=30) as client:
+            # Doppelter Name wäre ein 500 und schließt die Verbindung, bei wiederverwendeter DB nur einmal anlegen
+            typen = (await client.get("/fahrzeugtypen", params={"limit": 1000})).json()
+            if FAHRZEUGTYP not in {t["name"] for t in typen}:
+                await client.post("/fahrzeugtypen", json={"name": FAHRZEUGTYP, "anzahl_verfuegbar": 1000})
+            # Buchungen legen keine Standorte an; 409, wenn es sie schon gibt
+            for name in ("Bau 01-01", "Bau 02-01"):
+                await client.post("/standorte", json={"name": name})
+            return {
+                "POST /transporte": await last_erzeugen(client, anfragen, parallel, transport_anfrage),
+                "GET /verfuegbare-zeiten": await last_erzeugen(client, anfragen, parallel, verfuegbarkeit_anfrage),
+            }
+    finally:
+        prozess.terminate()
+        prozess.wait()
+
+def main():
+    anfragen = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    parallel = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    ergebnis = {
+        "anfragen": anfragen,
+        "parallel": parallel,
+        "sync": asyncio.run(modus_messen(False, anfragen, parallel)),
+        "async": asyncio.run(modus_messen(True, anfragen, parallel)),
+    }
+    print(json.dumps(ergebnis, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Kaltstart der API messen
+
+Startet die API mehrmals frisch per uvicorn gegen eine vorbereitete Datenbank (Standorte
+und Strecken in der distanzmatrix) und misst die Zeit vom Prozessstart bis zur ersten
+Antwort auf GET /, dazu die reine Importzeit von main.py in einem eigenen Prozess und die
+einzelnen Startschritte aus GET /system/start.
+
+Der erste Start baut das Wegenetz (WEGENETZ_DATEI im Temp-Verzeichnis), alle weiteren
+laden es, wie beim Hochskalieren im Schichtwechsel. Gemessen wird der Standardstart und
+zum Vergleich der Start mit SCHEMA_MIGRIEREN=1.
+
+Mit --max-ms endet das Skript mit Exit-Code 1, wenn der Median des Standardstarts
+darüber liegt (für die CI neben benchmark_api.py --vergleich).
+
+Aufruf: python benchmark_kaltstart.py [--laeufe 5] [--standorte 500] [--db URL]
+        [--max-ms 3000] [--ausgabe kaltstart.json]
+Benötigt: uvicorn, httpx
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+
+PORT = 8768
+BASIS_URL = f"http://127.0.0.1:{PORT}"
+VERZEICHNIS = os.path.dirname(os.path.abspath(__file__))
+IMPORT_MESSEN = "import time; t = time.perf_counter(); import main; print((time.perf_counter() - t) * 1000)"
+
+
+def befuellen(anzahl_standorte, seed):
+    from benchmark_api import strecken_erzeugen, standorte_anlegen
+    from database import engine
+    from migrationen import migrieren
+    from models import Distanz, Fahrzeugtyp
+
+    migrieren(engine)
+    strecken = strecken_erzeugen(random.Random(seed), anzahl_standorte)
+    with engine.begin() as conn:
+        ids = standorte_anlegen(conn, [ort for paar in strecken for ort in paar])
+        conn.execute(Distanz.__table__.delete())
+        conn.execute(Distanz.__table__.insert(), [{"von_id": ids[von], "nach_id": ids[nach], "weg_min": weg}
+                                                  for (von, nach), weg in strecken.items()])
+        if not conn.execute(Fahrzeugtyp.__table__.select().limit(1)).first():
+            conn.execute(Fahrzeugtyp.__table__.insert(), [{"name": "LKW", "anzahl_verfuegbar": 10}])
+    engine.dispose()
+    return len(strecken)
+
+def import_messen(env):
+    ausgabe = subprocess.run([sys.executable, "-c", IMPORT_MESSEN], cwd=VERZEICHNIS, env=env,
+                             capture_output=True, text=True, check=True).stdout
+    return round(float(ausgabe.strip().splitlines()[-1]), 1)
+
+def start_messen(env):
+    """Prozessstart bis zur ersten Antwort in ms, dazu die Startschritte der App"""
+    # Ein Client für alle Versuche: httpx.get() baut jedes Mal einen neuen SSL-Kontext
+    client = httpx.Client(base_url=BASIS_URL, timeout=1)
+    start = time.perf_counter()
+    prozess = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(PORT), "--log-level", "warning"],
+        cwd=VERZEICHNIS, env=env,
+    )
+    try:
+        while True:
+            try:
+                if client.get("/").status_code == 200:
+                    break
+            except httpx.HTTPError:
+                if prozess.poll() is not None:
+                    raise RuntimeError("API-Server ist beim Start abgebrochen")
+                if time.perf_counter() - start > 300:
+                    raise RuntimeError("API-Server ist nicht gestartet")
+                time.sleep(0.01)
+        bereit_ms = round((time.perf_counter() - start) * 1000, 1)
+        antwort = client.get("/system/start")
+        schritte = antwort.json() if antwort.status_code == 200 else {}
+    finally:
+        client.close()
+        prozess.terminate()
+        prozess.wait(timeout=30)
+    return bereit_ms, schritte
+
+def variante_messen(env, laeufe):
+    starts = [start_messen(env) for _ in range(laeufe)]
+    imports = [import_messen(env) for _ in range(laeufe)]
+    zeiten = [bereit for bereit, _ in starts]
+    return {
+        "bereit_ms_median": statistics.median(zeiten),
+        "bereit_ms_min": min(zeiten),
+        "bereit_ms_max": max(zeiten),
+        "import_ms_median": statistics.median(imports),
+        "schritte_letzter_start": starts[-1][1],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--laeufe", type=int, default=5)
+    parser.add_argument("--standorte", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--db", help="Datenbank-URL, Standard: frische SQLite-Datei im Temp-Verzeichnis")
+    parser.add_argument("--max-ms", type=float, help="Obergrenze für den Median des Standardstarts")
+    parser.add_argument("--ausgabe")
+    args = parser.parse_args()
+
+    verzeichnis = tempfile.mkdtemp(prefix="logistik-kaltstart-")
+    os.environ["DATABASE_URL"] = args.db or f"sqlite:///{os.path.join(verzeichnis, 'kaltstart.db')}"
+    os.environ["WEGENETZ_DATEI"] = os.path.join(verzeichnis, "wegenetz.npz")
+    os.environ["ARCHIV_INTERVALL_MIN"] = "0"
+    sys.path.insert(0, VERZEICHNIS)
+    strecken = befuellen(args.standorte, args.seed)
+
+    env = dict(os.environ)
+    erster_start, _ = start_messen(env)
+    ergebnis = {
+        "datenbank": os.environ["DATABASE_URL"].split(":")[0],
+        "standorte": args.standorte,
+        "strecken": strecken,
+        "laeufe": args.laeufe,
+        "erster_start_ms": erster_start,
+        "standard": variante_messen(env, args.laeufe),
+        "mit_migration": variante_messen(dict(env, SCHEMA_MIGRIEREN="1"), args.laeufe),
+    }
+    text = json.dumps(ergebnis, indent=2, ensure_ascii=False)
+    if args.ausgabe:
+        with open(args.ausgabe, "w", encoding="utf-8") as datei:
+            datei.write(text)
+    print(text)
+    if args.max_ms is not None and ergebnis["standard"]["bereit_ms_median"] > args.max_ms:
+        print(f"Kaltstart {ergebnis['standard']['bereit_ms_median']} ms über der Grenze von {args.max_ms} ms",
+              file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark der Listen-Serialisierung: ORM + Pydantic vs. Core-Zeilen + orjson
+
+Misst im Prozess (ohne HTTP) für eine große Transportliste:
+  - orm_pydantic: bisheriger Pfad der Listen-Endpunkte (ORM-Objekte, Validierung je Zeile
+    durch TransportOut, jsonable_encoder + json.dumps wie in FastAPI)
+  - core_orjson: schneller Pfad aus schnelle_listen.py
+  - export_ndjson / export_csv: gestreamter Export mit yield_per
+jeweils Laufzeit, Zeilen pro Sekunde und Spitzen-Speicher (tracemalloc, eigener Lauf).
+
+Standard ist eine frische SQLite-Datei im Temp-Verzeichnis; mit --db gegen eine leere
+Test-Datenbank. Ergebnis als JSON.
+
+Aufruf: python benchmark_serialisierung.py [--zeilen 100000] [--db URL]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+
+def messen(funktion):
+    """Laufzeit und Spitzen-Speicher in getrennten Läufen, tracemalloc bremst stark"""
+    start = time.perf_counter()
+    ergebnis = funktion()
+    dauer = time.perf_counter() - start
+    tracemalloc.start()
+    funktion()
+    _, spitze = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return ergebnis, dauer, spitze
+
+def befuellen(engine, anzahl):
+    from benchmark_api import standorte_anlegen, standort_ids_einsetzen
+    from migrationen import migrieren
+    from models import Transport
+
+    migrieren(engine)
+    zeilen = [{
+        "von": f"Bau {i % 97:02d}-01", "nach": f"Bau {i % 89:02d}-02", "fahrzeugtyp": "LKW",
+        "datum": date(2031, 1, 1) + timedelta(days=i % 365), "startzeit": f"{6 + i % 12:02d}:00",
+        "weg_min": 12.5, "zeitfenster": datetime(2031, 1, 1, 8, 0) + timedelta(days=i % 365),
+        "status": "offen", "begruendung": "Benchmark" if i % 3 else None, "fahrer_id": i % 50 or None,
+        "version": 1,
+    } for i in range(anzahl)]
+    with engine.begin() as conn:
+        ids = standorte_anlegen(conn, [ort for zeile in zeilen for ort in (zeile["von"], zeile["nach"])])
+        standort_ids_einsetzen(zeilen, ids)
+        for i in range(0, len(zeilen), 10000):
+            conn.execute(Transport.__table__.insert(), zeilen[i:i + 10000])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--zeilen", type=int, default=100000)
+    parser.add_argument("--db", help="Datenbank-URL, Standard: frische SQLite-Datei im Temp-Verzeichnis")
+    args = parser.parse_args()
+
+    verzeichnis = tempfile.mkdtemp(prefix="logistik-serialisierung-")
+    os.environ["DATABASE_URL"] = args.db or f"sqlite:///{os.path.join(verzeichnis, 'benchmark.db')}"
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from fastapi.encoders import jsonable_encoder
+    from database import engine, SessionLocal
+    from models import Transport
+    import schemas
+    import schnelle_listen
+
+    befuellen(engine, args.zeilen)
+    validieren = getattr(schemas.TransportOut, "model_validate", None)
+
+    def orm_pydantic():
+        with SessionLocal() as db:
+            objekte = db.query(Transport).order_by(Transport.id).all()
+            if validieren is not None:
+                modelle = [validieren(t, from_attributes=True) for t in objekte]
+            else:
+                modelle = [schemas.TransportOut.from_orm(t) for t in objekte]
+            return len(json.dumps(jsonable_encoder(modelle), ensure_ascii=False).encode())
+
+    def core_orjson():
+        with SessionLocal() as db:
+            stmt = schnelle_listen.abfrage(Transport, schemas.TransportOut, []).order_by(Transport.id)
+            return len(schnelle_listen.json_bytes(schnelle_listen.zeilen_als_dicts(db.execute(stmt).all())))
+
+    def export(format):
+        stmt = schnelle_listen.abfrage(Transport, schemas.TransportOut, []).order_by(Transport.id)
+        return lambda: sum(len(block) for block in schnelle_listen.export_zeilen(stmt, format))
+
+    ergebnis = {"zeilen": args.zeilen, "datenbank": engine.dialect.name,
+                "orjson": schnelle_listen.orjson is not None}
+    for name, funktion in (("orm_pydantic", orm_pydantic), ("core_orjson", core_orjson),
+                           ("export_ndjson", export("ndjson")), ("export_csv", export("csv"))):
+        groesse, dauer, spitze = messen(funktion)
+        ergebnis[name] = {
+            "dauer_s": round(dauer, 3),
+            "zeilen_pro_s": round(args.zeilen / dauer),
+            "bytes": groesse,
+            "spitze_mb": round(spitze / 2**20, 1),
+        }
+    ergebnis["beschleunigung"] = round(ergebnis["orm_pydantic"]["dauer_s"] / ergebnis["core_orjson"]["dauer_s"], 1)
+    print(json.dumps(ergebnis, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""
+Änderungsstände der Prozess-Caches für mehrere Worker
+
+Distanz-Cache und Standort-Verzeichnis liegen in jedem Worker im Speicher. Wer die
+Daten dahinter ändert, erhöht in derselben Transaktion den Stand in cache_staende; jeder
+Worker vergleicht ihn in sicherstellen() mit dem Stand, den er geladen hat, und lädt
+bei einem neueren nach. Stände werden nur erhöht, nie zurückgesetzt.
+"""
+from sqlalchemy import text
+
+DISTANZEN = "distanzmatrix"
+STANDORTE = "standorte"
+
+_LESEN = text("SELECT stand FROM cache_staende WHERE name = :name")
+_ERHOEHEN = text("UPDATE cache_staende SET stand = stand + 1 WHERE name = :name RETURNING stand")
+_ANLEGEN = text("INSERT INTO cache_staende (name, stand) VALUES (:name, 1)")
+
+
+def lesen(verbindung, name):
+    """Aktueller Stand über eine Session oder Connection, 0 wenn noch nie geändert"""
+    return verbindung.execute(_LESEN, {"name": name}).scalar() or 0
+
+def erhoehen(verbindung, name):
+    """Vor dem Commit der Änderung aufrufen; liefert den neuen Stand (Zeile bleibt bis zum Commit gesperrt)"""
+    stand = verbindung.execute(_ERHOEHEN, {"name": name}).scalar()
+    if stand is None:
+        # Zeile fehlt (Migration 9 legt sie an), dann eben jetzt
+        verbindung.execute(_ANLEGEN, {"name": name})
+        stand = 1
+    return stand
@@ -0,0 +1,208 @@
+"""
+Fahrer-Disposition: Schichten und gebuchte Fahrten je Fahrer
+
+Pro Fahrer werden Schichten und Fahrten (Transporte: Startzeit + weg_min,
+Mehrfachtransporte: Startzeit + gesamt_weg_min) nach Beginn sortiert gehalten.
+Passende Schicht und Überschneidungen findet bisect in O(log n) je Fahrer, deshalb
+kann jede Speicherung geprüft werden. Die Pause einer Schicht ist nicht verplant,
+sie muss nur in der Schicht neben den Fahrten noch Platz haben.
+"""
+from bisect import bisect_left, bisect_right
+from datetime import datetime, time, timedelta
+from fastapi import HTTPException, Response
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from models import Transport, Mehrfachtransport, Schicht
+from verfuegbarkeit import zeit_zu_minuten, MINDEST_DAUER_MIN
+
+
+def fahrt_intervall(datum, startzeit, dauer_min):
+    """(start, ende) als datetime; Fahrten ohne bekannte Dauer belegen MINDEST_DAUER_MIN"""
+    minuten = zeit_zu_minuten(startzeit)
+    if not 0 <= minuten < 24 * 60:
+        raise ValueError(f"Startzeit außerhalb des Tages: {startzeit}")
+    start = datetime.combine(datum, time()) + timedelta(minutes=minuten)
+    dauer = dauer_min if dauer_min and dauer_min > 0 else MINDEST_DAUER_MIN
+    return start, start + timedelta(minutes=dauer)
+
+def konflikt(art, meldung, id=None):
+    return {"art": art, "meldung": meldung, "id": id}
+
+def konflikte_behandeln(konflikte, modus, response: Response):
+    """
+    modus "ablehnen": 409 mit der Konfliktliste
+    modus "warnen": speichern, Konflikte als Kurzform im Header X-Dispositions-Konflikte,
+    z.B. 'ausserhalb_schicht,ueberschneidung:transport/17'
+    """
+    if not konflikte:
+        return
+    if modus == "ablehnen":
+        raise HTTPException(status_code=409, detail={"konflikte": konflikte})
+    response.headers["X-Dispositions-Konflikte"] = ",".join(
+        k["art"] if k["id"] is None else f"{k['art']}:{k['id']}" for k in konflikte
+    )
+
+
+class FahrerKalender:
+    """Schichten und Fahrten eines Fahrers, jeweils nach Beginn sortiert"""
+
+    def __init__(self):
+        self.schichten = []      # (von, bis, pause_min, schicht_id)
+        self._schicht_von = []
+        self._laengste_schicht = timedelta(0)
+        self.fahrten = []        # (start, ende, "transport/<id>" | "tour/<id>")
+        self._fahrt_start = []
+        self._laengste_fahrt = timedelta(0)
+
+    def schicht_hinzufuegen(self, von, bis, pause_min, schicht_id):
+        i = bisect_right(self._schicht_von, von)
+        self._schicht_von.insert(i, von)
+        self.schichten.insert(i, (von, bis, pause_min or 0, schicht_id))
+        self._laengste_schicht = max(self._laengste_schicht, bis - von)
+
+    def fahrt_hinzufuegen(self, start, ende, bezug):
+        i = bisect_right(self._fahrt_start, start)
+        self._fahrt_start.insert(i, start)
+        self.fahrten.insert(i, (start, ende, bezug))
+        self._laengste_fahrt = max(self._laengste_fahrt, ende - start)
+
+    def schicht_fuer(self, start, ende):
+        """Schicht, die die ganze Fahrt abdeckt (die zuletzt begonnene zuerst), sonst None"""
+        i = bisect_right(self._schicht_von, start) - 1
+        # Früher begonnene Schichten reichen höchstens bis von + längste Schichtdauer
+        grenze = ende - self._laengste_schicht
+        while i >= 0 and self._schicht_von[i] >= grenze:
+            schicht = self.schichten[i]
+            if schicht[1] >= ende:
+                return schicht
+            i -= 1
+        return None
+
+    def ueberschneidungen(self, start, ende):
+        """Fahrten, die sich mit [start, ende) überschneiden"""
+        treffer = []
+        i = bisect_left(self._fahrt_start, ende) - 1
+        # Nur Fahrten, die höchstens die längste Fahrtdauer vor 'start' begonnen haben, können reichen
+        grenze = start - self._laengste_fahrt
+        while i >= 0 and self._fahrt_start[i] >= grenze:
+            s, e, bezug = self.fahrten[i]
+            if e > start:
+                treffer.append(bezug)
+            i -= 1
+        return treffer[::-1]
+
+    def gebuchte_minuten(self, von, bis):
+        """Summe der Fahrtzeiten, die im Zeitraum [von, bis) beginnen"""
+        links = bisect_left(self._fahrt_start, von)
+        rechts = bisect_left(self._fahrt_start, bis)
+        return sum((e - s).total_seconds() / 60 for s, e, _ in self.fahrten[links:rechts])
+
+    def pruefen(self, start, ende):
+        """Liste der Konflikte für eine neue Fahrt (leer = Fahrer kann fahren)"""
+        konflikte = []
+        schicht = self.schicht_fuer(start, ende)
+        if schicht is None:
+            konflikte.append(konflikt("ausserhalb_schicht", "Fahrt liegt nicht vollständig in einer Schicht"))
+        else:
+            von, bis, pause_min, schicht_id = schicht
+            verfuegbar = (bis - von).total_seconds() / 60 - pause_min
+            benoetigt = self.gebuchte_minuten(von, bis) + (ende - start).total_seconds() / 60
+            if benoetigt > verfuegbar:
+                konflikte.append(konflikt(
+                    "pause", f"Schicht {schicht_id} ist mit {benoetigt:.0f} von {verfuegbar:.0f} Minuten überbucht",
+                    f"schicht/{schicht_id}",
+                ))
+        for bezug in self.ueberschneidungen(start, ende):
+            konflikte.append(konflikt("ueberschneidung", f"Überschneidung mit {bezug}", bezug))
+        return konflikte
+
+
+class Disposition:
+    """Kalender aller geladenen Fahrer"""
+
+    def __init__(self):
+        self.kalender = {}
+
+    def fahrer(self, fahrer_id):
+        if fahrer_id not in self.kalender:
+            self.kalender[fahrer_id] = FahrerKalender()
+        return self.kalender[fahrer_id]
+
+    def pruefen(self, fahrer_id, start, ende):
+        return self.fahrer(fahrer_id).pruefen(start, ende)
+
+    def buchen(self, fahrer_id, start, ende, bezug):
+        self.fahrer(fahrer_id).fahrt_hinzufuegen(start, ende, bezug)
+
+    def vorschlaege(self, start, ende):
+        """
+        Alle konfliktfreien Fahrer, am wenigsten ausgelastete zuerst
+        [{"fahrer_id", "schicht_id", "gebuchte_min"}]
+        """
+        ergebnis = []
+        for fahrer_id, kalender in self.kalender.items():
+            if kalender.pruefen(start, ende):
+                continue
+            von, bis, _, schicht_id = kalender.schicht_fuer(start, ende)
+            ergebnis.append({
+                "fahrer_id": fahrer_id,
+                "schicht_id": schicht_id,
+                "gebuchte_min": kalender.gebuchte_minuten(von, bis),
+            })
+        ergebnis.sort(key=lambda v: (v["gebuchte_min"], v["fahrer_id"]))
+        return ergebnis
+
+
+def disposition_laden(db: Session, datum, fahrer_id=None, ohne_transport_id=None, ohne_tour_id=None):
+    """
+    Schichten und Fahrten rund um 'datum' laden (Vortag/Folgetag wegen Fahrten und
+    Schichten über Mitternacht); ohne fahrer_id für alle Fahrer
+    ohne_transport_id / ohne_tour_id: die gerade bearbeitete Fahrt nicht mitzählen
+    """
+    tag_start = datetime.combine(datum, time())
+    schichten = select(Schicht.id, Schicht.fahrer_id, Schicht.von, Schicht.bis, Schicht.pause_min).where(
+        Schicht.von < tag_start + timedelta(days=2),
+        Schicht.bis > tag_start - timedelta(days=1),
+    )
+    transporte = select(Transport.id, Transport.fahrer_id, Transport.datum, Transport.startzeit, Transport.weg_min).where(
+        Transport.fahrer_id.isnot(None),
+        Transport.datum >= datum - timedelta(days=1),
+        Transport.datum <= datum + timedelta(days=1),
+        # Touren-Transporte sind über den Mehrfachtransport bereits belegt
+        Transport.mehrfachtransport_id.is_(None),
+    )
+    touren = select(Mehrfachtransport.id, Mehrfachtransport.fahrer_id, Mehrfachtransport.datum,
+                    Mehrfachtransport.startzeit, Mehrfachtransport.gesamt_weg_min).where(
+        Mehrfachtransport.fahrer_id.isnot(None),
+        Mehrfachtransport.datum >= datum - timedelta(days=1),
+        Mehrfachtransport.datum <= datum + timedelta(days=1),
+    )
+    if fahrer_id is not None:
+        schichten = schichten.where(Schicht.fahrer_id == fahrer_id)
+        transporte = transporte.where(Transport.fahrer_id == fahrer_id)
+        touren = touren.where(Mehrfachtransport.fahrer_id == fahrer_id)
+    if ohne_transport_id is not None:
+        transporte = transporte.where(Transport.id != ohne_transport_id)
+    if ohne_tour_id is not None:
+        touren = touren.where(Mehrfachtransport.id != ohne_tour_id)
+
+    disposition = Disposition()
+    for schicht_id, fid, von, bis, pause_min in db.execute(schichten):
+        if von is not None and bis is not None:
+            disposition.fahrer(fid).schicht_hinzufuegen(von, bis, pause_min, schicht_id)
+    for art, abfrage in (("transport", transporte), ("tour", touren)):
+        for id, fid, tag, startzeit, dauer_min in db.execute(abfrage):
+            try:
+                start, ende = fahrt_intervall(tag, startzeit, dauer_min)
+            except (AttributeError, TypeError, ValueError):
+                # Alte Datensätze ohne gültige Startzeit belegen nichts
+                continue
+            disposition.buchen(fid, start, ende, f"{art}/{id}")
+    return disposition
+
+def fahrer_konflikte(db: Session, fahrer_id, datum, startzeit, dauer_min,
+                     ohne_transport_id=None, ohne_tour_id=None):
+    """Konflikte einer einzelnen Fahrt für einen Fahrer; ValueError bei ungültiger Startzeit"""
+    start, ende = fahrt_intervall(datum, startzeit, dauer_min)
+    disposition = disposition_laden(db, datum, fahrer_id, ohne_transport_id, ohne_tour_id)
+    return disposition.pruefen(fahrer_id, start, ende)
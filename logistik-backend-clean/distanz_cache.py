@@ -0,0 +1,259 @@
+import logging
+import os
+import threading
+import numpy as np
+from sqlalchemy.orm import Session
+from models import Distanz
+import cache_stand
+from kuerzeste_wege import Wegenetz, fingerabdruck, floyd_warshall
+
+logger = logging.getLogger("logistik.distanzen")
+
+# Gespeicherte kürzeste Wege; leer = nicht speichern
+WEGENETZ_DATEI = os.getenv("WEGENETZ_DATEI", os.path.join(os.path.dirname(os.path.abspath(__file__)), "wegenetz.npz"))
+# Geänderte Wege spätestens nach so vielen Sekunden speichern (und beim Herunterfahren)
+WEGENETZ_SPEICHERN_S = float(os.getenv("WEGENETZ_SPEICHERN_S", "30"))
+
+
+class DistanzCache:
+    """
+    Prozessweiter Cache der Distanzmatrix
+    Schlüssel: (von_id, nach_id) -> weg_min, Abfrage in beide Richtungen
+    Namen löst der Aufrufer vorher über standorte.py auf
+    Dazu die kürzesten Fahrzeiten zwischen allen Standorten (auch über Zwischenstationen)
+    Wird beim Start geladen und von den /distanzmatrix-Endpunkten aktualisiert; Änderungen
+    anderer Worker oder des Imports erkennt sicherstellen() am Stand in cache_staende
+
+    Eine einzelne Änderung hält die Sperre nur für das O(n²)-Update. Wird eine Strecke
+    länger oder gelöscht, rechnet der Hintergrund-Thread die Wege außerhalb der Sperre
+    neu; weg_min und teilmatrix warten solange, eine Buchung speichert nie den alten
+    Umweg. Prüfsumme und .npz-Datei werden erst bei Bedarf bzw. alle
+    WEGENETZ_SPEICHERN_S Sekunden nachgezogen.
+    """
+
+    def __init__(self, speichern_s=WEGENETZ_SPEICHERN_S):
+        self.speichern_s = speichern_s
+        self._lock = threading.Lock()
+        self._rechen_lock = threading.Lock()
+        self._lade_lock = threading.Lock()
+        self._matrix = {}
+        self._netz = Wegenetz()
+        self._geladen = False
+        self._db_stand = None      # geladener Stand aus cache_staende
+        self._stand = 0            # zählt jede Änderung, neu gerechnet wird gegen einen Stand
+        self._veraltet = False     # wege fehlt noch eine längere/gelöschte Strecke
+        self._ungespeichert = False
+        self._pruefsumme = fingerabdruck({})
+        self._arbeit = threading.Event()
+        self._stopp = threading.Event()
+        self._thread = None
+
+    @property
+    def geladen(self):
+        return self._geladen
+
+    @property
+    def pruefsumme(self):
+        """Prüfsumme der direkten Einträge, nach Änderungen erst beim nächsten Zugriff berechnet"""
+        with self._lock:
+            if self._pruefsumme is not None:
+                return self._pruefsumme
+            stand, matrix = self._stand, dict(self._matrix)
+        pruefsumme = fingerabdruck(matrix)
+        with self._lock:
+            if self._stand == stand:
+                self._pruefsumme = pruefsumme
+        return pruefsumme
+
+    def laden(self, db: Session):
+        """Lädt die komplette Distanzmatrix mit einer einzigen Abfrage"""
+        # Stand vor den Daten lesen: eine Änderung dazwischen wird beim nächsten Mal nachgeladen
+        db_stand = cache_stand.lesen(db, cache_stand.DISTANZEN)
+        matrix = {}
+        for von, nach, weg_min in db.query(Distanz.von_id, Distanz.nach_id, Distanz.weg_min).filter(
+                Distanz.von_id.isnot(None), Distanz.nach_id.isnot(None)):
+            matrix[(von, nach)] = weg_min
+        netz = Wegenetz()
+        pruefsumme = fingerabdruck(matrix)
+        if not (WEGENETZ_DATEI and netz.laden(WEGENETZ_DATEI, pruefsumme)):
+            netz.aufbauen(matrix)
+            self._speichern(netz, pruefsumme)
+        with self._lock:
+            self._matrix = matrix
+            self._netz = netz
+            self._stand += 1
+            self._veraltet = False
+            self._ungespeichert = False
+            self._pruefsumme = pruefsumme
+            self._db_stand = db_stand
+            self._geladen = True
+
+    def aktuell(self, db_stand):
+        """True, wenn der Cache den Stand aus cache_staende schon enthält"""
+        return self._geladen and self._db_stand is not None and self._db_stand >= db_stand
+
+    def sicherstellen(self, db: Session):
+        """Lädt nach, falls noch leer oder die Distanzen inzwischen geändert wurden (auch von anderen Workern)"""
+        db_stand = cache_stand.lesen(db, cache_stand.DISTANZEN)
+        if self.aktuell(db_stand):
+            return
+        with self._lade_lock:
+            if not self.aktuell(db_stand):
+                self.laden(db)
+
+    def direkt_weg_min(self, von, nach):
+        """Direkter Eintrag von -> nach, sonst nach -> von, sonst None"""
+        matrix = self._matrix
+        weg = matrix.get((von, nach))
+        if weg is None:
+            weg = matrix.get((nach, von))
+        return float(weg) if weg is not None else None
+
+    def weg_min(self, von, nach):
+        """Kürzeste Fahrzeit von -> nach, None wenn einer der Orte nicht im Netz erreichbar ist"""
+        if von == nach:
+            return self.direkt_weg_min(von, nach)
+        return self._aktuelles_netz().weg_min(von, nach)
+
+    def teilmatrix(self, orte):
+        """Kürzeste Fahrzeiten zwischen den Standort-IDs als Array (np.inf = nicht erreichbar)"""
+        return self._aktuelles_netz().teilmatrix(orte)
+
+    def _aktuelles_netz(self):
+        """Netz ohne ausstehende Neuberechnung; läuft sie gerade, wird auf sie gewartet"""
+        while self._veraltet:
+            self.neu_rechnen()
+        return self._netz
+
+    # -------------------- ÄNDERUNGEN --------------------
+    # db_stand: von cache_stand.erhoehen() für diese Änderung, sonst lädt sicherstellen() komplett nach
+    def setzen(self, von, nach, weg_min, db_stand=None):
+        with self._lock:
+            self._matrix[(von, nach)] = weg_min
+            self._geaendert(von, nach, db_stand)
+        self._nachziehen()
+
+    def entfernen(self, von, nach, db_stand=None):
+        with self._lock:
+            self._matrix.pop((von, nach), None)
+            self._geaendert(von, nach, db_stand)
+        self._nachziehen()
+
+    def _geaendert(self, von, nach, db_stand):
+        """Unter self._lock: direkt-Matrix anpassen, Rest für später vormerken"""
+        # Nur der direkte Nachfolger des geladenen Stands, sonst fehlt eine fremde Änderung
+        if db_stand is not None and self._db_stand == db_stand - 1:
+            self._db_stand = db_stand
+        self._stand += 1
+        self._pruefsumme = None
+        self._ungespeichert = True
+        if self._netz.strecke_geaendert(self._matrix, von, nach):
+            self._veraltet = True
+
+    def _nachziehen(self):
+        if not self._veraltet:
+            return
+        if self._thread is not None:
+            self._arbeit.set()
+        else:
+            self.neu_rechnen()  # ohne Hintergrund-Thread (Skripte): direkt, aber außerhalb der Sperre
+
+    def neu_rechnen(self):
+        """Kürzeste Wege neu rechnen, falls eine Strecke länger oder gelöscht wurde"""
+        with self._rechen_lock:
+            while True:
+                with self._lock:
+                    if not self._veraltet:
+                        return
+                    netz, stand = self._netz, self._stand
+                    direkt = netz.direkt.copy()
+                wege = floyd_warshall(direkt)
+                with self._lock:
+                    # Inzwischen geändert: mit dem neuen Stand noch einmal
+                    if self._stand == stand and self._netz is netz:
+                        netz.wege = wege
+                        self._veraltet = False
+                        return
+
+    def leeren(self):
+        with self._lock:
+            self._matrix = {}
+            self._netz = Wegenetz()
+            self._stand += 1
+            self._veraltet = False
+            self._ungespeichert = False
+            self._pruefsumme = fingerabdruck({})
+            self._db_stand = None
+            self._geladen = False
+
+    def kompakt(self):
+        """(Standort-IDs, kürzeste Fahrzeiten als float32-Matrix mit NaN für unerreichbar, Prüfsumme)"""
+        while True:
+            # Matrix und Prüfsumme müssen zum selben Stand gehören
+            self.neu_rechnen()
+            pruefsumme = self.pruefsumme
+            with self._lock:
+                if not self._veraltet and self._pruefsumme == pruefsumme:
+                    wege = self._netz.wege.astype(np.float32)
+                    orte = list(self._netz.orte)
+                    break
+        wege[np.isinf(wege)] = np.nan
+        return orte, wege, pruefsumme
+
+    # -------------------- PERSISTENZ --------------------
+    def starten(self):
+        """Hintergrund-Thread für Neuberechnung und Speichern"""
+        if self._thread is not None:
+            return
+        self._stopp.clear()
+        self._thread = threading.Thread(target=self._schleife, name="wegenetz", daemon=True)
+        self._thread.start()
+
+    def stoppen(self):
+        """Thread beenden, offene Änderungen noch rechnen und speichern"""
+        self._stopp.set()
+        self._arbeit.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+        self.neu_rechnen()
+        self.speichern()
+
+    def _schleife(self):
+        while not self._stopp.is_set():
+            self._arbeit.wait(self.speichern_s)
+            self._arbeit.clear()
+            try:
+                self.neu_rechnen()
+                self.speichern()
+            except Exception:
+                logger.exception("Wegenetz konnte nicht aktualisiert werden")
+
+    def speichern(self):
+        """Geänderte Wege als .npz schreiben; Kopie unter der Sperre, Schreiben außerhalb"""
+        if not self._ungespeichert:
+            return
+        pruefsumme = self.pruefsumme
+        with self._lock:
+            if self._veraltet or self._pruefsumme != pruefsumme:
+                return  # der nächste Durchlauf speichert den fertigen Stand
+            kopie = Wegenetz()
+            kopie.orte = list(self._netz.orte)
+            kopie.direkt = self._netz.direkt.copy()
+            kopie.wege = self._netz.wege.copy()
+            self._ungespeichert = False
+        self._speichern(kopie, pruefsumme)
+
+    @staticmethod
+    def _speichern(netz, pruefsumme):
+        if WEGENETZ_DATEI:
+            try:
+                netz.speichern(WEGENETZ_DATEI, pruefsumme)
+            except OSError:
+                pass  # Speichern ist nur eine Startbeschleunigung
+
+    def __len__(self):
+        return len(self._matrix)
+
+
+distanz_cache = DistanzCache()
@@ -0,0 +1,187 @@
+"""
+Live-Änderungen per Server-Sent Events (GET /ereignisse)
+
+Die Handler in main.py melden nach dem Commit jede Änderung an Transporten, Touren
+und der Distanzmatrix an den Verteiler. Jeder Client hält eine Verbindung und
+abonniert nur seinen Tag / Fahrzeugtyp und die gewünschten Arten. Gesendet werden
+kleine Deltas: der geänderte Datensatz bzw. nur die Slots, deren Anzahl freier
+Fahrzeuge sich geändert hat.
+
+Ereignisse gelten pro Prozess. Bei mehreren Workern sieht ein Client nur die
+Änderungen, die über seinen Worker laufen.
+"""
+import asyncio
+import json
+import threading
+from collections import deque
+from sqlalchemy.orm import Session
+from verfuegbarkeit import zeitleiste_laden, alle_slots
+
+ARTEN = ("transport", "tour", "distanz", "verfuegbarkeit")
+PUFFER = 256          # Ereignisse je Client, danach Überlauf -> neu_laden
+HISTORIE = 1000       # für Wiederaufnahme mit Last-Event-ID
+HERZSCHLAG_S = 15
+
+
+class Abonnement:
+    def __init__(self, loop, datum=None, fahrzeugtyp=None, arten=ARTEN):
+        self.loop = loop
+        self.datum = datum
+        self.fahrzeugtyp = fahrzeugtyp
+        self.arten = set(arten)
+        self.queue = asyncio.Queue(maxsize=PUFFER)
+        self.ueberlauf = False
+
+    def passt(self, ereignis):
+        if ereignis["art"] not in self.arten:
+            return False
+        # Ereignisse ohne Tag / Fahrzeugtyp (z.B. Distanzen) gehen an alle
+        if self.datum is not None and ereignis["datum"] not in (None, self.datum):
+            return False
+        if self.fahrzeugtyp is not None and ereignis["fahrzeugtyp"] not in (None, self.fahrzeugtyp):
+            return False
+        return True
+
+    def zustellen(self, ereignis):
+        """Läuft im Event-Loop des Clients"""
+        try:
+            self.queue.put_nowait(ereignis)
+        except asyncio.QueueFull:
+            self.ueberlauf = True
+
+
+class EreignisVerteiler:
+    """Verteilt Änderungen aus den (sync oder async) Handlern an alle passenden Abonnements"""
+
+    def __init__(self, historie=HISTORIE):
+        self._lock = threading.Lock()
+        self._abos = set()
+        self._historie = deque(maxlen=historie)
+        self._letzte_id = 0
+        # Zuletzt gesendete freie Fahrzeuge je (datum, fahrzeugtyp), Basis für die Deltas
+        # Nur solange jemand zuhört, sonst wird die Basis verworfen (basis_verwerfen)
+        self._verfuegbarkeit = {}
+
+    def abonnieren(self, loop, datum=None, fahrzeugtyp=None, arten=ARTEN):
+        abo = Abonnement(loop, str(datum) if datum is not None else None, fahrzeugtyp, arten)
+        # Neue Clients laden die Verfügbarkeit einmal selbst (GET /verfuegbare-zeiten), danach
+        # kommen Deltas zur gemeinsamen Basis dazu; die ist aktuell, solange jemand zuhört
+        with self._lock:
+            self._abos.add(abo)
+        return abo
+
+    def abbestellen(self, abo):
+        with self._lock:
+            self._abos.discard(abo)
+
+    def senden(self, art, aktion, daten, datum=None, fahrzeugtyp=None):
+        datum = str(datum) if datum is not None else None
+        with self._lock:
+            self._letzte_id += 1
+            ereignis = {"id": self._letzte_id, "art": art, "aktion": aktion,
+                        "datum": datum, "fahrzeugtyp": fahrzeugtyp, "daten": daten}
+            self._historie.append(ereignis)
+            # Unter dem Lock einreihen, damit die Reihenfolge den IDs entspricht
+            for abo in self._abos:
+                if abo.passt(ereignis):
+                    try:
+                        abo.loop.call_soon_threadsafe(abo.zustellen, ereignis)
+                    except RuntimeError:
+                        pass  # Loop schon beendet, die Verbindung räumt sich selbst ab
+
+    def hat_abonnenten(self, art, datum=None, fahrzeugtyp=None):
+        probe = {"art": art, "datum": str(datum) if datum is not None else None, "fahrzeugtyp": fahrzeugtyp}
+        with self._lock:
+            return any(abo.passt(probe) for abo in self._abos)
+
+    def seit(self, letzte_id):
+        """Ereignisse nach letzte_id aus der Historie, None wenn sie dort nicht mehr lückenlos sind"""
+        with self._lock:
+            if letzte_id >= self._letzte_id:
+                return []
+            if not self._historie or self._historie[0]["id"] > letzte_id + 1:
+                return None
+            return [e for e in self._historie if e["id"] > letzte_id]
+
+    def verfuegbarkeit_delta(self, datum, fahrzeugtyp, frei):
+        """Nur die Slots, die sich seit dem letzten Senden geändert haben"""
+        schluessel = (str(datum), fahrzeugtyp)
+        with self._lock:
+            alt = self._verfuegbarkeit.get(schluessel, {})
+            self._verfuegbarkeit[schluessel] = frei
+        return {slot: anzahl for slot, anzahl in frei.items() if alt.get(slot) != anzahl}
+
+    def basis_verwerfen(self, datum, fahrzeugtyp):
+        """Ohne Zuhörer veraltet die Basis; der nächste Abonnent bekommt dann einmal alle Slots"""
+        with self._lock:
+            self._verfuegbarkeit.pop((str(datum), fahrzeugtyp), None)
+
+
+verteiler = EreignisVerteiler()
+
+
+# -------------------- MELDEN --------------------
+def transport_daten(t):
+    return {"id": t.id, "von": t.von, "nach": t.nach, "startzeit": t.startzeit, "weg_min": t.weg_min,
+            "status": t.status, "fahrer_id": t.fahrer_id, "mehrfachtransport_id": t.mehrfachtransport_id,
+            "version": t.version}
+
+def tour_daten(mt):
+    return {"id": mt.id, "name": mt.name, "startzeit": mt.startzeit, "gesamt_weg_min": mt.gesamt_weg_min,
+            "status": mt.status, "fahrer_id": mt.fahrer_id, "version": mt.version}
+
+def verfuegbarkeit_melden(db: Session, datum, fahrzeugtyp):
+    """Geänderte Slots senden; die Zeitleiste wird nur gebaut, wenn jemand zuhört"""
+    if datum is None or fahrzeugtyp is None:
+        return
+    if not verteiler.hat_abonnenten("verfuegbarkeit", datum, fahrzeugtyp):
+        verteiler.basis_verwerfen(datum, fahrzeugtyp)
+        return
+    frei = dict(zip(alle_slots(), zeitleiste_laden(db, fahrzeugtyp, datum).frei_pro_slot()))
+    delta = verteiler.verfuegbarkeit_delta(datum, fahrzeugtyp, frei)
+    if delta:
+        verteiler.senden("verfuegbarkeit", "geaendert", {"freie_fahrzeuge": delta}, datum, fahrzeugtyp)
+
+def aenderung_melden(db: Session, art, aktion, daten, datum=None, fahrzeugtyp=None):
+    """Nach dem Commit aufrufen; Transporte und Touren ändern auch die Verfügbarkeit"""
+    verteiler.senden(art, aktion, daten, datum, fahrzeugtyp)
+    if art in ("transport", "tour"):
+        verfuegbarkeit_melden(db, datum, fahrzeugtyp)
+
+
+# -------------------- STREAM --------------------
+def _sse(ereignis):
+    daten = json.dumps(ereignis, ensure_ascii=False, separators=(",", ":"))
+    return f"id: {ereignis['id']}\nevent: {ereignis['art']}\ndata: {daten}\n\n"
+
+async def ereignis_strom(request, abo, letzte_id=None):
+    """Async-Generator für StreamingResponse(media_type="text/event-stream")"""
+    # Ereignisse aus der Historie können zusätzlich schon in der Queue stehen
+    gesendet_bis = 0
+    try:
+        if letzte_id is not None:
+            verpasst = verteiler.seit(letzte_id)
+            if verpasst is None:
+                yield "event: neu_laden\ndata: {}\n\n"
+            else:
+                for ereignis in verpasst:
+                    gesendet_bis = ereignis["id"]
+                    if abo.passt(ereignis):
+                        yield _sse(ereignis)
+        while not await request.is_disconnected():
+            try:
+                ereignis = await asyncio.wait_for(abo.queue.get(), timeout=HERZSCHLAG_S)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            if abo.ueberlauf:
+                # Client kommt nicht hinterher: Puffer verwerfen, Client lädt die Listen neu
+                while not abo.queue.empty():
+                    abo.queue.get_nowait()
+                abo.ueberlauf = False
+                yield "event: neu_laden\ndata: {}\n\n"
+                continue
+            if ereignis["id"] > gesendet_bis:
+                yield _sse(ereignis)
+    finally:
+        verteiler.abbestellen(abo)
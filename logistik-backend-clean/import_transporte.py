@@ -0,0 +1,59 @@
+import sys
+import datetime as dt
+from database import SessionLocal
+from transport_batch import transporte_buchen
+import auslastung
+
+def zeilen_laden(datei):
+    """
+    Lädt Transport-Zeilen aus .xlsx, .csv oder .json
+    Erwartete Spalten wie TransportCreate: von, nach, fahrzeugtyp, datum, startzeit, zeitfenster, ...
+    Standortnamen werden beim Buchen normalisiert (standorte.py), Leerzeichen am Rand stören nicht;
+    unbekannte Standorte sind ein Zeilenfehler (vorher import_distanzmatrix.py oder POST /standorte)
+    """
+    import pandas as pd  # erst bei Bedarf, pandas allein braucht beim Import mehrere hundert ms
+
+    if datei.endswith(".xlsx"):
+        df = pd.read_excel(datei)
+    elif datei.endswith(".json"):
+        df = pd.read_json(datei)
+    else:
+        df = pd.read_csv(datei)
+
+    # Leere Zellen -> None, Excel-Datums-/Zeitwerte in die API-Formate bringen
+    df = df.astype(object).where(pd.notna(df), None)
+    zeilen = df.to_dict(orient="records")
+    for zeile in zeilen:
+        if isinstance(zeile.get("datum"), dt.datetime):
+            zeile["datum"] = zeile["datum"].date()
+        if isinstance(zeile.get("startzeit"), (dt.time, dt.datetime)):
+            zeile["startzeit"] = zeile["startzeit"].strftime("%H:%M")
+    return zeilen
+
+def import_transporte(datei, konflikte_pruefen=True):
+    zeilen = zeilen_laden(datei)
+    print(f"{len(zeilen)} Transporte aus {datei} geladen")
+
+    # Auslastungstabelle wie in der API mitführen
+    auslastung.aktivieren()
+    session = SessionLocal()
+    try:
+        start = dt.datetime.now()
+        ids, fehler = transporte_buchen(session, zeilen, konflikte_pruefen)
+        dauer = (dt.datetime.now() - start).total_seconds()
+    except Exception as e:
+        print(f"Fehler beim Import: {e}")
+        session.rollback()
+        return
+    finally:
+        session.close()
+
+    for f in fehler:
+        print(f"Zeile {f['zeile']}: {f['fehler']}")
+    print(f"\nImport abgeschlossen! {len(ids)} Transporte angelegt, {len(fehler)} Fehler ({dauer:.2f}s)")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Aufruf: python import_transporte.py <datei.xlsx|.csv|.json> [--ohne-konfliktpruefung]")
+        sys.exit(1)
+    import_transporte(sys.argv[1], konflikte_pruefen="--ohne-konfliktpruefung" not in sys.argv)
@@ -0,0 +1,151 @@
+"""
+Kürzeste Fahrzeiten zwischen allen Standorten (Schlüssel sind die Standort-IDs)
+
+Aus den direkten Einträgen der Distanzmatrix wird mit Floyd-Warshall (vektorisiert
+mit NumPy) für jedes Standortpaar die kürzeste Fahrzeit berechnet. Verkürzt sich
+eine einzelne Strecke oder kommt ein Standort dazu, reicht ein O(n²)-Update; wird
+sie länger oder gelöscht, muss neu gerechnet werden (der Distanz-Cache macht das
+außerhalb seiner Sperre). Das Ergebnis wird als .npz gespeichert und beim nächsten
+Start wiederverwendet, solange sich die Distanzmatrix nicht geändert hat.
+"""
+import hashlib
+import os
+import numpy as np
+
+
+def floyd_warshall(direkt):
+    """direkt: n x n mit np.inf für fehlende Strecken, Diagonale 0"""
+    wege = direkt.copy()
+    for k in range(len(wege)):
+        np.minimum(wege, wege[:, k, None] + wege[None, k, :], out=wege)
+    return wege
+
+def fingerabdruck(matrix):
+    """Prüfsumme über alle direkten Einträge {(von_id, nach_id): weg_min}"""
+    h = hashlib.sha1()
+    for (von, nach), weg in sorted(matrix.items()):
+        h.update(f"{von}\x1f{nach}\x1f{weg}\x1e".encode())
+    return h.hexdigest()
+
+
+class Wegenetz:
+    """Standort-ID -> Zeile/Spalte plus Matrix der kürzesten Fahrzeiten, Abfrage in O(1)"""
+
+    def __init__(self):
+        self.orte = []
+        self.index = {}
+        self.direkt = np.zeros((0, 0))
+        self.wege = np.zeros((0, 0))
+
+    # -------------------- AUFBAU --------------------
+    def aufbauen(self, matrix):
+        """Komplett neu rechnen aus {(von_id, nach_id): weg_min}"""
+        self.orte = sorted({ort for paar in matrix for ort in paar})
+        self.index = {ort: i for i, ort in enumerate(self.orte)}
+        self.direkt = self._direkt_matrix(matrix)
+        self.wege = floyd_warshall(self.direkt)
+
+    def _direkt_matrix(self, matrix):
+        n = len(self.orte)
+        direkt = np.full((n, n), np.inf)
+        np.fill_diagonal(direkt, 0.0)
+        for (von, nach), weg in matrix.items():
+            if weg is None or von == nach:
+                continue
+            i, j = self.index[von], self.index[nach]
+            direkt[i, j] = min(direkt[i, j], weg)
+            # Wie bisher gilt eine Strecke auch rückwärts, solange es keinen eigenen Eintrag gibt
+            if (nach, von) not in matrix or matrix[(nach, von)] is None:
+                direkt[j, i] = min(direkt[j, i], weg)
+        return direkt
+
+    # -------------------- INKREMENTELL --------------------
+    def strecke_geaendert(self, matrix, von, nach):
+        """
+        Nach setzen/entfernen von (von, nach) im Cache aufrufen
+        True: Strecke ist länger geworden oder weg, wege ist bis floyd_warshall(direkt) veraltet
+        """
+        if von == nach:
+            return False
+        if von not in self.index or nach not in self.index:
+            if (von, nach) not in matrix:
+                return False
+            for ort in (von, nach):
+                if ort not in self.index:
+                    self._ort_hinzufuegen(ort)
+        i, j = self.index[von], self.index[nach]
+        neu = {}
+        for a, b, x, y in ((von, nach, i, j), (nach, von, j, i)):
+            weg = matrix.get((a, b))
+            if weg is None:
+                weg = matrix.get((b, a))
+            neu[(x, y)] = np.inf if weg is None else float(weg)
+
+        if any(weg > self.direkt[x, y] for (x, y), weg in neu.items()):
+            # Strecke länger oder weg: alte kürzeste Wege können ungültig sein
+            for (x, y), weg in neu.items():
+                self.direkt[x, y] = weg
+            return True
+        for (x, y), weg in neu.items():
+            if weg < self.direkt[x, y]:
+                self.direkt[x, y] = weg
+                # Jeder Weg a -> b kann jetzt über die Kante x -> y kürzer werden
+                np.minimum(self.wege, self.wege[:, x, None] + weg + self.wege[None, y, :], out=self.wege)
+        return False
+
+    def _ort_hinzufuegen(self, ort):
+        """Neuer Standort ohne Strecken als letzte Zeile/Spalte"""
+        n = len(self.orte) + 1
+        direkt = np.full((n, n), np.inf)
+        direkt[:-1, :-1] = self.direkt
+        direkt[-1, -1] = 0.0
+        wege = np.full((n, n), np.inf)
+        wege[:-1, :-1] = self.wege
+        wege[-1, -1] = 0.0
+        self.direkt, self.wege = direkt, wege
+        # Index zuletzt: parallele Abfragen sehen nie einen Index ohne Zeile
+        self.orte = self.orte + [ort]
+        self.index = {**self.index, ort: n - 1}
+
+    # -------------------- ABFRAGE --------------------
+    def weg_min(self, von, nach):
+        i = self.index.get(von)
+        j = self.index.get(nach)
+        if i is None or j is None:
+            return None
+        weg = self.wege[i, j]
+        return float(weg) if np.isfinite(weg) else None
+
+    def teilmatrix(self, orte):
+        """Kürzeste Fahrzeiten zwischen den angegebenen Orten (np.inf = nicht erreichbar)"""
+        idx = [self.index.get(ort, -1) for ort in orte]
+        ergebnis = np.full((len(orte), len(orte)), np.inf)
+        bekannt = [k for k, i in enumerate(idx) if i >= 0]
+        if bekannt:
+            zeilen = np.array([idx[k] for k in bekannt])
+            ergebnis[np.ix_(bekannt, bekannt)] = self.wege[np.ix_(zeilen, zeilen)]
+        np.fill_diagonal(ergebnis, 0.0)
+        return ergebnis
+
+    # -------------------- PERSISTENZ --------------------
+    def speichern(self, pfad, pruefsumme):
+        temp = f"{pfad}.{os.getpid()}.tmp.npz"
+        np.savez(temp, orte=np.array(self.orte, dtype=np.int64), direkt=self.direkt,
+                 wege=self.wege, pruefsumme=pruefsumme)
+        os.replace(temp, pfad)  # atomar, parallele Worker lesen nie halbe Dateien
+
+    def laden(self, pfad, pruefsumme):
+        """True, wenn die Datei zur aktuellen Distanzmatrix passt und übernommen wurde"""
+        if not os.path.exists(pfad):
+            return False
+        try:
+            with np.load(pfad) as daten:
+                if str(daten["pruefsumme"]) != pruefsumme:
+                    return False
+                self.orte = daten["orte"].tolist()
+                self.direkt = daten["direkt"]
+                self.wege = daten["wege"]
+        except (OSError, KeyError, ValueError):
+            return False
+        self.index = {ort: i for i, ort in enumerate(self.orte)}
+        return True
@@ -1,108 +1,283 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import APIRouter, FastAPI, Body, Depends, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from database import Base, engine, SessionLocal
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.orm.exc import StaleDataError
+import database
+from database import engine, SessionLocal, get_db, ASYNC_MODUS, pool_status
+from migrationen import migrieren, ausstehende_migrationen
 from models import (Benutzer, Transport, Zeitfenster, Schicht, Logbuch, 
                    Distanz, ArchivTransport, Fahrzeugtyp, Mehrfachtransport, 
-                   MehrfachtransportRoute)
+                   MehrfachtransportRoute, Standort, StandortAlias)
 import schemas
-from datetime import datetime
+from distanz_cache import distanz_cache
+import cache_stand
+from standorte import standorte, name_normalisieren, schluessel, verzeichnis_pruefen
+from antwort_cache import antwort_cache
+from messung import MessMiddleware, MessRoute, metriken, sql_zaehlen
+import audit
+from audit import AuditMiddleware
+from verfuegbarkeit import zeitleiste_laden, verfuegbarkeit_antwort, slot_bereich
+from reservierung import reservierung, fahrer_gesperrt
+from transport_batch import transporte_buchen
+from tourenoptimierung import distanz_array, optimieren
+from tagesplanung import tagesplan, plan_uebernehmen
+import auslastung
+from auslastung import statistik as auslastung_statistik
+from disposition import fahrt_intervall, fahrer_konflikte, konflikte_behandeln, disposition_laden
+from ereignisse import (ARTEN, verteiler, ereignis_strom, aenderung_melden, verfuegbarkeit_melden,
+                        transport_daten, tour_daten)
+from archivierung import archivierer, archivieren, archiv_monate
+from paginierung import STANDARD_LIMIT, MAX_LIMIT, seite_laden, filter_anwenden
+from schnelle_listen import seite_antwort, export_antwort, transport_filter
+import asyncio
+import json
+import logging
+import os
+import struct
+import time
+import numpy as np
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime, date, timedelta
+from typing import Any, Dict, List, Optional
+from operator import eq, ge, lt
 
-app = FastAPI()
+# Latenz, SQL-Anweisungen und Antwortgröße je Route (GET /metrics); Standort-Verzeichnis je Anfrage aktuell
+router = APIRouter(route_class=MessRoute, dependencies=[Depends(verzeichnis_pruefen)])
+logger = logging.getLogger("logistik.start")
+
+# Schema nur mit SCHEMA_MIGRIEREN=1 beim Start migrieren, sonst im Deployment: python migrationen.py
+SCHEMA_MIGRIEREN = os.getenv("SCHEMA_MIGRIEREN", "0") == "1"
+# Distanz-Cache beim Start laden; 0 = erst bei der ersten Anfrage, die ihn braucht
+CACHE_VORWAERMEN = os.getenv("CACHE_VORWAERMEN", "1") == "1"
 
 # CORS-Freigabe für Frontend (Port 3000-3005)
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[
-        "http://localhost:3000",
-        "http://localhost:3001",
-        "http://localhost:3002",
-        "http://localhost:3003",
-        "http://localhost:3004",
-        "http://localhost:3005",
-        "http://127.0.0.1:3000",
-        "http://127.0.0.1:3001",
-        "http://127.0.0.1:3002",
-        "http://127.0.0.1:3003",
-        "http://127.0.0.1:3004",
-        "http://127.0.0.1:3005"
-    ],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Tabellen erstellen
-Base.metadata.create_all(bind=engine)
-
-# DB-Session bereitstellen
-def get_db():
-    db = SessionLocal()
+CORS_ORIGINS = [
+    "http://localhost:3000",
+    "http://localhost:3001",
+    "http://localhost:3002",
+    "http://localhost:3003",
+    "http://localhost:3004",
+    "http://localhost:3005",
+    "http://127.0.0.1:3000",
+    "http://127.0.0.1:3001",
+    "http://127.0.0.1:3002",
+    "http://127.0.0.1:3003",
+    "http://127.0.0.1:3004",
+    "http://127.0.0.1:3005"
+]
+
+sql_zaehlen(engine)
+if database.async_engine is not None:
+    sql_zaehlen(database.async_engine.sync_engine)
+
+# Transport/Mehrfachtransport wurde seit dem Lesen geändert (UPDATE ... WHERE version = ...)
+async def veraltete_version(request: Request, exc: StaleDataError):
+    return JSONResponse(status_code=409, content={"detail": "Datensatz wurde zwischenzeitlich geändert, bitte neu laden"})
+
+# -------------------- START --------------------
+# Dauer der einzelnen Startschritte in ms (GET /system/start, benchmark_kaltstart.py)
+start_schritte = {}
+
+def start_schritt(name, funktion):
+    beginn = time.perf_counter()
     try:
-        yield db
+        funktion()
     finally:
-        db.close()
+        start_schritte[name] = round((time.perf_counter() - beginn) * 1000, 1)
+
+def schema_pruefen():
+    """Nur lesen: fehlende Migrationen melden, eine nicht erreichbare DB hält den Start nicht auf"""
+    try:
+        with engine.connect() as conn:
+            fehlend = ausstehende_migrationen(conn)
+    except SQLAlchemyError:
+        logger.warning("Schema-Version nicht lesbar, DB beim Start nicht erreichbar", exc_info=True)
+        return
+    if fehlend:
+        logger.warning("Migrationen %s fehlen: python migrationen.py oder SCHEMA_MIGRIEREN=1", fehlend)
+
+def caches_vorwaermen():
+    """Standorte und Distanzmatrix laden; klappt das nicht, lädt die erste Anfrage nach (sicherstellen)"""
+    try:
+        standorte.laden()
+        with SessionLocal() as db:
+            distanz_cache.laden(db)
+    except SQLAlchemyError:
+        logger.warning("Distanz-Cache beim Start nicht geladen", exc_info=True)
+
+@asynccontextmanager
+async def lebenszyklus(app: FastAPI):
+    if SCHEMA_MIGRIEREN:
+        start_schritt("migrieren", lambda: migrieren(engine))
+    else:
+        start_schritt("schema_pruefen", schema_pruefen)
+    # Auslastungstabelle in derselben Transaktion wie die Buchungen nachziehen
+    auslastung.aktivieren()
+    # Audit-Log: Session-Events erfassen, der Puffer schreibt im Hintergrund
+    audit.aktivieren()
+    archivierer.starten()
+    # Wegenetz nach längeren/gelöschten Strecken neu rechnen und gesammelt speichern
+    distanz_cache.starten()
+    if CACHE_VORWAERMEN:
+        start_schritt("caches_vorwaermen", caches_vorwaermen)
+    yield
+    # Archivierung sauber beenden, gepufferte Audit-Einträge und Wegenetz noch schreiben
+    archivierer.stoppen()
+    audit.stoppen()
+    distanz_cache.stoppen()
+
+def app_erstellen():
+    """
+    App mit Middleware und allen Routen; uvicorn main:app oder uvicorn main:app_erstellen --factory
+    Beim Import passiert nichts mit der Datenbank, Start und Herunterfahren laufen über lebenszyklus
+    """
+    app = FastAPI(lifespan=lebenszyklus)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=CORS_ORIGINS,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "ETag", "Last-Modified", "X-Dispositions-Konflikte"],
+    )
+    app.add_middleware(AuditMiddleware)
+    app.add_middleware(MessMiddleware)
+    app.add_exception_handler(StaleDataError, veraltete_version)
+    # async-Endpunkte haben Vorrang vor den gleichnamigen sync-Endpunkten
+    if ASYNC_MODUS:
+        from async_routen import router as async_router
+        app.include_router(async_router)
+    app.include_router(router)
+    return app
 
 # Root - EINFACHER TEST
-@app.get("/")
+@router.get("/")
 def read_root():
     return {"message": "Logistiksoftware-Backend läuft "}
 
+# Dauer der Startschritte dieses Workers
+@router.get("/system/start")
+def start_status():
+    return start_schritte
+
+# Zustand des DB-Verbindungspools (ausgeliehen, Overflow, Wartezeiten)
+@router.get("/system/pool")
+def db_pool_status():
+    status = {"sync": pool_status(engine)}
+    if database.async_engine is not None:
+        status["async"] = pool_status(database.async_engine.sync_engine)
+    return status
+
+# Prometheus-Format: Latenz-, SQL- und Größen-Histogramme je Route, dazu Pool und Antwort-Cache
+@router.get("/metrics", response_class=PlainTextResponse)
+def metriken_abfragen():
+    pools = [("sync", pool_status(engine))]
+    if database.async_engine is not None:
+        pools.append(("async", pool_status(database.async_engine.sync_engine)))
+    cache = antwort_cache.statistik()
+    protokoll = audit.audit_puffer.statistik()
+    zusatz = [
+        ("logistik_db_pool_ausgeliehen", "gauge", "Ausgeliehene DB-Verbindungen",
+         [({"pool": name}, status.get("ausgeliehen", 0)) for name, status in pools]),
+        ("logistik_db_pool_timeouts_total", "counter", "Timeouts beim Warten auf eine DB-Verbindung",
+         [({"pool": name}, status["timeouts"]) for name, status in pools]),
+        ("logistik_db_pool_wartezeit_sekunden_total", "counter", "Wartezeit auf DB-Verbindungen",
+         [({"pool": name}, status["wartezeit_ms_gesamt"] / 1000) for name, status in pools]),
+        ("logistik_cache_treffer_total", "counter", "Treffer im Antwort-Cache",
+         [({"tag": tag}, werte["treffer"]) for tag, werte in cache["pro_tag"].items()]),
+        ("logistik_cache_fehlversuche_total", "counter", "Fehlversuche im Antwort-Cache",
+         [({"tag": tag}, werte["fehlversuche"]) for tag, werte in cache["pro_tag"].items()]),
+        ("logistik_audit_gepuffert", "gauge", "Audit-Einträge, die noch nicht im Logbuch sind",
+         [({}, protokoll["gepuffert"])]),
+        ("logistik_audit_geschrieben_total", "counter", "Ins Logbuch geschriebene Audit-Einträge",
+         [({}, protokoll["geschrieben"])]),
+        ("logistik_audit_verworfen_total", "counter", "Wegen vollem Puffer verworfene Audit-Einträge",
+         [({}, protokoll["verworfen"])]),
+    ]
+    return PlainTextResponse(metriken.als_text(zusatz), media_type="text/plain; version=0.0.4")
+
+# Write-behind-Puffer des Audit-Logs (pro Prozess)
+@router.get("/system/audit")
+def audit_status():
+    return audit.audit_puffer.statistik()
+
+# Treffer/Fehlversuche des Antwort-Caches für die Stammdaten (pro Prozess)
+@router.get("/system/cache")
+def antwort_cache_status():
+    return antwort_cache.statistik()
+
+@router.post("/system/cache/leeren")
+def antwort_cache_leeren():
+    antwort_cache.leeren()
+    return {"message": "Antwort-Cache geleert "}
+
+# Live-Änderungen als Server-Sent Events statt Polling
+# ?datum=2025-07-01&fahrzeugtyp=LKW&arten=transport,verfuegbarkeit; Wiederaufnahme über Last-Event-ID
+# Ereignis "neu_laden": Änderungen verpasst, Listen einmal neu laden
+@router.get("/ereignisse")
+async def ereignisse_abonnieren(request: Request, datum: Optional[date] = None,
+                                fahrzeugtyp: Optional[str] = None, arten: str = ",".join(ARTEN)):
+    gewaehlt = [art for art in arten.split(",") if art in ARTEN]
+    if not gewaehlt:
+        raise HTTPException(status_code=400, detail=f"arten muss aus {', '.join(ARTEN)} bestehen")
+    letzte_id = request.headers.get("last-event-id")
+    letzte_id = int(letzte_id) if letzte_id and letzte_id.isdigit() else None
+    abo = verteiler.abonnieren(asyncio.get_running_loop(), datum, fahrzeugtyp, gewaehlt)
+    return StreamingResponse(ereignis_strom(request, abo, letzte_id), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 # -------------------- FAHRZEUGTYPEN --------------------
-@app.post("/fahrzeugtypen", response_model=schemas.FahrzeugtypOut)
+@router.post("/fahrzeugtypen", response_model=schemas.FahrzeugtypOut)
 def fahrzeugtyp_erstellen(fahrzeugtyp: schemas.FahrzeugtypCreate, db: Session = Depends(get_db)):
     db_fahrzeugtyp = Fahrzeugtyp(**fahrzeugtyp.dict())
     db.add(db_fahrzeugtyp)
     db.commit()
     db.refresh(db_fahrzeugtyp)
+    antwort_cache.invalidieren("fahrzeugtypen")
     return db_fahrzeugtyp
 
-@app.get("/fahrzeugtypen", response_model=list[schemas.FahrzeugtypOut])
-def alle_fahrzeugtypen(db: Session = Depends(get_db)):
-    return db.query(Fahrzeugtyp).all()
+# Stammdaten-Listen kommen aus dem Antwort-Cache (ETag/Last-Modified, 304 bei If-None-Match)
+@router.get("/fahrzeugtypen", response_model=list[schemas.FahrzeugtypOut])
+def alle_fahrzeugtypen(request: Request, limit: int = Query(STANDARD_LIMIT, ge=1, le=MAX_LIMIT),
+                       after_id: Optional[int] = None, db: Session = Depends(get_db)):
+    return antwort_cache.antwort(
+        request, ["fahrzeugtypen"],
+        lambda response: seite_laden(db.query(Fahrzeugtyp), Fahrzeugtyp, response, limit, after_id),
+        schemas.FahrzeugtypOut,
+    )
 
 # Endpunkt für verfügbare Zeiten
-@app.get("/verfuegbare-zeiten/{fahrzeugtyp}/{datum}")
-def verfuegbare_zeiten(fahrzeugtyp: str, datum: str, db: Session = Depends(get_db)):
-    # Alle bereits gebuchten Zeiten für dieses Fahrzeug an diesem Tag
-    gebuchte_zeiten = db.query(Transport.startzeit).filter(
-        Transport.fahrzeugtyp == fahrzeugtyp,
-        Transport.datum == datum
-    ).all()
-    
-    # Auch Mehrfachtransporte berücksichtigen
-    gebuchte_zeiten_mehrfach = db.query(Mehrfachtransport.startzeit).filter(
-        Mehrfachtransport.fahrzeugtyp == fahrzeugtyp,
-        Mehrfachtransport.datum == datum
-    ).all()
-    
-    alle_gebuchten = [zeit[0] for zeit in gebuchte_zeiten] + [zeit[0] for zeit in gebuchte_zeiten_mehrfach]
-    
-    # Alle möglichen Zeitslots (48 pro Tag)
-    alle_zeiten = []
-    for i in range(48):
-        h = str(i // 2).zfill(2)
-        m = "00" if i % 2 == 0 else "30"
-        alle_zeiten.append(f"{h}:{m}")
-    
-    # Verfügbare Zeiten zurückgeben
-    verfuegbare = [zeit for zeit in alle_zeiten if zeit not in alle_gebuchten]
-    return {"verfuegbare_zeiten": verfuegbare}
+# Ein Slot ist verfügbar, solange mindestens ein Fahrzeug des Typs frei ist
+# Optional dauer_min: das Fahrzeug muss für die ganze Fahrt frei sein
+@router.get("/verfuegbare-zeiten/{fahrzeugtyp}/{datum}")
+def verfuegbare_zeiten(fahrzeugtyp: str, datum: date, dauer_min: Optional[float] = Query(None, gt=0),
+                       db: Session = Depends(get_db)):
+    return verfuegbarkeit_antwort(zeitleiste_laden(db, fahrzeugtyp, datum), dauer_min)
 
 # -------------------- BENUTZER --------------------
-@app.post("/benutzer", response_model=schemas.BenutzerOut)
+@router.post("/benutzer", response_model=schemas.BenutzerOut)
 def benutzer_erstellen(benutzer: schemas.BenutzerCreate, db: Session = Depends(get_db)):
     db_benutzer = Benutzer(**benutzer.dict())
     db.add(db_benutzer)
     db.commit()
     db.refresh(db_benutzer)
+    antwort_cache.invalidieren("benutzer")
     return db_benutzer
 
-@app.get("/benutzer", response_model=list[schemas.BenutzerOut])
-def alle_benutzer(db: Session = Depends(get_db)):
-    return db.query(Benutzer).all()
+@router.get("/benutzer", response_model=list[schemas.BenutzerOut])
+def alle_benutzer(request: Request, limit: int = Query(STANDARD_LIMIT, ge=1, le=MAX_LIMIT),
+                  after_id: Optional[int] = None, rolle: Optional[str] = None,
+                  db: Session = Depends(get_db)):
+    query = filter_anwenden(db.query(Benutzer), (Benutzer.rolle, eq, rolle))
+    return antwort_cache.antwort(
+        request, ["benutzer"],
+        lambda response: seite_laden(query, Benutzer, response, limit, after_id),
+        schemas.BenutzerOut,
+    )
 
-@app.put("/benutzer/{id}", response_model=schemas.BenutzerOut)
+@router.put("/benutzer/{id}", response_model=schemas.BenutzerOut)
 def benutzer_updaten(id: int, daten: schemas.BenutzerCreate, db: Session = Depends(get_db)):
     benutzer = db.query(Benutzer).filter(Benutzer.id == id).first()
     if not benutzer:
@@ -111,34 +286,96 @@ def benutzer_updaten(id: int, daten: schemas.BenutzerCreate, db: Session = Depen
         setattr(benutzer, k, v)
     db.commit()
     db.refresh(benutzer)
+    antwort_cache.invalidieren("benutzer")
     return benutzer
 
-@app.delete("/benutzer/{id}")
+@router.delete("/benutzer/{id}")
 def benutzer_loeschen(id: int, db: Session = Depends(get_db)):
     benutzer = db.query(Benutzer).filter(Benutzer.id == id).first()
     if not benutzer:
         raise HTTPException(status_code=404, detail="Benutzer nicht gefunden")
     db.delete(benutzer)
     db.commit()
+    antwort_cache.invalidieren("benutzer")
     return {"message": f"Benutzer {id} gelöscht "}
 
-# -------------------- TRANSPORTE --------------------
-@app.post("/transporte", response_model=schemas.TransportOut)
-def transport_erstellen(transport: schemas.TransportCreate, db: Session = Depends(get_db)):
-    distanz = db.query(Distanz.weg_min).filter(
-        (Distanz.von == transport.von) & (Distanz.nach == transport.nach)
-    ).first()
+# -------------------- DISPOSITION --------------------
+# Konflikte des Fahrers (außerhalb der Schicht, keine Zeit für die Pause, Überschneidung):
+# konflikte=ablehnen -> 409, konflikte=warnen -> speichern + Header X-Dispositions-Konflikte
+KONFLIKT_MODUS = Query("ablehnen", pattern="^(ablehnen|warnen)$")
+
+def fahrer_pruefen(db: Session, fahrer_id, datum, startzeit, dauer_min, modus, response: Response,
+                   ohne_transport_id=None, ohne_tour_id=None):
+    if fahrer_id is None:
+        return
+    try:
+        konflikte = fahrer_konflikte(db, fahrer_id, datum, startzeit, dauer_min, ohne_transport_id, ohne_tour_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Ungültige Startzeit: {startzeit}")
+    konflikte_behandeln(konflikte, modus, response)
+
+@contextmanager
+def fahrer_geprueft(db: Session, fahrer_id, datum, startzeit, dauer_min, modus, response: Response,
+                    ohne_transport_id=None, ohne_tour_id=None):
+    """
+    Sperrt (fahrer_id, datum) bis zum Commit und prüft dann Schicht und Überschneidungen
+    Im with-Block speichern und committen, sonst buchen parallele Anfragen denselben Fahrer doppelt
+    """
+    with fahrer_gesperrt(db, [(fahrer_id, datum)]):
+        fahrer_pruefen(db, fahrer_id, datum, startzeit, dauer_min, modus, response, ohne_transport_id, ohne_tour_id)
+        yield
+
+def fahrer_vorschlaege(db: Session, transport: Transport):
+    """Freie Fahrer für einen gespeicherten Transport, am wenigsten ausgelastete zuerst"""
+    try:
+        start, ende = fahrt_intervall(transport.datum, transport.startzeit, transport.weg_min)
+    except (AttributeError, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Ungültige Startzeit: {transport.startzeit}")
+    disposition = disposition_laden(db, transport.datum, ohne_transport_id=transport.id)
+    return disposition.vorschlaege(start, ende)
 
-    if not distanz:
-        distanz = db.query(Distanz.weg_min).filter(
-            (Distanz.von == transport.nach) & (Distanz.nach == transport.von)
-        ).first()
+# -------------------- RESERVIERUNG --------------------
+def reserviert_speichern(db: Session, aendern, fahrzeugtyp, datum, startzeit, dauer_min,
+                         ohne_transport_id=None, ohne_tour_id=None):
+    """
+    Slots sperren, Kapazität prüfen, dann aendern() ausführen und committen
+    Parallele Buchungen derselben Slots warten auf die Sperre statt doppelt zu buchen
+    """
+    try:
+        slot_bereich(startzeit, dauer_min)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Ungültige Startzeit: {startzeit}")
+    with reservierung(db, fahrzeugtyp, datum, startzeit, dauer_min, ohne_transport_id, ohne_tour_id) as frei:
+        if not frei:
+            raise HTTPException(status_code=409, detail=f"Kein {fahrzeugtyp} frei am {datum} um {startzeit}")
+        aendern()
+        db.commit()
+
+def standort_ids(*namen):
+    """Standortnamen -> IDs an der API-Grenze; leer oder unbekannt -> 400 (anlegen über POST /standorte)"""
+    try:
+        return standorte.aufloesen(*namen)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    weg_min = float(distanz[0]) if distanz else None
+def version_pruefen(objekt, version):
+    """Ohne passende Version (fehlt -> 422 im Schema) kein Überschreiben einer parallelen Änderung"""
+    if version != objekt.version:
+        raise HTTPException(status_code=409, detail="Datensatz wurde zwischenzeitlich geändert, bitte neu laden")
+
+# -------------------- TRANSPORTE --------------------
+@router.post("/transporte", response_model=schemas.TransportOut)
+def transport_erstellen(transport: schemas.TransportCreate, response: Response,
+                        konflikte: str = KONFLIKT_MODUS, db: Session = Depends(get_db)):
+    distanz_cache.sicherstellen(db)
+    von_id, nach_id = standort_ids(transport.von, transport.nach)
+    weg_min = distanz_cache.weg_min(von_id, nach_id)
+    # Touren-Transporte fährt der Fahrer der Tour: kein eigener Fahrer, also auch kein ungeprüfter
+    fahrer_id = transport.fahrer_id if transport.mehrfachtransport_id is None else None
 
     t = Transport(
-        von=transport.von,
-        nach=transport.nach,
+        von_id=von_id,
+        nach_id=nach_id,
         fahrzeugtyp=transport.fahrzeugtyp,
         datum=transport.datum,
         startzeit=transport.startzeit,
@@ -146,109 +383,322 @@ def transport_erstellen(transport: schemas.TransportCreate, db: Session = Depend
         zeitfenster=transport.zeitfenster,
         status=transport.status,
         begruendung=transport.begruendung,
-        fahrer_id=transport.fahrer_id,
+        fahrer_id=fahrer_id,
         mehrfachtransport_id=transport.mehrfachtransport_id,
     )
-    db.add(t)
-    db.commit()
+    with fahrer_geprueft(db, fahrer_id, t.datum, t.startzeit, weg_min, konflikte, response):
+        if transport.mehrfachtransport_id is None:
+            reserviert_speichern(db, lambda: db.add(t), t.fahrzeugtyp, t.datum, t.startzeit, weg_min)
+        else:
+            # Touren-Transporte belegen kein eigenes Fahrzeug
+            db.add(t)
+            db.commit()
     db.refresh(t)
+    aenderung_melden(db, "transport", "angelegt", transport_daten(t), t.datum, t.fahrzeugtyp)
     return t
 
-@app.get("/transporte", response_model=list[schemas.TransportOut])
-def alle_transporte(db: Session = Depends(get_db)):
-    return db.query(Transport).all()
+# Sammelbuchung: jede Zeile wird einzeln geprüft, gültige Zeilen werden gemeinsam angelegt
+@router.post("/transporte/batch", response_model=schemas.TransportBatchOut)
+def transporte_batch_erstellen(zeilen: List[Dict[str, Any]] = Body(...), db: Session = Depends(get_db)):
+    ids, fehler = transporte_buchen(db, zeilen)
+    if ids:
+        # Ein Ereignis je Tag und Fahrzeugtyp statt eines pro Zeile
+        gruppen = {}
+        for id, datum, fahrzeugtyp in db.query(Transport.id, Transport.datum, Transport.fahrzeugtyp).filter(
+                Transport.id.in_(ids)):
+            gruppen.setdefault((datum, fahrzeugtyp), []).append(id)
+        for (datum, fahrzeugtyp), gruppe in gruppen.items():
+            aenderung_melden(db, "transport", "sammelbuchung", {"ids": gruppe}, datum, fahrzeugtyp)
+    return {"angelegt": len(ids), "ids": ids, "fehler": fehler}
+
+EXPORT_FORMAT = Query("ndjson", pattern="^(ndjson|csv)$")
 
-@app.put("/transporte/{id}", response_model=schemas.TransportOut)
-def transport_updaten(id: int, daten: schemas.TransportCreate, db: Session = Depends(get_db)):
+# Listen ohne ORM-Objekte und Pydantic: Core-Zeilen direkt als JSON (siehe schnelle_listen.py)
+@router.get("/transporte", response_model=list[schemas.TransportOut])
+def alle_transporte(limit: int = Query(STANDARD_LIMIT, ge=1, le=MAX_LIMIT), after_id: Optional[int] = None,
+                    bedingungen: list = Depends(transport_filter), db: Session = Depends(get_db)):
+    return seite_antwort(db, Transport, schemas.TransportOut, bedingungen, limit, after_id)
+
+# Alle passenden Transporte ohne Limit als NDJSON oder CSV, gestreamt
+@router.get("/transporte/export")
+def transporte_exportieren(format: str = EXPORT_FORMAT, bedingungen: list = Depends(transport_filter)):
+    return export_antwort(Transport, schemas.TransportOut, bedingungen, format, "transporte")
+
+@router.put("/transporte/{id}", response_model=schemas.TransportOut)
+def transport_updaten(id: int, daten: schemas.TransportAendern, response: Response,
+                      konflikte: str = KONFLIKT_MODUS, db: Session = Depends(get_db)):
     transport = db.query(Transport).filter(Transport.id == id).first()
     if not transport:
         raise HTTPException(status_code=404, detail="Transport nicht gefunden")
-    for k, v in daten.dict().items():
-        setattr(transport, k, v)
-    db.commit()
+    version_pruefen(transport, daten.version)
+    werte = daten.dict(exclude={"version"})
+    werte["von_id"], werte["nach_id"] = standort_ids(werte.pop("von"), werte.pop("nach"))
+    weg_min = fahrer_id = None
+    if daten.mehrfachtransport_id is None:
+        distanz_cache.sicherstellen(db)
+        weg_min = distanz_cache.weg_min(werte["von_id"], werte["nach_id"])
+        # Neue Strecke = neue Dauer; Zeitleiste und Auslastung lesen die gespeicherte weg_min
+        werte["weg_min"] = weg_min
+        fahrer_id = daten.fahrer_id
+    # Touren-Transporte: Fahrer kommt von der Tour (siehe transport_erstellen)
+    werte["fahrer_id"] = fahrer_id
+
+    def aendern():
+        for k, v in werte.items():
+            setattr(transport, k, v)
+
+    slot_felder = ("fahrzeugtyp", "datum", "startzeit", "von_id", "nach_id", "weg_min", "mehrfachtransport_id")
+    alt = (transport.datum, transport.fahrzeugtyp)
+    with fahrer_geprueft(db, fahrer_id, daten.datum, daten.startzeit, weg_min, konflikte, response,
+                         ohne_transport_id=id):
+        if daten.mehrfachtransport_id is None and any(getattr(transport, f) != werte[f] for f in slot_felder):
+            reserviert_speichern(db, aendern, daten.fahrzeugtyp, daten.datum, daten.startzeit, weg_min,
+                                 ohne_transport_id=id)
+        else:
+            aendern()
+            db.commit()
     db.refresh(transport)
+    aenderung_melden(db, "transport", "geaendert", transport_daten(transport), transport.datum, transport.fahrzeugtyp)
+    if alt != (transport.datum, transport.fahrzeugtyp):
+        verfuegbarkeit_melden(db, *alt)
     return transport
 
-@app.delete("/transporte/{id}")
+@router.get("/transporte/{id}/fahrer-vorschlaege", response_model=list[schemas.FahrerVorschlag])
+def transport_fahrer_vorschlaege(id: int, db: Session = Depends(get_db)):
+    transport = db.query(Transport).filter(Transport.id == id).first()
+    if not transport:
+        raise HTTPException(status_code=404, detail="Transport nicht gefunden")
+    return fahrer_vorschlaege(db, transport)
+
+# Besten freien Fahrer (passende Schicht, keine Überschneidung, geringste Auslastung) eintragen
+@router.post("/transporte/{id}/fahrer-zuweisen", response_model=schemas.TransportOut)
+def transport_fahrer_zuweisen(id: int, db: Session = Depends(get_db)):
+    transport = db.query(Transport).filter(Transport.id == id).first()
+    if not transport:
+        raise HTTPException(status_code=404, detail="Transport nicht gefunden")
+    for vorschlag in fahrer_vorschlaege(db, transport):
+        fahrer_id = vorschlag["fahrer_id"]
+        with fahrer_gesperrt(db, [(fahrer_id, transport.datum)]):
+            # Unter der Sperre noch einmal prüfen, der Fahrer kann inzwischen vergeben sein
+            if fahrer_konflikte(db, fahrer_id, transport.datum, transport.startzeit, transport.weg_min,
+                                ohne_transport_id=transport.id):
+                db.rollback()
+                continue
+            transport.fahrer_id = fahrer_id
+            db.commit()
+        break
+    else:
+        raise HTTPException(status_code=409, detail="Kein Fahrer frei")
+    db.refresh(transport)
+    verteiler.senden("transport", "geaendert", transport_daten(transport), transport.datum, transport.fahrzeugtyp)
+    return transport
+
+@router.delete("/transporte/{id}")
 def transport_loeschen(id: int, db: Session = Depends(get_db)):
     transport = db.query(Transport).filter(Transport.id == id).first()
     if not transport:
         raise HTTPException(status_code=404, detail="Transport nicht gefunden")
+    datum, fahrzeugtyp = transport.datum, transport.fahrzeugtyp
     db.delete(transport)
     db.commit()
+    aenderung_melden(db, "transport", "geloescht", {"id": id}, datum, fahrzeugtyp)
     return {"message": f"Transport {id} gelöscht "}
 
 # -------------------- MEHRFACHTRANSPORTE --------------------
-@app.post("/mehrfachtransporte", response_model=schemas.MehrfachtransportOut)
-def mehrfachtransport_erstellen(mehrfach: schemas.MehrfachtransportCreate, db: Session = Depends(get_db)):
-    # Gesamtdistanz berechnen
-    gesamt_weg = 0
-    for route in mehrfach.routen:
-        distanz = db.query(Distanz.weg_min).filter(
-            (Distanz.von == route.von) & (Distanz.nach == route.nach)
-        ).first()
-        if not distanz:
-            distanz = db.query(Distanz.weg_min).filter(
-                (Distanz.von == route.nach) & (Distanz.nach == route.von)
-            ).first()
-        if distanz:
-            gesamt_weg += float(distanz[0])
-    
-    # Mehrfachtransport erstellen
+def tour_abfrage(db: Session):
+    """Touren mit Teilstrecken und verknüpften Transporten (je eine Zusatzabfrage statt N+1)"""
+    return db.query(Mehrfachtransport).options(
+        selectinload(Mehrfachtransport.routen),
+        selectinload(Mehrfachtransport.transporte),
+    )
+
+@router.post("/mehrfachtransporte", response_model=schemas.MehrfachtransportDetailOut)
+def mehrfachtransport_erstellen(mehrfach: schemas.MehrfachtransportCreate, response: Response,
+                                konflikte: str = KONFLIKT_MODUS, db: Session = Depends(get_db)):
+    # Jede Teilstrecke genau einmal auflösen (fehlende Distanz zählt als 0)
+    distanz_cache.sicherstellen(db)
+    orte = standort_ids(*(ort for route in mehrfach.routen for ort in (route.von, route.nach)))
+    routen = [
+        MehrfachtransportRoute(
+            reihenfolge=route.reihenfolge,
+            von_id=von_id,
+            nach_id=nach_id,
+            weg_min=distanz_cache.weg_min(von_id, nach_id) or 0,
+        )
+        for route, von_id, nach_id in zip(mehrfach.routen, orte[::2], orte[1::2])
+    ]
+
+    gesamt_weg_min = sum(route.weg_min for route in routen)
+
+    # Kopf und Routen in einer Transaktion anlegen
     mt = Mehrfachtransport(
         name=mehrfach.name,
         fahrzeugtyp=mehrfach.fahrzeugtyp,
         datum=mehrfach.datum,
         startzeit=mehrfach.startzeit,
-        gesamt_weg_min=gesamt_weg,
+        gesamt_weg_min=gesamt_weg_min,
         fahrer_id=mehrfach.fahrer_id,
-        erstellt_am=datetime.now()
+        erstellt_am=datetime.now(),
+        routen=routen,
     )
-    db.add(mt)
-    db.commit()
-    db.refresh(mt)
-    
-    # Routen hinzufügen
-    for route in mehrfach.routen:
-        distanz = db.query(Distanz.weg_min).filter(
-            (Distanz.von == route.von) & (Distanz.nach == route.nach)
-        ).first()
-        if not distanz:
-            distanz = db.query(Distanz.weg_min).filter(
-                (Distanz.von == route.nach) & (Distanz.nach == route.von)
-            ).first()
-        weg_min = float(distanz[0]) if distanz else 0
-        
-        route_obj = MehrfachtransportRoute(
-            mehrfachtransport_id=mt.id,
-            reihenfolge=route.reihenfolge,
-            von=route.von,
-            nach=route.nach,
-            weg_min=weg_min
-        )
-        db.add(route_obj)
-    
-    db.commit()
+    with fahrer_geprueft(db, mt.fahrer_id, mt.datum, mt.startzeit, gesamt_weg_min, konflikte, response):
+        reserviert_speichern(db, lambda: db.add(mt), mt.fahrzeugtyp, mt.datum, mt.startzeit, gesamt_weg_min)
+    mt = tour_abfrage(db).filter(Mehrfachtransport.id == mt.id).one()
+    aenderung_melden(db, "tour", "angelegt", tour_daten(mt), mt.datum, mt.fahrzeugtyp)
+    return mt
+
+# Kopfdaten einer Tour ändern; nur gesetzte Felder werden übernommen
+@router.put("/mehrfachtransporte/{id}", response_model=schemas.MehrfachtransportDetailOut)
+def mehrfachtransport_updaten(id: int, daten: schemas.MehrfachtransportAendern, response: Response,
+                              konflikte: str = KONFLIKT_MODUS, db: Session = Depends(get_db)):
+    mt = db.query(Mehrfachtransport).filter(Mehrfachtransport.id == id).first()
+    if not mt:
+        raise HTTPException(status_code=404, detail="Mehrfachtransport nicht gefunden")
+    version_pruefen(mt, daten.version)
+    werte = daten.dict(exclude_unset=True, exclude={"version"})
+    fahrer_id = werte.get("fahrer_id", mt.fahrer_id)
+    startzeit = werte.get("startzeit", mt.startzeit)
+    pruefen = fahrer_id if (fahrer_id, startzeit) != (mt.fahrer_id, mt.startzeit) else None
+
+    def aendern():
+        for k, v in werte.items():
+            setattr(mt, k, v)
+
+    with fahrer_geprueft(db, pruefen, mt.datum, startzeit, mt.gesamt_weg_min, konflikte, response, ohne_tour_id=id):
+        if startzeit != mt.startzeit:
+            reserviert_speichern(db, aendern, mt.fahrzeugtyp, mt.datum, startzeit, mt.gesamt_weg_min,
+                                 ohne_tour_id=id)
+        else:
+            aendern()
+            db.commit()
+    mt = tour_abfrage(db).filter(Mehrfachtransport.id == id).one()
+    aenderung_melden(db, "tour", "geaendert", tour_daten(mt), mt.datum, mt.fahrzeugtyp)
     return mt
 
-@app.get("/mehrfachtransporte", response_model=list[schemas.MehrfachtransportOut])
-def alle_mehrfachtransporte(db: Session = Depends(get_db)):
-    return db.query(Mehrfachtransport).all()
+@router.get("/mehrfachtransporte", response_model=list[schemas.MehrfachtransportDetailOut])
+def alle_mehrfachtransporte(response: Response, limit: int = Query(STANDARD_LIMIT, ge=1, le=MAX_LIMIT),
+                            after_id: Optional[int] = None, datum: Optional[date] = None,
+                            datum_von: Optional[date] = None, datum_bis: Optional[date] = None,
+                            fahrzeugtyp: Optional[str] = None, status: Optional[str] = None,
+                            fahrer_id: Optional[int] = None, db: Session = Depends(get_db)):
+    query = filter_anwenden(
+        tour_abfrage(db),
+        (Mehrfachtransport.datum, eq, datum),
+        (Mehrfachtransport.datum, ge, datum_von),
+        (Mehrfachtransport.datum, lt, datum_bis),
+        (Mehrfachtransport.fahrzeugtyp, eq, fahrzeugtyp),
+        (Mehrfachtransport.status, eq, status),
+        (Mehrfachtransport.fahrer_id, eq, fahrer_id),
+    )
+    return seite_laden(query, Mehrfachtransport, response, limit, after_id)
+
+# Reihenfolge der Stopps mit minimaler Gesamtfahrzeit vorschlagen
+# Ergebnis-Routen können direkt als routen für POST /mehrfachtransporte verwendet werden
+@router.post("/mehrfachtransporte/optimieren", response_model=schemas.TourOptimierungOut)
+def mehrfachtransport_optimieren(anfrage: schemas.TourOptimierungAnfrage, db: Session = Depends(get_db)):
+    # doppelte Stopps (auch andere Schreibweise oder Alias) entfernen, Reihenfolge behalten
+    stopps = list(dict.fromkeys(standort_ids(*anfrage.stopps)))
+    if len(stopps) < 2:
+        raise HTTPException(status_code=400, detail="Mindestens zwei verschiedene Stopps angeben")
+    if not 1 <= anfrage.zeitbudget_ms <= 10_000:
+        raise HTTPException(status_code=400, detail="zeitbudget_ms muss zwischen 1 und 10000 liegen")
+
+    distanz_cache.sicherstellen(db)
+    distanzen, _ = distanz_array(stopps)
+    route, methode = optimieren(distanzen, anfrage.rundreise, anfrage.zeitbudget_ms)
+
+    reihenfolge = [stopps[i] for i in route]
+    routen = []
+    fehlend = []
+    for nr, (von, nach) in enumerate(zip(reihenfolge, reihenfolge[1:]), start=1):
+        weg_min = distanz_cache.weg_min(von, nach)
+        von, nach = standorte.name(von), standorte.name(nach)
+        if weg_min is None:
+            fehlend.append([von, nach])
+        routen.append({"von": von, "nach": nach, "reihenfolge": nr, "weg_min": weg_min})
+    return {
+        "fahrzeugtyp": anfrage.fahrzeugtyp,
+        "reihenfolge": [standorte.name(ort) for ort in reihenfolge],
+        "routen": routen,
+        "gesamt_weg_min": sum(r["weg_min"] or 0 for r in routen),
+        "methode": methode,
+        "fehlende_strecken": fehlend,
+    }
+
+@router.get("/mehrfachtransporte/{id}", response_model=schemas.MehrfachtransportDetailOut)
+def mehrfachtransport_detail(id: int, db: Session = Depends(get_db)):
+    mt = tour_abfrage(db).filter(Mehrfachtransport.id == id).first()
+    if not mt:
+        raise HTTPException(status_code=404, detail="Mehrfachtransport nicht gefunden")
+    return mt
+
+# -------------------- TAGESPLANUNG --------------------
+# Offene Transporte eines Tages auf die Fahrzeuge verteilen (tagesplanung.py); der Plan wird
+# nur berechnet, angelegt wird erst mit /uebernehmen
+@router.post("/tagesplanung/{datum}", response_model=schemas.TagesplanOut)
+def tagesplanung(datum: date, anfrage: schemas.TagesplanAnfrage, db: Session = Depends(get_db)):
+    if not 1 <= anfrage.zeitbudget_ms <= 60_000:
+        raise HTTPException(status_code=400, detail="zeitbudget_ms muss zwischen 1 und 60000 liegen")
+    depot, = standort_ids(anfrage.depot)
+    return tagesplan(db, datum, anfrage.fahrzeugtyp, depot, anfrage.zeitbudget_ms, anfrage.fahrzeug_kosten_min)
+
+# Fahrzeugpläne als Mehrfachtransporte anlegen; geänderte oder nicht mehr offene Transporte -> 409
+@router.post("/tagesplanung/{datum}/uebernehmen", response_model=list[schemas.MehrfachtransportDetailOut])
+def tagesplanung_uebernehmen(datum: date, plan: schemas.TagesplanUebernahme, db: Session = Depends(get_db)):
+    fahrzeuge = [(f.fahrzeugtyp, [(s.bezug, s.version) for s in f.stopps]) for f in plan.fahrzeuge]
+    depot, = standort_ids(plan.depot)
+    ids = plan_uebernehmen(db, datum, depot, fahrzeuge)
+    touren = tour_abfrage(db).filter(Mehrfachtransport.id.in_(ids)).order_by(Mehrfachtransport.id).all()
+    for mt in touren:
+        aenderung_melden(db, "tour", "angelegt", tour_daten(mt), mt.datum, mt.fahrzeugtyp)
+    return touren
+
+# -------------------- STATISTIK --------------------
+# Auslastung aus der vorberechneten Tabelle auslastung statt aus den Buchungen (auslastung.py)
+# ?datum_von=...&datum_bis=... (exklusiv, Standard: 7 Tage ab datum_von bzw. heute)
+# gruppierung=zeitraum: eine Zeile je Fahrzeugtyp, tag: je Tag, slot: je Slot
+MAX_STATISTIK_TAGE = 366
+
+@router.get("/statistik/auslastung", response_model=list[schemas.AuslastungOut])
+def auslastung_abfragen(datum_von: Optional[date] = None, datum_bis: Optional[date] = None,
+                        fahrzeugtyp: Optional[str] = None,
+                        gruppierung: str = Query("tag", pattern="^(zeitraum|tag|slot)$"),
+                        db: Session = Depends(get_db)):
+    datum_von = datum_von or date.today()
+    datum_bis = datum_bis or datum_von + timedelta(days=7)
+    if not 0 < (datum_bis - datum_von).days <= MAX_STATISTIK_TAGE:
+        raise HTTPException(status_code=400,
+                            detail=f"datum_bis muss 1 bis {MAX_STATISTIK_TAGE} Tage nach datum_von liegen")
+    return auslastung_statistik(db, datum_von, datum_bis, fahrzeugtyp, gruppierung)
 
 # -------------------- ZEITFENSTER --------------------
-@app.post("/zeitfenster", response_model=schemas.ZeitfensterOut)
+@router.post("/zeitfenster", response_model=schemas.ZeitfensterOut)
 def zeitfenster_erstellen(data: schemas.ZeitfensterCreate, db: Session = Depends(get_db)):
     z = Zeitfenster(**data.dict())
     db.add(z)
     db.commit()
     db.refresh(z)
+    antwort_cache.invalidieren("zeitfenster")
     return z
 
-@app.get("/zeitfenster", response_model=list[schemas.ZeitfensterOut])
-def alle_zeitfenster(db: Session = Depends(get_db)):
-    return db.query(Zeitfenster).all()
+@router.get("/zeitfenster", response_model=list[schemas.ZeitfensterOut])
+def alle_zeitfenster(request: Request, limit: int = Query(STANDARD_LIMIT, ge=1, le=MAX_LIMIT),
+                     after_id: Optional[int] = None, start_von: Optional[datetime] = None,
+                     start_bis: Optional[datetime] = None, verfuegbar: Optional[str] = None,
+                     db: Session = Depends(get_db)):
+    query = filter_anwenden(
+        db.query(Zeitfenster),
+        (Zeitfenster.start, ge, start_von),
+        (Zeitfenster.start, lt, start_bis),
+        (Zeitfenster.verfuegbar, eq, verfuegbar),
+    )
+    return antwort_cache.antwort(
+        request, ["zeitfenster"],
+        lambda response: seite_laden(query, Zeitfenster, response, limit, after_id),
+        schemas.ZeitfensterOut,
+    )
 
-@app.put("/zeitfenster/{id}", response_model=schemas.ZeitfensterOut)
+@router.put("/zeitfenster/{id}", response_model=schemas.ZeitfensterOut)
 def zeitfenster_updaten(id: int, daten: schemas.ZeitfensterCreate, db: Session = Depends(get_db)):
     eintrag = db.query(Zeitfenster).filter(Zeitfenster.id == id).first()
     if not eintrag:
@@ -257,19 +707,21 @@ def zeitfenster_updaten(id: int, daten: schemas.ZeitfensterCreate, db: Session =
         setattr(eintrag, k, v)
     db.commit()
     db.refresh(eintrag)
+    antwort_cache.invalidieren("zeitfenster")
     return eintrag
 
-@app.delete("/zeitfenster/{id}")
+@router.delete("/zeitfenster/{id}")
 def zeitfenster_loeschen(id: int, db: Session = Depends(get_db)):
     eintrag = db.query(Zeitfenster).filter(Zeitfenster.id == id).first()
     if not eintrag:
         raise HTTPException(status_code=404, detail="Zeitfenster nicht gefunden")
     db.delete(eintrag)
     db.commit()
+    antwort_cache.invalidieren("zeitfenster")
     return {"message": f"Zeitfenster {id} gelöscht "}
 
 # -------------------- SCHICHTEN --------------------
-@app.post("/schichten", response_model=schemas.SchichtOut)
+@router.post("/schichten", response_model=schemas.SchichtOut)
 def schicht_erstellen(data: schemas.SchichtCreate, db: Session = Depends(get_db)):
     s = Schicht(**data.dict())
     db.add(s)
@@ -277,11 +729,20 @@ def schicht_erstellen(data: schemas.SchichtCreate, db: Session = Depends(get_db)
     db.refresh(s)
     return s
 
-@app.get("/schichten", response_model=list[schemas.SchichtOut])
-def alle_schichten(db: Session = Depends(get_db)):
-    return db.query(Schicht).all()
+@router.get("/schichten", response_model=list[schemas.SchichtOut])
+def alle_schichten(response: Response, limit: int = Query(STANDARD_LIMIT, ge=1, le=MAX_LIMIT),
+                   after_id: Optional[int] = None, fahrer_id: Optional[int] = None,
+                   von: Optional[datetime] = None, bis: Optional[datetime] = None,
+                   db: Session = Depends(get_db)):
+    query = filter_anwenden(
+        db.query(Schicht),
+        (Schicht.fahrer_id, eq, fahrer_id),
+        (Schicht.von, ge, von),
+        (Schicht.von, lt, bis),
+    )
+    return seite_laden(query, Schicht, response, limit, after_id)
 
-@app.put("/schichten/{id}", response_model=schemas.SchichtOut)
+@router.put("/schichten/{id}", response_model=schemas.SchichtOut)
 def schicht_updaten(id: int, daten: schemas.SchichtCreate, db: Session = Depends(get_db)):
     eintrag = db.query(Schicht).filter(Schicht.id == id).first()
     if not eintrag:
@@ -292,7 +753,7 @@ def schicht_updaten(id: int, daten: schemas.SchichtCreate, db: Session = Depends
     db.refresh(eintrag)
     return eintrag
 
-@app.delete("/schichten/{id}")
+@router.delete("/schichten/{id}")
 def schicht_loeschen(id: int, db: Session = Depends(get_db)):
     eintrag = db.query(Schicht).filter(Schicht.id == id).first()
     if not eintrag:
@@ -302,7 +763,7 @@ def schicht_loeschen(id: int, db: Session = Depends(get_db)):
     return {"message": f"Schicht {id} gelöscht "}
 
 # -------------------- LOGBUCH --------------------
-@app.post("/logbuch", response_model=schemas.LogbuchOut)
+@router.post("/logbuch", response_model=schemas.LogbuchOut)
 def logbuch_eintrag(data: schemas.LogbuchCreate, db: Session = Depends(get_db)):
     l = Logbuch(**data.dict())
     db.add(l)
@@ -310,11 +771,44 @@ def logbuch_eintrag(data: schemas.LogbuchCreate, db: Session = Depends(get_db)):
     db.refresh(l)
     return l
 
-@app.get("/logbuch", response_model=list[schemas.LogbuchOut])
-def alle_logs(db: Session = Depends(get_db)):
-    return db.query(Logbuch).all()
+def logbuch_filter(benutzer_id: Optional[int] = None, zeitpunkt_von: Optional[datetime] = None,
+                   zeitpunkt_bis: Optional[datetime] = None):
+    return [
+        (Logbuch.benutzer_id, eq, benutzer_id),
+        (Logbuch.zeitpunkt, ge, zeitpunkt_von),
+        (Logbuch.zeitpunkt, lt, zeitpunkt_bis),
+    ]
+
+def _aenderungen_auspacken(zeile):
+    zeile["aenderungen"] = json.loads(zeile["aenderungen"]) if zeile["aenderungen"] else {}
+    return zeile
+
+# Automatisch erfasste Änderungen (audit.py); Zeitraum und Benutzer nutzen die Logbuch-Indizes
+# Einträge kommen write-behind, also mit bis zu AUDIT_INTERVALL_S Verzögerung
+@router.get("/logbuch/audit", response_model=list[schemas.AuditOut])
+def audit_abfragen(limit: int = Query(STANDARD_LIMIT, ge=1, le=MAX_LIMIT), after_id: Optional[int] = None,
+                   bedingungen: list = Depends(logbuch_filter), tabelle: Optional[str] = None,
+                   datensatz_id: Optional[int] = None, aktion: Optional[str] = None,
+                   db: Session = Depends(get_db)):
+    bedingungen = bedingungen + [
+        # Nur automatische Einträge, die aus POST /logbuch haben keine Tabelle
+        (Logbuch.tabelle, lambda spalte, _: spalte.isnot(None), True),
+        (Logbuch.tabelle, eq, tabelle),
+        (Logbuch.datensatz_id, eq, datensatz_id),
+        (Logbuch.aktion, eq, aktion),
+    ]
+    return seite_antwort(db, Logbuch, schemas.AuditOut, bedingungen, limit, after_id, _aenderungen_auspacken)
+
+@router.get("/logbuch", response_model=list[schemas.LogbuchOut])
+def alle_logs(limit: int = Query(STANDARD_LIMIT, ge=1, le=MAX_LIMIT), after_id: Optional[int] = None,
+              bedingungen: list = Depends(logbuch_filter), db: Session = Depends(get_db)):
+    return seite_antwort(db, Logbuch, schemas.LogbuchOut, bedingungen, limit, after_id)
+
+@router.get("/logbuch/export")
+def logbuch_exportieren(format: str = EXPORT_FORMAT, bedingungen: list = Depends(logbuch_filter)):
+    return export_antwort(Logbuch, schemas.LogbuchOut, bedingungen, format, "logbuch")
 
-@app.delete("/logbuch/{id}")
+@router.delete("/logbuch/{id}")
 def log_loeschen(id: int, db: Session = Depends(get_db)):
     eintrag = db.query(Logbuch).filter(Logbuch.id == id).first()
     if not eintrag:
@@ -323,57 +817,252 @@ def log_loeschen(id: int, db: Session = Depends(get_db)):
     db.commit()
     return {"message": f"Logbuch-Eintrag {id} gelöscht "}
 
+# -------------------- STANDORTE --------------------
+def standort_filter(name):
+    """Filterwert für von_id/nach_id; ein unbekannter Name findet nichts (IDs beginnen bei 1)"""
+    if name is None:
+        return None
+    return standorte.finden(name) or 0
+
+def standort_daten(standort):
+    return {"id": standort.id, "name": standort.name, "aliase": [a.name for a in standort.aliase]}
+
+def standort_speichern(db: Session, standort, daten: schemas.StandortCreate):
+    """Name und Aliase setzen; Schlüssel, die schon ein anderer Standort belegt -> 409"""
+    name = name_normalisieren(daten.name)
+    if not name:
+        raise HTTPException(status_code=400, detail="Standort ohne Namen")
+    aliase = {schluessel(alias): name_normalisieren(alias) for alias in daten.aliase if name_normalisieren(alias)}
+    aliase.pop(schluessel(name), None)
+    alle = [schluessel(name), *aliase]
+    eigene_id = standort.id or 0
+    belegt = {s for s, in db.query(Standort.schluessel).filter(Standort.schluessel.in_(alle), Standort.id != eigene_id)}
+    belegt.update(s for s, in db.query(StandortAlias.schluessel).filter(
+        StandortAlias.schluessel.in_(alle), StandortAlias.standort_id != eigene_id))
+    if belegt:
+        raise HTTPException(status_code=409, detail=f"Schon vergeben: {', '.join(sorted(belegt))}")
+    standort.name, standort.schluessel = name, schluessel(name)
+    # Unveränderte Aliase behalten, sonst kollidiert das INSERT mit dem noch nicht gelöschten Eintrag
+    vorhanden = {a.schluessel: a for a in standort.aliase}
+    standort.aliase = [vorhanden.get(s) or StandortAlias(name=alias, schluessel=s) for s, alias in aliase.items()]
+    db.add(standort)
+    try:
+        db.flush()
+        # Andere Worker laden ihr Verzeichnis bei der nächsten Anfrage nach
+        cache_stand.erhoehen(db, cache_stand.STANDORTE)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Standort wurde zwischenzeitlich angelegt, bitte neu laden")
+    db.refresh(standort)
+    # Namen stecken in den gecachten Distanz-Antworten
+    standorte.laden()
+    antwort_cache.invalidieren("distanzmatrix")
+    return standort_daten(standort)
+
+@router.post("/standorte", response_model=schemas.StandortOut)
+def standort_erstellen(daten: schemas.StandortCreate, db: Session = Depends(get_db)):
+    return standort_speichern(db, Standort(), daten)
+
+@router.get("/standorte", response_model=list[schemas.StandortOut])
+def alle_standorte(response: Response, limit: int = Query(STANDARD_LIMIT, ge=1, le=MAX_LIMIT),
+                   after_id: Optional[int] = None, db: Session = Depends(get_db)):
+    query = db.query(Standort).options(selectinload(Standort.aliase))
+    return [standort_daten(s) for s in seite_laden(query, Standort, response, limit, after_id)]
+
+# Umbenennen wirkt sofort auf alle Transporte, Routen und Distanzen (sie verweisen nur auf die ID)
+@router.put("/standorte/{id}", response_model=schemas.StandortOut)
+def standort_updaten(id: int, daten: schemas.StandortCreate, db: Session = Depends(get_db)):
+    standort = db.query(Standort).filter(Standort.id == id).first()
+    if not standort:
+        raise HTTPException(status_code=404, detail="Standort nicht gefunden")
+    return standort_speichern(db, standort, daten)
+
+# Verzeichnis sofort neu laden; nach Änderungen lädt jeder Worker sonst zu Beginn der nächsten Anfrage nach
+@router.post("/standorte/neu-laden")
+def standorte_neu_laden():
+    standorte.laden()
+    antwort_cache.invalidieren("distanzmatrix")
+    return {"message": "Standorte neu geladen ", "standorte": len(standorte)}
+
 # -------------------- DISTANZMATRIX --------------------
-@app.post("/distanzmatrix", response_model=schemas.DistanzOut)
+@router.post("/distanzmatrix", response_model=schemas.DistanzOut)
 def distanz_eintrag(data: schemas.DistanzCreate, db: Session = Depends(get_db)):
-    d = Distanz(**data.dict())
+    von_id, nach_id = standort_ids(data.von, data.nach)
+    d = Distanz(von_id=von_id, nach_id=nach_id, weg_min=data.weg_min)
     db.add(d)
-    db.commit()
+    try:
+        db.flush()
+        # In derselben Transaktion: die anderen Worker laden beim nächsten sicherstellen() nach
+        stand = cache_stand.erhoehen(db, cache_stand.DISTANZEN)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Distanz für diese Strecke existiert bereits")
     db.refresh(d)
+    distanz_cache.setzen(d.von_id, d.nach_id, d.weg_min, stand)
+    antwort_cache.invalidieren("distanzmatrix")
+    verteiler.senden("distanz", "angelegt", {"id": d.id, "von": d.von, "nach": d.nach, "weg_min": d.weg_min})
     return d
 
-@app.get("/distanzmatrix", response_model=list[schemas.DistanzOut])
-def alle_distanzen(db: Session = Depends(get_db)):
-    return db.query(Distanz).all()
+# Kompakte Matrix für das Dashboard: Ortsliste + dichte Matrix der kürzesten Fahrzeiten
+# format=json: {"orte": [...], "weg_min": [zeile0..., zeile1...]} flach, null = nicht erreichbar
+# format=binaer: uint32 Kopflänge (LE), JSON-Kopf {"orte", "n"}, auf 4 Byte aufgefüllt, dann n*n float32 (LE, NaN)
+# Die Prüfsumme deckt Strecken und Standortnamen ab (Umbenennen ändert nur die Namen)
+_kompakt_antworten = {}
+
+def _kompakt_serialisieren(format):
+    standorte.sicherstellen()
+    ids, wege, pruefsumme = distanz_cache.kompakt()
+    pruefsumme = f"{pruefsumme[:20]}{standorte.pruefsumme[:8]}"
+    orte = [standorte.name(id) for id in ids]
+    cache_schluessel = (pruefsumme, format)
+    if cache_schluessel not in _kompakt_antworten:
+        if format == "binaer":
+            kopf = json.dumps({"orte": orte, "n": len(orte)}, ensure_ascii=False).encode()
+            kopf += b" " * (-(len(kopf) + 4) % 4)
+            inhalt = struct.pack("<I", len(kopf)) + kopf + wege.astype("<f4").tobytes()
+        else:
+            werte = [None if np.isnan(w) else round(float(w), 1) for w in wege.ravel()]
+            inhalt = json.dumps({"orte": orte, "weg_min": werte}, separators=(",", ":"),
+                                ensure_ascii=False).encode()
+        _kompakt_antworten.clear()
+        _kompakt_antworten[cache_schluessel] = inhalt
+    return _kompakt_antworten[cache_schluessel], pruefsumme
+
+@router.get("/distanzmatrix/kompakt")
+def distanzmatrix_kompakt(request: Request, format: str = Query("json", pattern="^(json|binaer)$"),
+                          db: Session = Depends(get_db)):
+    distanz_cache.sicherstellen(db)
+    inhalt, pruefsumme = _kompakt_serialisieren(format)
+    etag = f'"{pruefsumme}-{format}"'
+    kopfzeilen = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=kopfzeilen)
+    media_type = "application/octet-stream" if format == "binaer" else "application/json"
+    return Response(content=inhalt, media_type=media_type, headers=kopfzeilen)
+
+# Einzelnes Paar für das Formular (kürzeste Fahrzeit, auch über Zwischenstationen)
+@router.get("/distanzmatrix/weg")
+def distanz_weg(von: str, nach: str, db: Session = Depends(get_db)):
+    distanz_cache.sicherstellen(db)
+    # Nur nachschlagen, eine Abfrage legt keine Standorte an
+    von_id, nach_id = standorte.finden(von), standorte.finden(nach)
+    bekannt = von_id is not None and nach_id is not None
+    return {
+        "von": von,
+        "nach": nach,
+        "weg_min": distanz_cache.weg_min(von_id, nach_id) if bekannt else None,
+        "direkt_weg_min": distanz_cache.direkt_weg_min(von_id, nach_id) if bekannt else None,
+    }
 
-@app.put("/distanzmatrix/{id}", response_model=schemas.DistanzOut)
+# Cache sofort komplett neu laden; nach Änderungen (auch Import) lädt jeder Worker sonst von selbst nach
+@router.post("/distanzmatrix/neu-laden")
+def distanz_cache_neu_laden(db: Session = Depends(get_db)):
+    distanz_cache.laden(db)
+    antwort_cache.invalidieren("distanzmatrix")
+    verteiler.senden("distanz", "neu_geladen", {"eintraege": len(distanz_cache)})
+    return {"message": "Distanzmatrix neu geladen ", "eintraege": len(distanz_cache)}
+
+@router.get("/distanzmatrix", response_model=list[schemas.DistanzOut])
+def alle_distanzen(request: Request, limit: int = Query(STANDARD_LIMIT, ge=1, le=MAX_LIMIT),
+                   after_id: Optional[int] = None, von: Optional[str] = None,
+                   nach: Optional[str] = None, db: Session = Depends(get_db)):
+    query = filter_anwenden(
+        db.query(Distanz),
+        (Distanz.von_id, eq, standort_filter(von)),
+        (Distanz.nach_id, eq, standort_filter(nach)),
+    )
+    return antwort_cache.antwort(
+        request, ["distanzmatrix"],
+        lambda response: seite_laden(query, Distanz, response, limit, after_id),
+        schemas.DistanzOut,
+    )
+
+@router.put("/distanzmatrix/{id}", response_model=schemas.DistanzOut)
 def distanz_updaten(id: int, daten: schemas.DistanzCreate, db: Session = Depends(get_db)):
     eintrag = db.query(Distanz).filter(Distanz.id == id).first()
     if not eintrag:
         raise HTTPException(status_code=404, detail="Distanz nicht gefunden")
-    for k, v in daten.dict().items():
-        setattr(eintrag, k, v)
-    db.commit()
+    alt = (eintrag.von_id, eintrag.nach_id)
+    eintrag.von_id, eintrag.nach_id = standort_ids(daten.von, daten.nach)
+    eintrag.weg_min = daten.weg_min
+    try:
+        db.flush()
+        stand = cache_stand.erhoehen(db, cache_stand.DISTANZEN)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Distanz für diese Strecke existiert bereits")
     db.refresh(eintrag)
+    if alt != (eintrag.von_id, eintrag.nach_id):
+        distanz_cache.entfernen(*alt)
+    distanz_cache.setzen(eintrag.von_id, eintrag.nach_id, eintrag.weg_min, stand)
+    antwort_cache.invalidieren("distanzmatrix")
+    verteiler.senden("distanz", "geaendert",
+                     {"id": id, "von": eintrag.von, "nach": eintrag.nach, "weg_min": eintrag.weg_min})
     return eintrag
 
-@app.delete("/distanzmatrix/{id}")
+@router.delete("/distanzmatrix/{id}")
 def distanz_loeschen(id: int, db: Session = Depends(get_db)):
     eintrag = db.query(Distanz).filter(Distanz.id == id).first()
     if not eintrag:
         raise HTTPException(status_code=404, detail="Distanz nicht gefunden")
+    von, nach = eintrag.von, eintrag.nach
+    strecke = (eintrag.von_id, eintrag.nach_id)
     db.delete(eintrag)
+    stand = cache_stand.erhoehen(db, cache_stand.DISTANZEN)
     db.commit()
+    distanz_cache.entfernen(*strecke, db_stand=stand)
+    antwort_cache.invalidieren("distanzmatrix")
+    verteiler.senden("distanz", "geloescht", {"id": id, "von": von, "nach": nach})
     return {"message": f"Distanz {id} gelöscht "}
 
 # -------------------- ARCHIV TRANSPORTE --------------------
-@app.post("/archiv_transporte", response_model=schemas.ArchivTransportOut)
+@router.post("/archiv_transporte", response_model=schemas.ArchivTransportOut)
 def archiv_transport_erstellen(data: schemas.ArchivTransportCreate, db: Session = Depends(get_db)):
-    a = ArchivTransport(**data.dict())
+    werte = data.dict()
+    werte["von_id"], werte["nach_id"] = standort_ids(werte.pop("von"), werte.pop("nach"))
+    a = ArchivTransport(**werte)
     db.add(a)
     db.commit()
     db.refresh(a)
     return a
 
-@app.get("/archiv_transporte", response_model=list[schemas.ArchivTransportOut])
-def alle_archiv_transporte(db: Session = Depends(get_db)):
-    return db.query(ArchivTransport).all()
+# Archivierung sofort auslösen (läuft sonst im Hintergrund alle ARCHIV_INTERVALL_MIN Minuten)
+@router.post("/archiv_transporte/archivieren", response_model=schemas.ArchivierungOut)
+def archivierung_ausfuehren():
+    return archivieren(engine)
+
+@router.get("/archiv_transporte/monate", response_model=list[schemas.ArchivMonatOut])
+def archiv_monatsuebersicht():
+    with engine.connect() as conn:
+        return archiv_monate(conn)
+
+@router.get("/archiv_transporte", response_model=list[schemas.ArchivTransportOut])
+def alle_archiv_transporte(response: Response, limit: int = Query(STANDARD_LIMIT, ge=1, le=MAX_LIMIT),
+                           after_id: Optional[int] = None, fahrzeugtyp: Optional[str] = None,
+                           status: Optional[str] = None,
+                           abgeschlossen_von: Optional[datetime] = None,
+                           abgeschlossen_bis: Optional[datetime] = None,
+                           db: Session = Depends(get_db)):
+    query = filter_anwenden(
+        db.query(ArchivTransport),
+        (ArchivTransport.fahrzeugtyp, eq, fahrzeugtyp),
+        (ArchivTransport.status, eq, status),
+        (ArchivTransport.abgeschlossen_am, ge, abgeschlossen_von),
+        (ArchivTransport.abgeschlossen_am, lt, abgeschlossen_bis),
+    )
+    return seite_laden(query, ArchivTransport, response, limit, after_id)
 
-@app.delete("/archiv_transporte/{id}")
+@router.delete("/archiv_transporte/{id}")
 def archiv_loeschen(id: int, db: Session = Depends(get_db)):
     eintrag = db.query(ArchivTransport).filter(ArchivTransport.id == id).first()
     if not eintrag:
         raise HTTPException(status_code=404, detail="Archiv-Transport nicht gefunden")
     db.delete(eintrag)
     db.commit()
-    return {"message": f"Archiv-Transport {id} gelöscht "} 
\ No newline at end of file
+    return {"message": f"Archiv-Transport {id} gelöscht "} 
+
+
+app = app_erstellen()
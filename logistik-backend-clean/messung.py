@@ -0,0 +1,315 @@
+"""
+Messung pro Anfrage: Latenz, SQL-Anweisungen, Antwortgröße, Profiling
+
+MessMiddleware (reines ASGI) legt für jede HTTP-Anfrage eine AnfrageMessung in eine
+ContextVar. Die SQLAlchemy-Events (sql_zaehlen) und die Endpunkt-Hülle (MessRoute)
+schreiben dort hinein, auch aus dem Threadpool der sync-Endpunkte. Am Ende landen die
+Werte je Route-Template in Histogrammen, GET /metrics liefert sie im Prometheus-Textformat.
+
+Die Zeit im Endpunkt (inkl. DB) wird getrennt von der Gesamtzeit erfasst. Die Differenz
+ist Validierung, Serialisierung und Middleware.
+
+Profiling: ?profil=1 oder Header X-Profil: 1 liefert statt der Antwort eine
+cProfile-Zusammenfassung des Endpunkts, profil=pyinstrument nutzt pyinstrument (falls
+installiert). Nur mit PROFIL_ERLAUBT=1.
+
+Anfragen mit mehr als SQL_BUDGET Anweisungen werden mit der häufigsten Anweisung geloggt
+(typisch: N+1-Abfragen in einer Schleife).
+"""
+import cProfile
+import functools
+import inspect
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from urllib.parse import parse_qs
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+
+SQL_BUDGET = int(os.getenv("SQL_BUDGET", "30"))
+PROFIL_ERLAUBT = os.getenv("PROFIL_ERLAUBT", "0") == "1"
+PROFIL_ZEILEN = 40
+
+# Obergrenzen der Histogramm-Buckets
+DAUER_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+GROESSE_BUCKETS = (256, 1024, 10_240, 102_400, 1_048_576, 10_485_760)
+
+logger = logging.getLogger("messung")
+
+
+class AnfrageMessung:
+    """Werte einer einzelnen Anfrage"""
+
+    def __init__(self, profil=None):
+        self.sql_anzahl = 0
+        self.sql_dauer_s = 0.0
+        self.endpunkt_dauer_s = 0.0
+        self.anweisungen = Counter()
+        self.profil = profil          # None, "cprofile" oder "pyinstrument"
+        self.profil_text = None
+
+    def sql_erfassen(self, anweisung, dauer_s):
+        self.sql_anzahl += 1
+        self.sql_dauer_s += dauer_s
+        self.anweisungen[anweisung] += 1
+
+_aktuelle_messung = ContextVar("aktuelle_messung", default=None)
+
+
+# -------------------- HISTOGRAMME --------------------
+class Histogramm:
+    def __init__(self, grenzen):
+        self.grenzen = grenzen
+        self.anzahl = [0] * len(grenzen)
+        self.summe = 0.0
+        self.gesamt = 0
+
+    def erfassen(self, wert):
+        self.summe += wert
+        self.gesamt += 1
+        for i, grenze in enumerate(self.grenzen):
+            if wert <= grenze:
+                self.anzahl[i] += 1
+                break
+
+    def zeilen(self, name, labels):
+        kumuliert = 0
+        for grenze, anzahl in zip(self.grenzen, self.anzahl):
+            kumuliert += anzahl
+            yield f'{name}_bucket{{{labels},le="{grenze}"}} {kumuliert}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.gesamt}'
+        yield f"{name}_sum{{{labels}}} {round(self.summe, 6)}"
+        yield f"{name}_count{{{labels}}} {self.gesamt}"
+
+
+def _label(wert):
+    return str(wert).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metriken:
+    """Prozessweite Sammlung je (methode, route, status)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routen = {}
+        self.ueber_budget = Counter()
+
+    def erfassen(self, methode, route, status, dauer_s, messung, groesse):
+        with self._lock:
+            werte = self._routen.get((methode, route, status))
+            if werte is None:
+                werte = self._routen[(methode, route, status)] = {
+                    "dauer": Histogramm(DAUER_BUCKETS),
+                    "sql": Histogramm(SQL_BUCKETS),
+                    "groesse": Histogramm(GROESSE_BUCKETS),
+                    "sql_dauer_s": 0.0,
+                    "endpunkt_dauer_s": 0.0,
+                }
+            werte["dauer"].erfassen(dauer_s)
+            werte["sql"].erfassen(messung.sql_anzahl)
+            werte["groesse"].erfassen(groesse)
+            werte["sql_dauer_s"] += messung.sql_dauer_s
+            werte["endpunkt_dauer_s"] += messung.endpunkt_dauer_s
+            if messung.sql_anzahl > SQL_BUDGET:
+                self.ueber_budget[(methode, route)] += 1
+
+    def als_text(self, zusatz=()):
+        """Prometheus-Textformat 0.0.4; zusatz: weitere (name, typ, hilfe, [(labels, wert)])"""
+        with self._lock:
+            routen = sorted(self._routen.items())
+            ueber_budget = sorted(self.ueber_budget.items())
+            zeilen = []
+            for name, typ, hilfe, feld in (
+                ("logistik_anfrage_dauer_sekunden", "histogram", "Gesamtdauer der Anfrage", "dauer"),
+                ("logistik_anfrage_sql_anweisungen", "histogram", "SQL-Anweisungen pro Anfrage", "sql"),
+                ("logistik_antwort_groesse_bytes", "histogram", "Größe des Antwort-Bodys", "groesse"),
+            ):
+                zeilen += [f"# HELP {name} {hilfe}", f"# TYPE {name} {typ}"]
+                for (methode, route, status), werte in routen:
+                    labels = f'methode="{methode}",route="{_label(route)}",status="{status}"'
+                    zeilen += werte[feld].zeilen(name, labels)
+            for name, hilfe, feld in (
+                ("logistik_anfrage_sql_sekunden_total", "Zeit in SQL-Anweisungen", "sql_dauer_s"),
+                ("logistik_anfrage_endpunkt_sekunden_total", "Zeit im Endpunkt inkl. DB, ohne Serialisierung",
+                 "endpunkt_dauer_s"),
+            ):
+                zeilen += [f"# HELP {name} {hilfe}", f"# TYPE {name} counter"]
+                for (methode, route, status), werte in routen:
+                    labels = f'methode="{methode}",route="{_label(route)}",status="{status}"'
+                    zeilen.append(f"{name}{{{labels}}} {round(werte[feld], 6)}")
+        name = "logistik_anfragen_ueber_sql_budget_total"
+        zeilen += [f"# HELP {name} Anfragen mit mehr als {SQL_BUDGET} SQL-Anweisungen", f"# TYPE {name} counter"]
+        zeilen += [f'{name}{{methode="{m}",route="{_label(r)}"}} {n}' for (m, r), n in ueber_budget]
+        for name, typ, hilfe, werte in zusatz:
+            zeilen += [f"# HELP {name} {hilfe}", f"# TYPE {name} {typ}"]
+            for labels, wert in werte:
+                label_text = ",".join(f'{k}="{_label(v)}"' for k, v in labels.items())
+                zeilen.append(f"{name}{{{label_text}}} {wert}" if label_text else f"{name} {wert}")
+        return "\n".join(zeilen) + "\n"
+
+
+metriken = Metriken()
+
+
+# -------------------- SQL --------------------
+def sql_zaehlen(engine):
+    """Zählt Anweisungen und DB-Zeit der laufenden Anfrage (für sync_engine der AsyncEngine ebenso)"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _vorher(conn, cursor, anweisung, parameter, kontext, executemany):
+        conn.info.setdefault("messung_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _nachher(conn, cursor, anweisung, parameter, kontext, executemany):
+        start = conn.info["messung_start"].pop()
+        messung = _aktuelle_messung.get()
+        if messung is not None:
+            messung.sql_erfassen(anweisung, time.perf_counter() - start)
+
+    @event.listens_for(engine, "handle_error")
+    def _fehler(kontext):
+        # Ohne after_cursor_execute bliebe der Startzeitpunkt auf dem Stapel liegen
+        if kontext.connection is not None and kontext.connection.info.get("messung_start"):
+            kontext.connection.info["messung_start"].pop()
+
+
+# -------------------- PROFILING --------------------
+def _profil_starten(art):
+    if art == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            art = "cprofile"
+        else:
+            profiler = Profiler(async_mode="disabled")
+            profiler.start()
+            return art, profiler
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return art, profiler
+
+def _profil_beenden(art, profiler):
+    if art == "pyinstrument":
+        profiler.stop()
+        return profiler.output_text(unicode=True)
+    profiler.disable()
+    ausgabe = io.StringIO()
+    pstats.Stats(profiler, stream=ausgabe).sort_stats("cumulative").print_stats(PROFIL_ZEILEN)
+    return ausgabe.getvalue()
+
+def _endpunkt_messen(endpunkt):
+    """Hülle um den Endpunkt: misst die Zeit und profiliert in dem Thread, in dem er läuft"""
+    if inspect.iscoroutinefunction(endpunkt):
+        @functools.wraps(endpunkt)
+        async def gemessen(*args, **kwargs):
+            messung = _aktuelle_messung.get()
+            if messung is None:
+                return await endpunkt(*args, **kwargs)
+            profil = _profil_starten(messung.profil) if messung.profil else None
+            start = time.perf_counter()
+            try:
+                return await endpunkt(*args, **kwargs)
+            finally:
+                messung.endpunkt_dauer_s += time.perf_counter() - start
+                if profil:
+                    messung.profil_text = _profil_beenden(*profil)
+        return gemessen
+
+    @functools.wraps(endpunkt)
+    def gemessen(*args, **kwargs):
+        messung = _aktuelle_messung.get()
+        if messung is None:
+            return endpunkt(*args, **kwargs)
+        # sync-Endpunkte laufen im Threadpool: cProfile erfasst nur den eigenen Thread
+        profil = _profil_starten(messung.profil) if messung.profil else None
+        start = time.perf_counter()
+        try:
+            return endpunkt(*args, **kwargs)
+        finally:
+            messung.endpunkt_dauer_s += time.perf_counter() - start
+            if profil:
+                messung.profil_text = _profil_beenden(*profil)
+    return gemessen
+
+
+class MessRoute(APIRoute):
+    """Route-Klasse für app.router und APIRouter: misst die Zeit im Endpunkt"""
+
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, _endpunkt_messen(endpoint), **kwargs)
+
+
+# -------------------- MIDDLEWARE --------------------
+def _profil_gewuenscht(scope):
+    if not PROFIL_ERLAUBT:
+        return None
+    wert = parse_qs(scope.get("query_string", b"").decode()).get("profil", [None])[0]
+    if wert is None:
+        wert = dict(scope.get("headers", [])).get(b"x-profil", b"").decode() or None
+    if wert in (None, "", "0"):
+        return None
+    return "pyinstrument" if wert == "pyinstrument" else "cprofile"
+
+
+class MessMiddleware:
+    """Reine ASGI-Middleware, damit Streaming-Antworten nicht gepuffert werden"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        messung = AnfrageMessung(_profil_gewuenscht(scope))
+        token = _aktuelle_messung.set(messung)
+        status = 500
+        groesse = 0
+        strom = False
+        start = time.perf_counter()
+
+        async def senden(nachricht):
+            nonlocal status, groesse, strom
+            if nachricht["type"] == "http.response.start":
+                status = nachricht["status"]
+                strom = dict(nachricht.get("headers", [])).get(b"content-type", b"").startswith(b"text/event-stream")
+            elif nachricht["type"] == "http.response.body":
+                groesse += len(nachricht.get("body", b""))
+            if not messung.profil:
+                await send(nachricht)
+
+        try:
+            await self.app(scope, receive, senden)
+        finally:
+            _aktuelle_messung.reset(token)
+            dauer_s = time.perf_counter() - start
+            route = scope.get("route")
+            route_name = route.path if route is not None else "unbekannt"
+            # SSE-Verbindungen laufen minutenlang und würden die Latenzen verfälschen
+            if not strom:
+                metriken.erfassen(scope["method"], route_name, status, dauer_s, messung, groesse)
+            if messung.sql_anzahl > SQL_BUDGET:
+                anweisung, anzahl = messung.anweisungen.most_common(1)[0]
+                logger.warning("%s %s: %d SQL-Anweisungen (Budget %d), %.1f ms in der DB, %.1f ms gesamt; "
+                               "häufigste (%dx): %s", scope["method"], scope["path"], messung.sql_anzahl,
+                               SQL_BUDGET, messung.sql_dauer_s * 1000, dauer_s * 1000, anzahl,
+                               " ".join(anweisung.split())[:300])
+        if messung.profil:
+            await self._profil_senden(send, messung, status, dauer_s)
+
+    async def _profil_senden(self, send, messung, status, dauer_s):
+        kopf = (f"Status {status}, {dauer_s * 1000:.1f} ms gesamt, "
+                f"{messung.endpunkt_dauer_s * 1000:.1f} ms im Endpunkt, "
+                f"{messung.sql_anzahl} SQL-Anweisungen in {messung.sql_dauer_s * 1000:.1f} ms\n\n")
+        inhalt = (kopf + (messung.profil_text or "Kein Endpunkt ausgeführt\n")).encode()
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", b"text/plain; charset=utf-8"),
+            (b"content-length", str(len(inhalt)).encode()),
+            (b"x-profil-status", str(status).encode()),
+        ]})
+        await send({"type": "http.response.body", "body": inhalt})
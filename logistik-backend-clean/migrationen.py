@@ -0,0 +1,224 @@
+"""
+Versionierte Schema-Migrationen
+
+Jede Migration läuft genau einmal und wird in der Tabelle schema_version vermerkt.
+Migrationen sind idempotent geschrieben (checkfirst / Inspector), weil Migration 1
+eine neue Datenbank direkt mit dem aktuellen Modellstand anlegt.
+
+Die API migriert beim Start nur mit SCHEMA_MIGRIEREN=1, sonst läuft dieses Skript
+einmal im Deployment vor dem Start der Worker.
+
+Aufruf: python migrationen.py
+"""
+from datetime import datetime
+from sqlalchemy import Table, Column, Integer, String, DateTime, MetaData, inspect, insert, select, text
+from database import Base, engine
+import models  # Wichtig: Importiert die Modelle, damit Base sie kennt
+from auslastung import neu_aufbauen
+from standorte import name_normalisieren, schluessel
+import cache_stand
+
+# Beliebige, feste Schlüsselnummer für den Postgres-Advisory-Lock
+MIGRATIONS_LOCK_ID = 4711
+
+_meta = MetaData()
+schema_version = Table(
+    "schema_version", _meta,
+    Column("version", Integer, primary_key=True),
+    Column("beschreibung", String),
+    Column("angewendet_am", DateTime),
+)
+
+
+# -------------------- HILFSFUNKTIONEN --------------------
+def index_anlegen(conn, tabelle, name):
+    """Legt einen im Modell definierten Index an, falls er noch fehlt"""
+    for index in Base.metadata.tables[tabelle].indexes:
+        if index.name == name:
+            index.create(bind=conn, checkfirst=True)
+            return
+    raise ValueError(f"Index {name} ist für {tabelle} nicht definiert")
+
+def spalte_vorhanden(conn, tabelle, spalte):
+    return spalte in {s["name"] for s in inspect(conn).get_columns(tabelle)}
+
+def spalte_hinzufuegen(conn, tabelle, spalte, ddl_typ):
+    """ALTER TABLE ... ADD COLUMN, nur wenn die Spalte noch fehlt"""
+    if not spalte_vorhanden(conn, tabelle, spalte):
+        conn.execute(text(f"ALTER TABLE {tabelle} ADD COLUMN {spalte} {ddl_typ}"))
+
+
+# -------------------- MIGRATIONEN --------------------
+def m001_basisschema(conn):
+    Base.metadata.create_all(bind=conn)
+
+def m002_indizes_hot_queries(conn):
+    # Bis Migration 8 standen die Standorte als Text in von/nach, neue Datenbanken haben nur die IDs
+    if spalte_vorhanden(conn, "distanzmatrix", "von"):
+        # Doppelte Distanzen entfernen, sonst scheitert der Unique-Index (ältester Eintrag bleibt)
+        conn.execute(text(
+            "DELETE FROM distanzmatrix WHERE id NOT IN "
+            "(SELECT MIN(id) FROM distanzmatrix GROUP BY von, nach)"
+        ))
+        conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS uq_distanzmatrix_von_nach ON distanzmatrix (von, nach)"))
+    index_anlegen(conn, "transporte", "ix_transporte_fahrzeugtyp_datum")
+    index_anlegen(conn, "mehrfachtransporte", "ix_mehrfachtransporte_fahrzeugtyp_datum")
+    index_anlegen(conn, "mehrfachtransport_routen", "ix_mehrfachtransport_routen_mt_reihenfolge")
+
+
+def m003_archiv_felder(conn):
+    for spalte, ddl_typ in (
+        ("transport_id", "INTEGER"),
+        ("datum", "DATE"),
+        ("startzeit", "VARCHAR"),
+        ("weg_min", "FLOAT"),
+        ("fahrer_id", "INTEGER"),
+        ("mehrfachtransport_id", "INTEGER"),
+    ):
+        spalte_hinzufuegen(conn, "archiv_transporte", spalte, ddl_typ)
+    index_anlegen(conn, "archiv_transporte", "ix_archiv_transporte_abgeschlossen_am")
+
+
+def m004_indizes_disposition(conn):
+    index_anlegen(conn, "transporte", "ix_transporte_fahrer_datum")
+    index_anlegen(conn, "schichten", "ix_schichten_fahrer_von")
+
+
+def m005_versionen(conn):
+    for tabelle in ("transporte", "mehrfachtransporte"):
+        spalte_hinzufuegen(conn, tabelle, "version", "INTEGER NOT NULL DEFAULT 1")
+
+
+def m006_audit(conn):
+    for spalte, ddl_typ in (("tabelle", "VARCHAR"), ("datensatz_id", "INTEGER"), ("aenderungen", "TEXT")):
+        spalte_hinzufuegen(conn, "logbuch", spalte, ddl_typ)
+    for index in ("ix_logbuch_zeitpunkt", "ix_logbuch_benutzer_zeitpunkt", "ix_logbuch_tabelle_datensatz"):
+        index_anlegen(conn, "logbuch", index)
+
+
+def m007_auslastung(conn):
+    models.Auslastung.__table__.create(bind=conn, checkfirst=True)
+    index_anlegen(conn, "auslastung", "ix_auslastung_datum")
+    # Bestehende Buchungen einmalig übernehmen, danach pflegen die Session-Events die Tabelle
+    neu_aufbauen(conn)
+
+
+STANDORT_TABELLEN = ("transporte", "mehrfachtransport_routen", "distanzmatrix", "archiv_transporte")
+
+def m008_standorte(conn):
+    models.Standort.__table__.create(bind=conn, checkfirst=True)
+    models.StandortAlias.__table__.create(bind=conn, checkfirst=True)
+    alt = [tabelle for tabelle in STANDORT_TABELLEN if spalte_vorhanden(conn, tabelle, "von")]
+    if not alt:
+        return  # neue Datenbank, Migration 1 hat schon von_id/nach_id angelegt
+
+    # Jede Schreibweise genau einmal; Varianten mit gleichem Schlüssel werden ein Standort
+    roh = set()
+    for tabelle in alt:
+        for spalte in ("von", "nach"):
+            roh.update(conn.execute(text(f"SELECT DISTINCT {spalte} FROM {tabelle} WHERE {spalte} IS NOT NULL")).scalars())
+    standort = models.Standort.__table__
+    ids = dict(conn.execute(select(standort.c.schluessel, standort.c.id)).all())
+    neu = {}
+    # Anzeigename: bevorzugt eine Schreibweise, die schon sauber ist ("Halle 1" vor " HALLE 1")
+    for name in sorted(roh, key=lambda name: (name != name_normalisieren(name), name)):
+        s = schluessel(name)
+        if s and s not in ids:
+            neu.setdefault(s, name_normalisieren(name))
+    if neu:
+        conn.execute(insert(standort), [{"name": name, "schluessel": s} for s, name in neu.items()])
+        ids = dict(conn.execute(select(standort.c.schluessel, standort.c.id)).all())
+
+    # Ein UPDATE je Spalte über eine Zuordnungstabelle statt eines UPDATE je Name
+    conn.execute(text("CREATE TEMPORARY TABLE standort_zuordnung (roh VARCHAR PRIMARY KEY, standort_id INTEGER)"))
+    zuordnung = [{"roh": name, "standort_id": ids[schluessel(name)]} for name in roh if schluessel(name)]
+    if zuordnung:
+        conn.execute(text("INSERT INTO standort_zuordnung (roh, standort_id) VALUES (:roh, :standort_id)"), zuordnung)
+    for tabelle in alt:
+        for spalte in ("von", "nach"):
+            spalte_hinzufuegen(conn, tabelle, f"{spalte}_id", "INTEGER REFERENCES standorte(id)")
+            conn.execute(text(
+                f"UPDATE {tabelle} SET {spalte}_id = "
+                f"(SELECT standort_id FROM standort_zuordnung z WHERE z.roh = {tabelle}.{spalte})"
+            ))
+    conn.execute(text("DROP TABLE standort_zuordnung"))
+
+    # "A" und "A " waren zwei Strecken, jetzt dieselbe: ältester Eintrag bleibt
+    conn.execute(text(
+        "DELETE FROM distanzmatrix WHERE id NOT IN "
+        "(SELECT MIN(id) FROM distanzmatrix GROUP BY von_id, nach_id)"
+    ))
+    conn.execute(text("DROP INDEX IF EXISTS uq_distanzmatrix_von_nach"))
+    # SQLite ab 3.35
+    for tabelle in alt:
+        for spalte in ("von", "nach"):
+            conn.execute(text(f"ALTER TABLE {tabelle} DROP COLUMN {spalte}"))
+    index_anlegen(conn, "distanzmatrix", "uq_distanzmatrix_von_id_nach_id")
+
+
+def m009_cache_staende(conn):
+    models.CacheStand.__table__.create(bind=conn, checkfirst=True)
+    vorhanden = set(conn.execute(select(models.CacheStand.name)).scalars())
+    neu = [{"name": name, "stand": 0} for name in (cache_stand.DISTANZEN, cache_stand.STANDORTE)
+           if name not in vorhanden]
+    if neu:
+        conn.execute(insert(models.CacheStand.__table__), neu)
+
+
+MIGRATIONEN = [
+    (1, "Basisschema", m001_basisschema),
+    (2, "Indizes für Verfügbarkeit, Distanzen und Routen", m002_indizes_hot_queries),
+    (3, "Archiv: Transportfelder und Index auf abgeschlossen_am", m003_archiv_felder),
+    (4, "Indizes für die Fahrer-Disposition", m004_indizes_disposition),
+    (5, "Versionsspalten für optimistische Sperren", m005_versionen),
+    (6, "Logbuch: Audit-Felder und Indizes auf Zeitpunkt/Benutzer", m006_audit),
+    (7, "Auslastung je Fahrzeugtyp, Tag und Slot", m007_auslastung),
+    (8, "Standort-Stammdaten, von/nach als Fremdschlüssel", m008_standorte),
+    (9, "Änderungsstände der Prozess-Caches für mehrere Worker", m009_cache_staende),
+]
+
+
+def aktuelle_version(conn):
+    schema_version.create(bind=conn, checkfirst=True)
+    version = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar()
+    return version or 0
+
+def ausstehende_migrationen(conn):
+    """Versionen, die noch fehlen; liest nur (legt schema_version nicht an)"""
+    if not inspect(conn).has_table("schema_version"):
+        return [version for version, _, _ in MIGRATIONEN]
+    stand = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+    return [version for version, _, _ in MIGRATIONEN if version > stand]
+
+def migrieren(bind=None):
+    """Wendet alle noch fehlenden Migrationen an, jede in einer eigenen Transaktion"""
+    bind = bind or engine
+    angewendet = []
+    with bind.connect() as lock_conn:
+        # Mehrere Worker starten gleichzeitig: nur einer migriert
+        if bind.dialect.name == "postgresql":
+            lock_conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATIONS_LOCK_ID})
+            lock_conn.commit()
+        try:
+            for version, beschreibung, funktion in MIGRATIONEN:
+                with bind.begin() as conn:
+                    if version <= aktuelle_version(conn):
+                        continue
+                    funktion(conn)
+                    conn.execute(schema_version.insert().values(
+                        version=version, beschreibung=beschreibung, angewendet_am=datetime.now()
+                    ))
+                angewendet.append(version)
+        finally:
+            if bind.dialect.name == "postgresql":
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATIONS_LOCK_ID})
+                lock_conn.commit()
+    return angewendet
+
+
+if __name__ == "__main__":
+    neu = migrieren()
+    if neu:
+        print(f"Migrationen angewendet: {neu}")
+    else:
+        print("Datenbank ist aktuell.")
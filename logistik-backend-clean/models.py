@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, Text, Date, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Float, Text, Date, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from database import Base
+from standorte import standorte
 
 class Benutzer(Base):
     __tablename__ = "benutzer"
@@ -11,6 +12,35 @@ class Benutzer(Base):
     rolle = Column(String)
     email = Column(String)
 
+class Standort(Base):
+    """Stammdaten der Orte; von_id/nach_id verweisen hierher, Namen löst standorte.py auf"""
+    __tablename__ = "standorte"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False)
+    schluessel = Column(String, nullable=False, unique=True)  # normalisierter Name, siehe standorte.schluessel
+
+    aliase = relationship("StandortAlias", order_by="StandortAlias.id", cascade="all, delete-orphan")
+
+class StandortAlias(Base):
+    __tablename__ = "standort_aliase"
+
+    id = Column(Integer, primary_key=True, index=True)
+    standort_id = Column(Integer, ForeignKey("standorte.id"), nullable=False, index=True)
+    name = Column(String, nullable=False)
+    schluessel = Column(String, nullable=False, unique=True)
+
+class StandortNamen:
+    """von/nach als Namen für Schemas und Ereignisse; gespeichert sind nur von_id/nach_id"""
+
+    @property
+    def von(self):
+        return standorte.name(self.von_id)
+
+    @property
+    def nach(self):
+        return standorte.name(self.nach_id)
+
 class Fahrzeugtyp(Base):
     __tablename__ = "fahrzeugtypen"
 
@@ -18,12 +48,12 @@ class Fahrzeugtyp(Base):
     name = Column(String, unique=True, index=True)
     anzahl_verfuegbar = Column(Integer, default=0)
 
-class Transport(Base):
+class Transport(StandortNamen, Base):
     __tablename__ = "transporte"
 
     id = Column(Integer, primary_key=True, index=True)
-    von = Column(String)
-    nach = Column(String)
+    von_id = Column(Integer, ForeignKey("standorte.id"))
+    nach_id = Column(Integer, ForeignKey("standorte.id"))
     fahrzeugtyp = Column(String)
     datum = Column(Date)
     startzeit = Column(String)
@@ -33,6 +63,14 @@ class Transport(Base):
     begruendung = Column(Text)
     fahrer_id = Column(Integer)
     mehrfachtransport_id = Column(Integer, ForeignKey("mehrfachtransporte.id"), nullable=True)
+    # Optimistische Sperre: UPDATE/DELETE nur, wenn die Version noch stimmt
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+
+    __table_args__ = (
+        Index("ix_transporte_fahrzeugtyp_datum", "fahrzeugtyp", "datum"),
+        Index("ix_transporte_fahrer_datum", "fahrer_id", "datum"),
+    )
+    __mapper_args__ = {"version_id_col": version}
 
 class Mehrfachtransport(Base):
     __tablename__ = "mehrfachtransporte"
@@ -46,20 +84,33 @@ class Mehrfachtransport(Base):
     gesamt_weg_min = Column(Float)
     fahrer_id = Column(Integer)
     erstellt_am = Column(DateTime)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
     
     # Relationship zu einzelnen Transporten
     transporte = relationship("Transport", foreign_keys="Transport.mehrfachtransport_id")
+    # Teilstrecken der Tour in Fahrreihenfolge
+    routen = relationship("MehrfachtransportRoute", order_by="MehrfachtransportRoute.reihenfolge",
+                          cascade="all, delete-orphan")
+
+    __table_args__ = (
+        Index("ix_mehrfachtransporte_fahrzeugtyp_datum", "fahrzeugtyp", "datum"),
+    )
+    __mapper_args__ = {"version_id_col": version}
 
-class MehrfachtransportRoute(Base):
+class MehrfachtransportRoute(StandortNamen, Base):
     __tablename__ = "mehrfachtransport_routen"
 
     id = Column(Integer, primary_key=True, index=True)
     mehrfachtransport_id = Column(Integer, ForeignKey("mehrfachtransporte.id"))
     reihenfolge = Column(Integer)  # 1, 2, 3, etc.
-    von = Column(String)
-    nach = Column(String)
+    von_id = Column(Integer, ForeignKey("standorte.id"))
+    nach_id = Column(Integer, ForeignKey("standorte.id"))
     weg_min = Column(Float)
 
+    __table_args__ = (
+        Index("ix_mehrfachtransport_routen_mt_reihenfolge", "mehrfachtransport_id", "reihenfolge"),
+    )
+
 class Zeitfenster(Base):
     __tablename__ = "zeitfenster"
 
@@ -77,6 +128,10 @@ class Schicht(Base):
     pause_min = Column(Integer, default=0)
     fahrer_id = Column(Integer)
 
+    __table_args__ = (
+        Index("ix_schichten_fahrer_von", "fahrer_id", "von"),
+    )
+
 class Logbuch(Base):
     __tablename__ = "logbuch"
 
@@ -84,22 +139,69 @@ class Logbuch(Base):
     aktion = Column(String)
     zeitpunkt = Column(DateTime)
     benutzer_id = Column(Integer)
-
-class Distanz(Base):
+    # Automatisches Audit (audit.py): betroffener Datensatz und geänderte Felder als JSON
+    tabelle = Column(String, nullable=True)
+    datensatz_id = Column(Integer, nullable=True)
+    aenderungen = Column(Text, nullable=True)
+
+    __table_args__ = (
+        Index("ix_logbuch_zeitpunkt", "zeitpunkt"),
+        Index("ix_logbuch_benutzer_zeitpunkt", "benutzer_id", "zeitpunkt"),
+        Index("ix_logbuch_tabelle_datensatz", "tabelle", "datensatz_id"),
+    )
+
+class Distanz(StandortNamen, Base):
     __tablename__ = "distanzmatrix"
 
     id = Column(Integer, primary_key=True, index=True)
-    von = Column(String)
-    nach = Column(String)
+    von_id = Column(Integer, ForeignKey("standorte.id"))
+    nach_id = Column(Integer, ForeignKey("standorte.id"))
     weg_min = Column(Float)
 
-class ArchivTransport(Base):
+    __table_args__ = (
+        Index("uq_distanzmatrix_von_id_nach_id", "von_id", "nach_id", unique=True),
+    )
+
+class ArchivTransport(StandortNamen, Base):
     __tablename__ = "archiv_transporte"
 
     id = Column(Integer, primary_key=True, index=True)
-    von = Column(String)
-    nach = Column(String)
+    von_id = Column(Integer, ForeignKey("standorte.id"))
+    nach_id = Column(Integer, ForeignKey("standorte.id"))
     fahrzeugtyp = Column(String)
     status = Column(String)
     abgeschlossen_am = Column(DateTime)
     begruendung = Column(Text)
+    # Ab Migration 3: Felder aus dem ursprünglichen Transport
+    transport_id = Column(Integer)
+    datum = Column(Date)
+    startzeit = Column(String)
+    weg_min = Column(Float)
+    fahrer_id = Column(Integer)
+    mehrfachtransport_id = Column(Integer)
+
+    __table_args__ = (
+        Index("ix_archiv_transporte_abgeschlossen_am", "abgeschlossen_am"),
+    )
+
+class CacheStand(Base):
+    """Änderungszähler je Prozess-Cache (cache_stand.py), bei neuem Stand laden die Worker nach"""
+    __tablename__ = "cache_staende"
+
+    name = Column(String, primary_key=True)  # "distanzmatrix", "standorte"
+    stand = Column(Integer, nullable=False, default=0)
+
+class Auslastung(Base):
+    """Vorberechnete Belegung je Fahrzeugtyp, Tag und Slot (auslastung.py), Kapazität kommt beim Lesen dazu"""
+    __tablename__ = "auslastung"
+
+    fahrzeugtyp = Column(String, primary_key=True)
+    datum = Column(Date, primary_key=True)
+    slot = Column(Integer, primary_key=True)  # 0 = 00:00, SLOT_MIN Minuten je Slot
+    belegte_min = Column(Float, nullable=False, default=0)  # Fahrzeug-Minuten in diesem Slot
+    fahrten = Column(Integer, nullable=False, default=0)  # Buchungen, die in diesem Slot beginnen
+    spitze = Column(Integer, nullable=False, default=0)  # gleichzeitig belegte Fahrzeuge (Maximum)
+
+    __table_args__ = (
+        Index("ix_auslastung_datum", "datum"),
+    )
@@ -0,0 +1,28 @@
+"""
+Keyset-Paginierung über die Primärschlüssel: ?limit=...&after_id=...
+Der Cursor für die nächste Seite steht im Header X-Next-Cursor
+"""
+from typing import Optional
+from fastapi import Response
+
+STANDARD_LIMIT = 100
+MAX_LIMIT = 1000
+
+def seite_laden(query, modell, response: Response, limit: int, after_id: Optional[int]):
+    if after_id is not None:
+        query = query.filter(modell.id > after_id)
+    eintraege = query.order_by(modell.id).limit(limit + 1).all()
+    return _cursor_setzen(eintraege, response, limit)
+
+def _cursor_setzen(eintraege, response: Response, limit: int):
+    if len(eintraege) > limit:
+        eintraege = eintraege[:limit]
+        response.headers["X-Next-Cursor"] = str(eintraege[-1].id)
+    return eintraege
+
+def filter_anwenden(query, *bedingungen):
+    """Wendet nur die gesetzten Filter an: (Spalte, Operator, Wert), None wird ignoriert"""
+    for spalte, operator, wert in bedingungen:
+        if wert is not None:
+            query = query.filter(operator(spalte, wert))
+    return query
@@ -0,0 +1,122 @@
+"""
+Atomare Slot-Reservierung für Buchungen
+
+Vor Prüfung und INSERT werden die berührten Slots (fahrzeugtyp, datum, slot) mit
+transaktionsgebundenen Postgres-Advisory-Locks gesperrt, immer in derselben
+Reihenfolge (kein Deadlock). Buchungen auf anderen Slots, Tagen oder Fahrzeugtypen
+laufen parallel weiter; die Sperren fallen beim Commit/Rollback weg.
+
+Fahrer werden genauso je (fahrer_id, datum) gesperrt, damit die Prüfung von Schicht
+und Überschneidungen (disposition.py) und das Speichern in derselben Transaktion
+unter der Sperre laufen. Fahrer immer vor den Slots sperren.
+
+Ohne Postgres (lokale SQLite-DB) sperrt ein Lock je (fahrzeugtyp, datum) bzw.
+(fahrer, datum) im Prozess.
+"""
+import asyncio
+import threading
+import zlib
+from datetime import timedelta
+from contextlib import contextmanager, asynccontextmanager
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from verfuegbarkeit import SLOT_MIN, TAG_MIN, slot_bereich, zeitleiste_laden, zeitleiste_laden_async
+
+ALLE_SLOTS = range(TAG_MIN // SLOT_MIN)
+
+_SPERRE = text("SELECT pg_advisory_xact_lock(:schluessel, :slot)")
+_lokale_sperren = {}
+_lokale_sperren_lock = threading.Lock()
+
+
+def sperr_schluessel(fahrzeugtyp, datum):
+    """Stabiler int4-Schlüssel je (fahrzeugtyp, datum), gleich in allen Workern"""
+    return zlib.crc32(f"{fahrzeugtyp}|{datum}".encode()) - 2**31
+
+def _lokale_sperre(fahrzeugtyp, datum):
+    with _lokale_sperren_lock:
+        return _lokale_sperren.setdefault((fahrzeugtyp, str(datum)), threading.Lock())
+
+def _sortiert(slots):
+    """[(schluessel, slot)] in fester Reihenfolge, damit sich zwei Buchungen nie gegenseitig blockieren"""
+    return sorted({(sperr_schluessel(typ, datum), slot) for typ, datum, slot in slots})
+
+def _tage(slots):
+    return sorted({(typ, str(datum)) for typ, datum, _ in slots})
+
+def _fahrer_slots(fahrten):
+    """
+    [(fahrer_id, datum)] -> Pseudo-Slots ("fahrer/<id>", tag, -1), Slot -1 kommt bei Fahrzeugen nicht vor
+    Auch der Folgetag: Fahrten über Mitternacht überschneiden sich mit denen des nächsten Tages
+    """
+    return [(f"fahrer/{fahrer_id}", datum + timedelta(days=tage), -1)
+            for fahrer_id, datum in fahrten if fahrer_id is not None for tage in (0, 1)]
+
+
+@contextmanager
+def slots_gesperrt(db: Session, slots):
+    """
+    Sperrt [(fahrzeugtyp, datum, slot)] bis zum Ende der Transaktion
+    Innerhalb des with-Blocks prüfen, anlegen und committen
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        for schluessel, slot in _sortiert(slots):
+            db.execute(_SPERRE, {"schluessel": schluessel, "slot": slot})
+        yield
+        return
+    # Verbindung vor dem Warten holen: wer die Sperre hat, braucht keine zweite aus dem Pool
+    db.connection()
+    sperren = [_lokale_sperre(*tag) for tag in _tage(slots)]
+    for sperre in sperren:
+        sperre.acquire()
+    try:
+        yield
+    finally:
+        for sperre in reversed(sperren):
+            sperre.release()
+
+def fahrer_gesperrt(db: Session, fahrten):
+    """Sperrt [(fahrer_id, datum)] bis zum Ende der Transaktion, fahrer_id None wird übersprungen"""
+    return slots_gesperrt(db, _fahrer_slots(fahrten))
+
+@contextmanager
+def reservierung(db: Session, fahrzeugtyp, datum, startzeit, dauer_min, ohne_transport_id=None, ohne_tour_id=None):
+    """
+    Sperrt die Slots einer Fahrt und liefert True, wenn darin noch ein Fahrzeug frei ist
+    ValueError bei ungültiger Startzeit
+    """
+    slots = slot_bereich(startzeit, dauer_min)
+    with slots_gesperrt(db, [(fahrzeugtyp, datum, slot) for slot in slots]):
+        # Erst nach dem Sperren lesen, sonst fehlen parallel committete Buchungen
+        zeitleiste = zeitleiste_laden(db, fahrzeugtyp, datum, ohne_transport_id, ohne_tour_id)
+        yield zeitleiste.ist_frei(slots)
+
+@asynccontextmanager
+async def slots_gesperrt_async(session, slots):
+    """Wie slots_gesperrt, für AsyncSession"""
+    sperren = []
+    if session.bind.dialect.name == "postgresql":
+        for schluessel, slot in _sortiert(slots):
+            await session.execute(_SPERRE, {"schluessel": schluessel, "slot": slot})
+    else:
+        await session.connection()
+        sperren = [_lokale_sperre(*tag) for tag in _tage(slots)]
+        for sperre in sperren:
+            await asyncio.to_thread(sperre.acquire)
+    try:
+        yield
+    finally:
+        for sperre in reversed(sperren):
+            sperre.release()
+
+def fahrer_gesperrt_async(session, fahrten):
+    """Wie fahrer_gesperrt, für AsyncSession"""
+    return slots_gesperrt_async(session, _fahrer_slots(fahrten))
+
+@asynccontextmanager
+async def reservierung_async(session, fahrzeugtyp, datum, startzeit, dauer_min):
+    """Wie reservierung, für AsyncSession"""
+    slots = slot_bereich(startzeit, dauer_min)
+    async with slots_gesperrt_async(session, [(fahrzeugtyp, datum, slot) for slot in slots]):
+        zeitleiste = await zeitleiste_laden_async(session, fahrzeugtyp, datum)
+        yield zeitleiste.ist_frei(slots)
@@ -1,13 +1,13 @@
 import time
-from sqlalchemy import create_engine, text, MetaData
-from database import DATABASE_URL, Base
-import models # Wichtig: Importiert die Modelle, damit Base sie kennt
+from sqlalchemy import text, MetaData
+from database import engine_erstellen
+from migrationen import migrieren
 
 # Warten, falls die DB noch nicht bereit ist
 time.sleep(3) 
 
 # Verbindung zur Datenbank herstellen
-engine = create_engine(DATABASE_URL)
+engine = engine_erstellen()
 print("Verbindung zur Datenbank hergestellt.")
 
 # Alle Tabellen löschen (ACHTUNG: Alle Daten gehen verloren!)
@@ -23,10 +23,10 @@ except Exception as e:
     print(f"Fehler beim Löschen der Tabellen: {e}")
 
 
-# Alle Tabellen neu erstellen (basierend auf den Models)
+# Alle Tabellen neu erstellen (über die Migrationen, damit schema_version stimmt)
 print("Erstelle alle Tabellen neu...")
 try:
-    Base.metadata.create_all(bind=engine)
+    migrieren(engine)
     print("Alle Tabellen erfolgreich neu erstellt.")
 except Exception as e:
     print(f"Fehler beim Erstellen der Tabellen: {e}")
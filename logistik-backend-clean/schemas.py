@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from datetime import datetime, date
 
 class BenutzerCreate(BaseModel):
@@ -34,12 +34,25 @@ class TransportCreate(BaseModel):
     fahrer_id: Optional[int] = None
     mehrfachtransport_id: Optional[int] = None
 
+class TransportAendern(TransportCreate):
+    version: int  # gelesene Version, Pflicht; abweichend -> 409
+
 class TransportOut(TransportCreate):
     id: int
     weg_min: Optional[float] = None
+    version: int = 1
     class Config:
         orm_mode = True
 
+class BatchFehler(BaseModel):
+    zeile: int
+    fehler: str
+
+class TransportBatchOut(BaseModel):
+    angelegt: int
+    ids: List[int]
+    fehler: List[BatchFehler]
+
 class MehrfachtransportRouteCreate(BaseModel):
     von: str
     nach: str
@@ -53,6 +66,80 @@ class MehrfachtransportCreate(BaseModel):
     routen: List[MehrfachtransportRouteCreate]
     fahrer_id: Optional[int] = None
 
+class TourOptimierungAnfrage(BaseModel):
+    stopps: List[str]  # erster Stopp = Startort
+    fahrzeugtyp: str
+    rundreise: bool = False
+    zeitbudget_ms: int = 200
+
+class OptimierteRoute(MehrfachtransportRouteCreate):
+    weg_min: Optional[float] = None
+
+class TourOptimierungOut(BaseModel):
+    fahrzeugtyp: str
+    reihenfolge: List[str]
+    routen: List[OptimierteRoute]
+    gesamt_weg_min: float
+    methode: str
+    fehlende_strecken: List[List[str]] = []
+
+class TagesplanAnfrage(BaseModel):
+    fahrzeugtyp: Optional[str] = None  # ohne: alle Fahrzeugtypen mit offenen Transporten
+    depot: Optional[str] = None  # Fahrzeuge starten und enden dort; ohne: Start am ersten Auftrag
+    zeitbudget_ms: int = 2000
+    fahrzeug_kosten_min: float = 30.0  # Strafe je eingesetztem Fahrzeug, in Minuten Leerfahrt
+
+class PlanStopp(BaseModel):
+    bezug: str  # "transport/17", feste Buchungen auch "tour/5"
+    version: Optional[int] = None
+
+class GeplanterStopp(PlanStopp):
+    von: Optional[str] = None
+    nach: Optional[str] = None
+    beginn: str
+    ende: str
+    leerfahrt_min: float
+    fest: bool = False
+
+class FahrzeugZuordnung(BaseModel):
+    fahrzeugtyp: str
+    stopps: List[PlanStopp]
+
+class FahrzeugPlan(FahrzeugZuordnung):
+    fahrzeug: int
+    stopps: List[GeplanterStopp]
+    auftraege: int
+    leerfahrt_min: float
+    touren: int
+
+class NichtEingeplant(BaseModel):
+    bezug: str
+    grund: str
+
+class TagesplanOut(BaseModel):
+    datum: date
+    depot: Optional[str] = None
+    fahrzeuge: List[FahrzeugPlan]
+    nicht_eingeplant: List[NichtEingeplant] = []
+    warnungen: List[str] = []
+    auftraege: int
+    eingeplant: int
+    fahrzeuge_genutzt: int
+    leerfahrt_min: float
+    iterationen: int
+    laufzeit_ms: int
+
+# Ein Plan aus TagesplanOut kann unverändert zurückgeschickt werden
+class TagesplanUebernahme(BaseModel):
+    depot: Optional[str] = None
+    fahrzeuge: List[FahrzeugZuordnung]
+
+class MehrfachtransportRouteOut(MehrfachtransportRouteCreate):
+    id: int
+    weg_min: Optional[float] = None
+    class Config:
+        orm_mode = True
+
 class MehrfachtransportOut(BaseModel):
     id: int
     name: str
@@ -63,9 +150,21 @@ class MehrfachtransportOut(BaseModel):
     gesamt_weg_min: Optional[float] = None
     fahrer_id: Optional[int] = None
     erstellt_am: datetime
+    version: int = 1
     class Config:
         orm_mode = True
 
+class MehrfachtransportAendern(BaseModel):
+    name: Optional[str] = None
+    startzeit: Optional[str] = None
+    status: Optional[str] = None
+    fahrer_id: Optional[int] = None
+    version: int  # gelesene Version, Pflicht; abweichend -> 409
+
+class MehrfachtransportDetailOut(MehrfachtransportOut):
+    routen: List[MehrfachtransportRouteOut] = []
+    transporte: List[TransportOut] = []
+
 class TransportUpdate(BaseModel):
     von: Optional[str] = None
     nach: Optional[str] = None
@@ -99,6 +198,23 @@ class SchichtOut(SchichtCreate):
     class Config:
         orm_mode = True
 
+class FahrerVorschlag(BaseModel):
+    fahrer_id: int
+    schicht_id: int
+    gebuchte_min: float
+
+# Auslastung je Fahrzeugtyp über den Zeitraum, je Tag oder je Slot (datum/zeit je nach Gruppierung)
+class AuslastungOut(BaseModel):
+    fahrzeugtyp: str
+    datum: Optional[date] = None
+    zeit: Optional[str] = None  # Slot-Beginn "08:30"
+    kapazitaet: Optional[int] = None  # anzahl_verfuegbar, None bei unbekanntem Fahrzeugtyp
+    belegte_min: float
+    fahrten: int
+    spitze: int
+    auslastung: Optional[float] = None  # belegte Minuten / (Kapazität x Minuten)
+    spitzen_auslastung: Optional[float] = None
+
 class LogbuchCreate(BaseModel):
     aktion: str
     zeitpunkt: datetime
@@ -106,9 +222,31 @@ class LogbuchCreate(BaseModel):
 
 class LogbuchOut(LogbuchCreate):
     id: int
+    benutzer_id: Optional[int] = None  # automatische Einträge ohne X-Benutzer-Id
+    tabelle: Optional[str] = None
+    datensatz_id: Optional[int] = None
+    aenderungen: Optional[str] = None  # JSON, siehe AuditOut
     class Config:
         orm_mode = True
 
+# Automatischer Audit-Eintrag; aenderungen: {feld: wert} bzw. bei "geaendert" {feld: [alt, neu]}
+class AuditOut(BaseModel):
+    id: int
+    aktion: str
+    zeitpunkt: datetime
+    benutzer_id: Optional[int] = None
+    tabelle: str
+    datensatz_id: Optional[int] = None
+    aenderungen: Dict[str, Any] = {}
+
+# Stammdaten; von/nach in Transporten, Routen und Distanzen dürfen Name oder Alias sein
+class StandortCreate(BaseModel):
+    name: str
+    aliase: List[str] = []
+
+class StandortOut(StandortCreate):
+    id: int
+
 class DistanzCreate(BaseModel):
     von: str
     nach: str
@@ -126,12 +264,26 @@ class ArchivTransportCreate(BaseModel):
     status: str
     abgeschlossen_am: datetime
     begruendung: Optional[str] = None
+    transport_id: Optional[int] = None
+    datum: Optional[date] = None
+    startzeit: Optional[str] = None
+    weg_min: Optional[float] = None
+    fahrer_id: Optional[int] = None
+    mehrfachtransport_id: Optional[int] = None
 
 class ArchivTransportOut(ArchivTransportCreate):
     id: int
     class Config:
         orm_mode = True
 
+class ArchivierungOut(BaseModel):
+    archiviert: int
+    geloescht_aus_archiv: int
+
+class ArchivMonatOut(BaseModel):
+    monat: str  # "2026-03"
+    anzahl: int
+
 class UserBase(BaseModel):
     username: str
     email: str
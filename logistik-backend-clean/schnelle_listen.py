@@ -0,0 +1,161 @@
+"""
+Schneller Pfad für große Listen (/transporte, /logbuch)
+
+Statt ORM-Objekte zu bauen und jedes einzeln durch das Pydantic-Schema zu validieren,
+werden nur die Spalten des Ausgabe-Schemas als Core-Zeilen gelesen und direkt mit
+orjson kodiert (ohne orjson mit json). Die Ausgabe entspricht dem Schema, Feld für Feld.
+Standorte kommen als von_id/nach_id aus der Datenbank und werden beim Kodieren über das
+Standort-Verzeichnis zu Namen.
+
+Exporte (NDJSON/CSV) werden gestreamt: Die Zeilen kommen mit yield_per blockweise vom
+Server-Cursor (Postgres), der Speicher bleibt auch bei sehr vielen Zeilen flach. Die
+CSV-Spalten passen zu import_transporte.py.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime
+from operator import eq, ge, lt
+from typing import Optional
+from fastapi import Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from database import SessionLocal
+from models import Transport
+from paginierung import filter_anwenden
+from standorte import standorte
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+EXPORT_BLOCK = 2000
+EXPORT_FORMATE = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+# Schema-Feld -> Spalte mit der Standort-ID
+STANDORT_FELDER = {"von": "von_id", "nach": "nach_id"}
+
+
+def transport_filter(datum: Optional[date] = None, datum_von: Optional[date] = None,
+                     datum_bis: Optional[date] = None, fahrzeugtyp: Optional[str] = None,
+                     status: Optional[str] = None, fahrer_id: Optional[int] = None,
+                     mehrfachtransport_id: Optional[int] = None):
+    """Filter für Liste und Export der Transporte (sync und async), als Depends"""
+    return [
+        (Transport.datum, eq, datum),
+        (Transport.datum, ge, datum_von),
+        (Transport.datum, lt, datum_bis),
+        (Transport.fahrzeugtyp, eq, fahrzeugtyp),
+        (Transport.status, eq, status),
+        (Transport.fahrer_id, eq, fahrer_id),
+        (Transport.mehrfachtransport_id, eq, mehrfachtransport_id),
+    ]
+
+
+def _iso(wert):
+    if isinstance(wert, (date, datetime)):
+        return wert.isoformat()
+    raise TypeError(f"Nicht serialisierbar: {type(wert).__name__}")
+
+def json_bytes(daten):
+    if orjson is not None:
+        return orjson.dumps(daten)
+    return json.dumps(daten, default=_iso, ensure_ascii=False, separators=(",", ":")).encode()
+
+def spalten(modell, schema):
+    """Spalten des Modells in der Reihenfolge der Schema-Felder (Pydantic 1 und 2)"""
+    felder = getattr(schema, "model_fields", None) or schema.__fields__
+    return [getattr(modell, STANDORT_FELDER[feld]).label(feld) if feld in STANDORT_FELDER else getattr(modell, feld)
+            for feld in felder]
+
+def abfrage(modell, schema, bedingungen):
+    """select() nur über die Spalten des Schemas, mit den gesetzten Filtern"""
+    return filter_anwenden(select(*spalten(modell, schema)), *bedingungen)
+
+def zeilen_als_dicts(zeilen):
+    """Core-Zeilen als dicts, Standort-IDs als Namen"""
+    daten = [dict(z._mapping) for z in zeilen]
+    felder = [feld for feld in STANDORT_FELDER if daten and feld in daten[0]]
+    if felder:
+        name = standorte.name
+        for d in daten:
+            for feld in felder:
+                d[feld] = name(d[feld])
+    return daten
+
+def _standort_positionen(namen):
+    return [i for i, name in enumerate(namen) if name in STANDORT_FELDER]
+
+def _namen_einsetzen(zeilen, positionen):
+    """IDs an den Positionen durch Standortnamen ersetzen (Zeilen als Listen)"""
+    name = standorte.name
+    zeilen = [list(zeile) for zeile in zeilen]
+    for zeile in zeilen:
+        for i in positionen:
+            zeile[i] = name(zeile[i])
+    return zeilen
+
+
+# -------------------- SEITEN --------------------
+def _seite(modell, schema, bedingungen, limit, after_id):
+    stmt = abfrage(modell, schema, bedingungen)
+    if after_id is not None:
+        stmt = stmt.where(modell.id > after_id)
+    return stmt.order_by(modell.id).limit(limit + 1)
+
+def _seite_antwort(zeilen, limit, umwandeln=None):
+    """
+    Wie seite_laden: Cursor für die nächste Seite im Header X-Next-Cursor
+    umwandeln(dict) -> dict: optional je Zeile, z.B. JSON-Spalten auspacken
+    """
+    kopfzeilen = {}
+    if len(zeilen) > limit:
+        zeilen = zeilen[:limit]
+        kopfzeilen["X-Next-Cursor"] = str(zeilen[-1].id)
+    daten = zeilen_als_dicts(zeilen)
+    if umwandeln is not None:
+        daten = [umwandeln(d) for d in daten]
+    return Response(json_bytes(daten), media_type="application/json", headers=kopfzeilen)
+
+def seite_antwort(db, modell, schema, bedingungen, limit, after_id, umwandeln=None):
+    return _seite_antwort(db.execute(_seite(modell, schema, bedingungen, limit, after_id)).all(), limit, umwandeln)
+
+async def seite_antwort_async(session, modell, schema, bedingungen, limit, after_id):
+    """Wie seite_antwort, für AsyncSession"""
+    return _seite_antwort((await session.execute(_seite(modell, schema, bedingungen, limit, after_id))).all(), limit)
+
+
+# -------------------- EXPORT --------------------
+def _csv_block(zeilen):
+    puffer = io.StringIO()
+    csv.writer(puffer).writerows(zeilen)
+    return puffer.getvalue()
+
+def export_zeilen(stmt, format, session_fabrik=SessionLocal):
+    """
+    Generator über die kodierten Blöcke
+    Eigene Session: der Stream läuft noch, wenn der Request-Handler längst zurück ist
+    """
+    db = session_fabrik()
+    try:
+        ergebnis = db.execute(stmt.execution_options(yield_per=EXPORT_BLOCK))
+        namen = list(ergebnis.keys())
+        positionen = _standort_positionen(namen)
+        if format == "csv":
+            yield _csv_block([namen])
+        for block in ergebnis.partitions():
+            if positionen:
+                block = _namen_einsetzen(block, positionen)
+            if format == "csv":
+                yield _csv_block(block)
+            else:
+                yield b"".join(json_bytes(dict(zip(namen, zeile))) + b"\n" for zeile in block)
+    finally:
+        db.close()
+
+def export_antwort(modell, schema, bedingungen, format, dateiname):
+    stmt = abfrage(modell, schema, bedingungen).order_by(modell.id)
+    return StreamingResponse(
+        export_zeilen(stmt, format), media_type=EXPORT_FORMATE[format],
+        headers={"Content-Disposition": f'attachment; filename="{dateiname}.{format}"'},
+    )
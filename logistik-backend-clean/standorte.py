@@ -0,0 +1,182 @@
+"""
+Standort-Stammdaten: Namen und Aliase -> Standort-ID
+
+Transporte, Routen, Distanzen und Archiv speichern Standorte nur als ID (von_id/nach_id).
+Die API nimmt und liefert weiter Namen; aufgelöst wird einmal an der Grenze über das
+Verzeichnis in diesem Modul. Es hält alle Standorte im Speicher, die Namen per sys.intern
+(alle Zeilen verweisen auf dasselbe String-Objekt). Unbekannte Namen sind ein Fehler,
+ein Tippfehler wie "Hale 1" wird so kein neuer Standort ohne Strecken. Angelegt wird nur
+über POST /standorte und den Distanz-Import (aufloesen(..., anlegen=True)).
+
+Jeder Worker hält sein eigenes Verzeichnis. Anlegen und Umbenennen erhöhen in derselben
+Transaktion den Stand "standorte" in cache_staende (cache_stand.py); verzeichnis_pruefen()
+vergleicht ihn zu Beginn jeder Anfrage und lädt bei einem neueren Stand nach. Die
+Namens-Properties der Modelle lesen danach nur noch aus dem Speicher.
+
+Schreibweisen werden normalisiert: Leerzeichen am Rand entfernt, mehrfache Leerzeichen
+zusammengefasst, Groß-/Kleinschreibung egal. "Halle 3 " und "halle  3" sind derselbe
+Standort; weitere Namen (Kürzel, alte Bezeichnungen) stehen in standort_aliase.
+"""
+import hashlib
+import logging
+import re
+import sys
+import threading
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from database import engine
+import cache_stand
+
+logger = logging.getLogger("logistik.standorte")
+
+_LEERRAUM = re.compile(r"\s+")
+
+
+def name_normalisieren(name):
+    """Anzeigename: ohne Leerzeichen am Rand, innen einfach"""
+    return _LEERRAUM.sub(" ", name).strip()
+
+def schluessel(name):
+    """Vergleichsschlüssel für Namen und Aliase"""
+    return name_normalisieren(name).casefold()
+
+
+class StandortVerzeichnis:
+    """
+    Prozessweites Verzeichnis: Schlüssel (Name oder Alias) -> ID und ID -> Name
+    Lesen ohne Lock, laden() ersetzt beide Dicts als Ganzes
+    """
+
+    def __init__(self, bind=None):
+        self._bind = bind
+        self._lock = threading.Lock()
+        self._ids = {}
+        self._namen = {}
+        self._geladen = False
+        self._db_stand = None
+        self.pruefsumme = hashlib.sha1().hexdigest()
+
+    @property
+    def geladen(self):
+        return self._geladen
+
+    def laden(self):
+        """Alle Standorte und Aliase mit zwei Abfragen"""
+        from models import Standort, StandortAlias
+        with (self._bind or engine).connect() as conn:
+            db_stand = cache_stand.lesen(conn, cache_stand.STANDORTE)
+            standorte = conn.execute(select(Standort.id, Standort.name, Standort.schluessel)).all()
+            aliase = conn.execute(select(StandortAlias.schluessel, StandortAlias.standort_id)).all()
+        namen = {id: sys.intern(name) for id, name, _ in standorte}
+        ids = {sys.intern(s): standort_id for s, standort_id in aliase}
+        ids.update((sys.intern(s), id) for id, _, s in standorte)
+        h = hashlib.sha1()
+        for id in sorted(namen):
+            h.update(f"{id}\x1f{namen[id]}\x1e".encode())
+        with self._lock:
+            if self._db_stand is not None and db_stand < self._db_stand:
+                return  # ein paralleler Aufruf hat schon einen neueren Stand geladen
+            self._namen = namen
+            self._ids = ids
+            self.pruefsumme = h.hexdigest()
+            self._db_stand = db_stand
+            self._geladen = True
+
+    def sicherstellen(self):
+        """Lädt nach, falls noch leer oder Standorte inzwischen angelegt/umbenannt wurden (auch von anderen Workern)"""
+        with (self._bind or engine).connect() as conn:
+            db_stand = cache_stand.lesen(conn, cache_stand.STANDORTE)
+        if not self._geladen or self._db_stand is None or self._db_stand < db_stand:
+            self.laden()
+
+    def _erstmals_laden(self):
+        """Nur ein leeres Verzeichnis laden; ob es aktuell ist, prüft verzeichnis_pruefen() je Anfrage"""
+        if not self._geladen:
+            self.laden()
+
+    # -------------------- ABFRAGE --------------------
+    def name(self, id):
+        """Anzeigename zur ID aus dem Speicher; nachgeladen wird an der Request-Grenze, hier nur ein leeres Verzeichnis"""
+        if id is None:
+            return None
+        self._erstmals_laden()
+        return self._namen.get(id)
+
+    def finden(self, name):
+        """ID zum Namen oder Alias, None wenn unbekannt; legt nichts an"""
+        self._erstmals_laden()
+        return self._ids.get(schluessel(name))
+
+    def bekannt(self, *namen):
+        """True, wenn aufloesen() ohne Datenbank auskommt"""
+        ids = self._ids
+        return self._geladen and all(n is None or schluessel(n) in ids for n in namen)
+
+    def aufloesen(self, *namen, anlegen=False, nachladen=True):
+        """
+        IDs zu den Namen in derselben Reihenfolge, None bleibt None
+        Leerer oder unbekannter Name -> ValueError; vorher wird einmal neu geladen (nachladen),
+        der Standort kann gerade in einem anderen Worker angelegt worden sein
+        anlegen=True: unbekannte Standorte gemeinsam anlegen (nur Distanz-Import)
+        """
+        self._erstmals_laden()
+        schluessel_liste = [None if n is None else schluessel(n) for n in namen]
+        if "" in schluessel_liste:
+            raise ValueError("Standort ohne Namen")
+        fehlend = self._fehlend(schluessel_liste, namen)
+        if fehlend and anlegen:
+            self._anlegen(fehlend)
+        elif fehlend and nachladen:
+            self.laden()
+            fehlend = self._fehlend(schluessel_liste, namen)
+        if fehlend and not anlegen:
+            raise ValueError(f"Unbekannter Standort: {', '.join(fehlend.values())}")
+        ids = self._ids
+        return tuple(None if s is None else ids[s] for s in schluessel_liste)
+
+    def _fehlend(self, schluessel_liste, namen):
+        ids = self._ids
+        return {s: name_normalisieren(n) for s, n in zip(schluessel_liste, namen)
+                if s is not None and s not in ids}
+
+    # -------------------- ANLEGEN --------------------
+    def _anlegen(self, fehlend):
+        """
+        Eigene kurze Transaktion: ein neuer Standort bleibt auch bei einem Rollback des
+        Aufrufers bestehen. Legt ein anderer Worker denselben Namen gleichzeitig an,
+        gewinnt der erste (Unique-Index auf schluessel), danach wird neu geladen.
+        """
+        from models import Standort, StandortAlias
+        for versuch in range(2):
+            try:
+                with (self._bind or engine).begin() as conn:
+                    vorhanden = set(conn.scalars(select(Standort.schluessel).where(
+                        Standort.schluessel.in_(list(fehlend)))))
+                    vorhanden.update(conn.scalars(select(StandortAlias.schluessel).where(
+                        StandortAlias.schluessel.in_(list(fehlend)))))
+                    neu = [{"name": name, "schluessel": s} for s, name in fehlend.items() if s not in vorhanden]
+                    if neu:
+                        conn.execute(insert(Standort), neu)
+                        cache_stand.erhoehen(conn, cache_stand.STANDORTE)
+                break
+            except IntegrityError:
+                if versuch:
+                    raise
+        self.laden()
+
+    def __len__(self):
+        return len(self._namen)
+
+
+standorte = StandortVerzeichnis()
+
+
+def verzeichnis_pruefen():
+    """
+    FastAPI-Abhängigkeit der Router (main.py, async_routen.py): vor Auflösen und Serialisieren
+    nachladen, im Threadpool statt im Event-Loop. Ohne DB antworten /metrics & Co. trotzdem.
+    """
+    try:
+        standorte.sicherstellen()
+    except SQLAlchemyError:
+        logger.warning("Stand der Standorte nicht lesbar, Verzeichnis bleibt wie geladen", exc_info=True)
@@ -0,0 +1,236 @@
+"""
+Nebenläufigkeits-Stresstest für Buchungen
+
+Startet die API per uvicorn und feuert viele parallele Buchungen auf wenige Slots
+eines Fahrzeugtyps mit kleiner Kapazität, verteilt über mehrere Tage. Danach wird
+geprüft, dass kein Slot überbucht ist und genau so viele Buchungen angenommen
+wurden, wie Fahrzeuge da sind. Zusätzlich ändern viele parallele PUTs denselben
+Transport mit derselben Version: genau einer darf gewinnen, alle anderen bekommen 409.
+Zuletzt verlängert ein PUT mit neuer Strecke eine Fahrt in die Slots, um die danach
+parallel gebucht wird; die neue Dauer muss gespeichert sein und zählen.
+
+Standard ist eine frische SQLite-Datei im Temp-Verzeichnis. Mit --db postgresql://...
+läuft der Test gegen eine leere Test-Datenbank: der Server migriert sie beim Start
+(SCHEMA_MIGRIEREN=1), Fahrzeugtyp "Stresstest", die Standorte und die Strecke bleiben
+danach stehen, nur die Transporte ab 01.02.2030 werden wieder gelöscht.
+Mehrere Worker (--workers) nur mit --db postgresql://...: die lokale Sperre gilt pro Prozess.
+
+Aufruf: python stresstest_buchungen.py [buchungen] [parallel] [--workers N] [--db URL]
+Benötigt: uvicorn, httpx
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+import httpx
+
+PORT = 8766
+VERZEICHNIS = os.path.dirname(os.path.abspath(__file__))
+BASIS_URL = f"http://127.0.0.1:{PORT}"
+FAHRZEUGTYP = "Stresstest"
+KAPAZITAET = 3
+TAGE = [date(2030, 2, 1) + timedelta(days=i) for i in range(4)]
+STARTZEITEN = ["08:00", "08:30", "09:00", "09:30"]
+# Tage für die PUT-Prüfungen, nach den Buchungstagen
+VERSIONEN_TAG = TAGE[-1] + timedelta(days=1)
+ROUTEN_TAG = TAGE[-1] + timedelta(days=2)
+# Strecke Stresstest A -> Stresstest C, 08:00 + 200 min reicht bis 11:20
+LANGE_STRECKE_MIN = 200.0
+
+
+def server_starten(workers, env):
+    prozess = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(PORT), "--log-level", "warning",
+         "--workers", str(workers)],
+        cwd=VERZEICHNIS, env=dict(env, ARCHIV_INTERVALL_MIN="0", SCHEMA_MIGRIEREN="1"),
+    )
+    for _ in range(150):
+        try:
+            httpx.get(BASIS_URL + "/", timeout=1)
+            return prozess
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    prozess.terminate()
+    raise RuntimeError("API-Server ist nicht gestartet")
+
+async def parallel_ausfuehren(anfragen, parallel):
+    semaphore = asyncio.Semaphore(parallel)
+
+    async def eine(anfrage):
+        async with semaphore:
+            return await anfrage()
+
+    return await asyncio.gather(*(eine(a) for a in anfragen))
+
+async def alle_transporte(client, datum):
+    transporte = []
+    after_id = None
+    while True:
+        params = {"fahrzeugtyp": FAHRZEUGTYP, "datum": str(datum), "limit": 1000}
+        if after_id is not None:
+            params["after_id"] = after_id
+        antwort = await client.get("/transporte", params=params)
+        transporte += antwort.json()
+        after_id = antwort.headers.get("X-Next-Cursor")
+        if not after_id:
+            return transporte
+
+def max_belegung(transporte):
+    """Höchste Belegung eines Slots, gerechnet wie in der API"""
+    from verfuegbarkeit import Zeitleiste  # importiert database.py, erst nach dem Setzen von DATABASE_URL
+    zeitleiste = Zeitleiste(KAPAZITAET)
+    for t in transporte:
+        zeitleiste.buchung_hinzufuegen(t["startzeit"], t["weg_min"])
+    return max(zeitleiste.belegung_pro_slot())
+
+async def buchungen_pruefen(client, anzahl, parallel):
+    def buchung(i):
+        datum = TAGE[i % len(TAGE)]
+        startzeit = STARTZEITEN[(i // len(TAGE)) % len(STARTZEITEN)]
+        return lambda: client.post("/transporte", json={
+            # Ohne Distanz belegt jede Fahrt genau ihren Startslot
+            "von": "Stresstest A", "nach": "Stresstest B", "fahrzeugtyp": FAHRZEUGTYP,
+            "datum": str(datum), "startzeit": startzeit, "zeitfenster": f"{datum}T{startzeit}:00",
+        })
+
+    start = time.perf_counter()
+    antworten = await parallel_ausfuehren([buchung(i) for i in range(anzahl)], parallel)
+    dauer = time.perf_counter() - start
+    status = [a.status_code for a in antworten]
+
+    belegung = max([max_belegung(await alle_transporte(client, datum)) for datum in TAGE])
+
+    erwartet = 0
+    for datum_index in range(len(TAGE)):
+        for zeit_index in range(len(STARTZEITEN)):
+            anfragen = sum(1 for i in range(anzahl)
+                           if i % len(TAGE) == datum_index and (i // len(TAGE)) % len(STARTZEITEN) == zeit_index)
+            erwartet += min(anfragen, KAPAZITAET)
+    return {
+        "buchungen": anzahl,
+        "angenommen": status.count(200),
+        "abgelehnt_409": status.count(409),
+        "sonstige_fehler": len(status) - status.count(200) - status.count(409),
+        "erwartet_angenommen": erwartet,
+        "max_belegung": belegung,
+        "kapazitaet": KAPAZITAET,
+        "req_pro_s": round(anzahl / dauer, 1),
+        "ok": belegung <= KAPAZITAET and status.count(200) == erwartet,
+    }
+
+async def versionen_pruefen(client, anzahl, parallel):
+    datum = VERSIONEN_TAG
+    basis = {"von": "Stresstest A", "nach": "Stresstest B", "fahrzeugtyp": FAHRZEUGTYP,
+             "datum": str(datum), "startzeit": "12:00", "zeitfenster": f"{datum}T12:00:00"}
+    transport = (await client.post("/transporte", json=basis)).json()
+
+    def aenderung(i):
+        return lambda: client.put(f"/transporte/{transport['id']}", json={
+            **basis, "begruendung": f"Änderung {i}", "version": transport["version"],
+        })
+
+    antworten = await parallel_ausfuehren([aenderung(i) for i in range(anzahl)], parallel)
+    status = [a.status_code for a in antworten]
+    return {
+        "aenderungen": anzahl,
+        "erfolgreich": status.count(200),
+        "konflikt_409": status.count(409),
+        "ok": status.count(200) == 1 and status.count(409) == anzahl - 1,
+    }
+
+async def strecke_aendern_pruefen(client, parallel):
+    """Alle Fahrzeuge um 08:00 belegt, eine Fahrt bekommt per PUT die lange Strecke, dann um 09:00 buchen"""
+    datum = ROUTEN_TAG
+
+    def fahrt(nach, startzeit):
+        return {"von": "Stresstest A", "nach": nach, "fahrzeugtyp": FAHRZEUGTYP,
+                "datum": str(datum), "startzeit": startzeit, "zeitfenster": f"{datum}T{startzeit}:00"}
+
+    transporte = [(await client.post("/transporte", json=fahrt("Stresstest B", "08:00"))).json()
+                  for _ in range(KAPAZITAET)]
+    geaendert = await client.put(f"/transporte/{transporte[0]['id']}", json={
+        **fahrt("Stresstest C", "08:00"), "version": transporte[0]["version"],
+    })
+    antworten = await parallel_ausfuehren(
+        [lambda: client.post("/transporte", json=fahrt("Stresstest B", "09:00")) for _ in range(KAPAZITAET)],
+        parallel)
+    status = [a.status_code for a in antworten]
+
+    belegung = max_belegung(await alle_transporte(client, datum))
+    weg_min = geaendert.json().get("weg_min") if geaendert.status_code == 200 else None
+    return {
+        "put_status": geaendert.status_code,
+        "weg_min_gespeichert": weg_min,
+        "weg_min_erwartet": LANGE_STRECKE_MIN,
+        "angenommen_0900": status.count(200),
+        "erwartet_angenommen_0900": KAPAZITAET - 1,
+        "max_belegung": belegung,
+        "ok": (weg_min == LANGE_STRECKE_MIN and status.count(200) == KAPAZITAET - 1
+               and belegung <= KAPAZITAET),
+    }
+
+async def aufraeumen(client):
+    for datum in TAGE + [VERSIONEN_TAG, ROUTEN_TAG]:
+        for t in await alle_transporte(client, datum):
+            await client.delete(f"/transporte/{t['id']}")
+
+async def stresstest(anzahl, parallel, workers, env):
+    prozess = server_starten(workers, env)
+    try:
+        async with httpx.AsyncClient(base_url=BASIS_URL, timeout=60) as client:
+            # Doppelter Name wäre ein 500 und schließt die Verbindung, bei wiederverwendeter DB nur einmal anlegen
+            typen = (await client.get("/fahrzeugtypen", params={"limit": 1000})).json()
+            if FAHRZEUGTYP not in {t["name"] for t in typen}:
+                await client.post("/fahrzeugtypen", json={"name": FAHRZEUGTYP, "anzahl_verfuegbar": KAPAZITAET})
+            # Buchungen legen keine Standorte an; 409, wenn es sie schon gibt
+            for name in ("Stresstest A", "Stresstest B", "Stresstest C"):
+                await client.post("/standorte", json={"name": name})
+            strecke = {"von": "Stresstest A", "nach": "Stresstest C", "weg_min": LANGE_STRECKE_MIN}
+            if (await client.post("/distanzmatrix", json=strecke)).status_code == 409:
+                for d in (await client.get("/distanzmatrix", params={"von": "Stresstest A",
+                                                                     "nach": "Stresstest C"})).json():
+                    await client.put(f"/distanzmatrix/{d['id']}", json=strecke)
+            await aufraeumen(client)
+            try:
+                return {
+                    "workers": workers,
+                    "parallel": parallel,
+                    "buchungen": await buchungen_pruefen(client, anzahl, parallel),
+                    "versionen": await versionen_pruefen(client, max(parallel, 20), parallel),
+                    "strecke_aendern": await strecke_aendern_pruefen(client, parallel),
+                }
+            finally:
+                await aufraeumen(client)
+    finally:
+        prozess.terminate()
+        prozess.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description="Nebenläufigkeits-Stresstest für Buchungen")
+    parser.add_argument("buchungen", type=int, nargs="?", default=500)
+    parser.add_argument("parallel", type=int, nargs="?", default=100)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--db", help="Datenbank-URL einer Test-DB, Standard: frische SQLite-Datei im Temp-Verzeichnis")
+    args = parser.parse_args()
+    if args.workers > 1 and not (args.db or "").startswith("postgresql"):
+        parser.error("--workers > 1 nur mit --db postgresql://..., die SQLite-Sperre gilt pro Prozess")
+
+    arbeitsverzeichnis = tempfile.mkdtemp(prefix="logistik-stresstest-")
+    url = args.db or f"sqlite:///{os.path.join(arbeitsverzeichnis, 'stresstest.db')}"
+    # Vor dem Import von verfuegbarkeit.py setzen: die Engine wird beim Import von database.py angelegt
+    os.environ["DATABASE_URL"] = url
+    os.environ["WEGENETZ_DATEI"] = os.path.join(arbeitsverzeichnis, "wegenetz.npz")
+    sys.path.insert(0, VERZEICHNIS)
+
+    ergebnis = asyncio.run(stresstest(args.buchungen, args.parallel, args.workers, dict(os.environ)))
+    print(json.dumps(ergebnis, indent=2, ensure_ascii=False))
+    ok = all(ergebnis[teil]["ok"] for teil in ("buchungen", "versionen", "strecke_aendern"))
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
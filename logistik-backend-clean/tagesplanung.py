@@ -0,0 +1,611 @@
+"""
+Tagesplanung der Flotte: offene Transporte eines Tages auf die Fahrzeuge verteilen
+
+Jeder offene Transport ist ein Auftrag von 'von' nach 'nach' (Fahrzeit aus dem Distanznetz).
+Orte sind dabei Standort-IDs, Namen gibt es erst im fertigen Plan.
+Frühester Beginn ist die gebuchte Startzeit, am zeitfenster muss das Fahrzeug spätestens am
+Ziel sein. Pro Fahrzeugtyp stehen anzahl_verfuegbar gleiche Fahrzeuge bereit, zwischen zwei
+Aufträgen fährt ein Fahrzeug leer vom Ziel des einen zum Start des nächsten. Gesucht ist
+eine Zuordnung mit möglichst vielen eingeplanten Aufträgen, dann möglichst wenig Fahrzeugen
+und Leerfahrten (VRPTW):
+
+  1. Konstruktion: Aufträge nach Frist sortiert an der günstigsten zulässigen Stelle einfügen
+  2. Lokale Suche: Aufträge verschieben (Relocate), Routenenden tauschen (2-opt*)
+  3. Ruin & Recreate: zeitlich benachbarte Aufträge herausnehmen und neu einfügen, solange
+     das Zeitbudget reicht; übernommen wird nur, was nicht schlechter ist
+
+Je Route werden früheste Startzeiten vorwärts und späteste Startzeiten rückwärts gehalten,
+damit ist jede Einfügung in O(1) prüfbar. Bestehende Buchungen des Tages (Touren, Transporte
+mit Fahrer oder anderem Status) sind feste Aufträge: Sie belegen ein Fahrzeug zu ihrer Zeit,
+können den Fahrzeugen aber beliebig zugeordnet werden, weil die Fahrzeuge gleich sind.
+"""
+import math
+import random
+import time
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import datetime, time as uhrzeit
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+from models import Transport, Mehrfachtransport, MehrfachtransportRoute, Fahrzeugtyp
+from distanz_cache import distanz_cache
+from standorte import standorte
+from tourenoptimierung import distanz_array
+from verfuegbarkeit import TAG_MIN, MINDEST_DAUER_MIN, intervall, zeit_zu_minuten, minuten_zu_zeit, slot_bereich, zeitleiste_laden
+from reservierung import ALLE_SLOTS, slots_gesperrt
+
+FAHRZEUG_KOSTEN_MIN = 30.0
+RUIN_ANTEIL = 0.15
+ROUTE_AUFLOESEN_ALLE = 5  # jede n-te Ruin-Runde löst eine ganze Route auf
+# Wartet ein Fahrzeug so lange, beginnt danach eine neue Tour (das Fahrzeug ist dazwischen frei)
+TOUR_TRENNEN_AB_MIN = 60
+EPS = 1e-9
+
+# von/nach: Standort-IDs; frueh/spaet: frühester/spätester Beginn in Minuten ab Mitternacht, dauer in ganzen Minuten
+Auftrag = namedtuple("Auftrag", "bezug von nach frueh spaet dauer fest version", defaults=(False, None))
+
+
+class Planer:
+    """Routen der Fahrzeuge eines Fahrzeugtyps; Aufträge sind Indizes in self.auftraege"""
+
+    def __init__(self, auftraege, fahrzeuge, depot=None, fahrzeug_kosten_min=FAHRZEUG_KOSTEN_MIN, seed=0):
+        self.auftraege = auftraege
+        self.depot = depot
+        self.fahrzeug_kosten = fahrzeug_kosten_min
+        self.zufall = random.Random(seed)
+        orte = list(dict.fromkeys([a.von for a in auftraege] + [a.nach for a in auftraege]
+                                  + ([depot] if depot else [])))
+        index = {ort: i for i, ort in enumerate(orte)}
+        distanzen, _ = distanz_array(orte)
+        fahrzeiten = np.ceil(distanzen).astype(np.int64)
+        von = [index[a.von] for a in auftraege]
+        nach = [index[a.nach] for a in auftraege]
+        # Leerfahrt von Auftrag i zu Auftrag j: Ziel von i -> Start von j
+        self.leer = fahrzeiten[np.ix_(nach, von)].tolist()
+        if depot:
+            self.ab_depot = fahrzeiten[index[depot], von].tolist()
+            self.zum_depot = fahrzeiten[nach, index[depot]].tolist()
+        else:
+            self.ab_depot = [0] * len(auftraege)
+            self.zum_depot = [0] * len(auftraege)
+        self.frueh = [a.frueh for a in auftraege]
+        self.spaet = [a.spaet for a in auftraege]
+        self.dauer = [a.dauer for a in auftraege]
+        self.fest = [a.fest for a in auftraege]
+
+        self.routen = [[] for _ in range(fahrzeuge)]
+        self.beginn = [[] for _ in range(fahrzeuge)]
+        self.ende = [[] for _ in range(fahrzeuge)]
+        self.spaetest = [[] for _ in range(fahrzeuge)]
+        self.weg_bis = [[] for _ in range(fahrzeuge)]   # Leerfahrt bis zum Auftrag an Position k
+        self.wege = [0] * fahrzeuge                      # Leerfahrt der ganzen Route
+        self.kosten = [0.0] * fahrzeuge
+        self.route_von = [None] * len(auftraege)
+        self.offen = []
+        self.iterationen = 0
+
+    # -------------------- ROUTEN --------------------
+    def aktualisieren(self, r):
+        """Zeiten und Kosten einer Route neu berechnen, False wenn ein Zeitfenster verletzt ist"""
+        route = self.routen[r]
+        beginn, ende, weg_bis = [], [], []
+        zeit, weg, vorher = 0, 0, None
+        zulaessig = True
+        for j in route:
+            anfahrt = self.ab_depot[j] if vorher is None else self.leer[vorher][j]
+            weg += anfahrt
+            start = max(self.frueh[j], zeit + anfahrt)
+            if start > self.spaet[j]:
+                zulaessig = False
+            zeit = start + self.dauer[j]
+            beginn.append(start)
+            ende.append(zeit)
+            weg_bis.append(weg)
+            self.route_von[j] = r
+            vorher = j
+        spaetest = [0] * len(route)
+        for k in range(len(route) - 1, -1, -1):
+            j = route[k]
+            spaetest[k] = self.spaet[j]
+            if k + 1 < len(route):
+                spaetest[k] = min(spaetest[k], spaetest[k + 1] - self.dauer[j] - self.leer[j][route[k + 1]])
+        self.beginn[r], self.ende[r], self.weg_bis[r], self.spaetest[r] = beginn, ende, weg_bis, spaetest
+        self.wege[r] = weg + self.zum_depot[vorher] if route else 0
+        self.kosten[r] = self.wege[r] + self.fahrzeug_kosten if route else 0.0
+        return zulaessig
+
+    def ziel(self):
+        """Kleiner ist besser: erst nicht eingeplante Aufträge, dann Fahrzeuge und Leerfahrten"""
+        return len(self.offen), sum(self.kosten)
+
+    def beste_stelle(self, j):
+        """(Mehrkosten, Route, Position) der günstigsten zulässigen Einfügung oder None"""
+        frueh, spaet, dauer = self.frueh[j], self.spaet[j], self.dauer[j]
+        beste = None
+        leere_geprueft = False
+        for r, route in enumerate(self.routen):
+            if not route:
+                # Alle leeren Fahrzeuge sind gleich, eins prüfen reicht
+                if leere_geprueft:
+                    continue
+                leere_geprueft = True
+                start = max(frueh, self.ab_depot[j])
+                if start <= spaet:
+                    kosten = self.ab_depot[j] + self.zum_depot[j] + self.fahrzeug_kosten
+                    if beste is None or kosten < beste[0]:
+                        beste = (kosten, r, 0)
+                continue
+            ende, spaetest = self.ende[r], self.spaetest[r]
+            n = len(route)
+            # Vor Position p geht nur, wenn der Nachfolger nach frueh + dauer noch anfangen kann
+            for p in range(bisect_left(spaetest, frueh + dauer), n + 1):
+                if p:
+                    v = route[p - 1]
+                    if ende[p - 1] > spaet:
+                        break
+                    anfahrt = self.leer[v][j]
+                    start = max(frueh, ende[p - 1] + anfahrt)
+                else:
+                    anfahrt = self.ab_depot[j]
+                    start = max(frueh, anfahrt)
+                if start > spaet:
+                    continue
+                if p < n:
+                    w = route[p]
+                    if start + dauer + self.leer[j][w] > spaetest[p]:
+                        continue
+                    kosten = anfahrt + self.leer[j][w] - (self.leer[v][w] if p else self.ab_depot[w])
+                else:
+                    kosten = anfahrt + self.zum_depot[j] - self.zum_depot[v]
+                if beste is None or kosten < beste[0]:
+                    beste = (kosten, r, p)
+        return beste
+
+    def einfuegen(self, j, r, p):
+        self.routen[r].insert(p, j)
+        self.aktualisieren(r)
+
+    def entfernen(self, j):
+        r = self.route_von[j]
+        self.routen[r].remove(j)
+        self.route_von[j] = None
+        return self.aktualisieren(r)
+
+    # -------------------- KONSTRUKTION --------------------
+    def einplanen(self, auftraege):
+        """Nacheinander an der günstigsten Stelle einfügen, was nicht passt bleibt offen"""
+        for j in auftraege:
+            stelle = self.beste_stelle(j)
+            if stelle is None:
+                self.offen.append(j)
+            else:
+                self.einfuegen(j, stelle[1], stelle[2])
+
+    def konstruieren(self):
+        """Feste Aufträge zuerst (sie haben keinen Spielraum), dann nach Frist"""
+        reihenfolge = sorted(range(len(self.auftraege)),
+                             key=lambda j: (not self.fest[j], self.spaet[j], self.frueh[j]))
+        self.einplanen(reihenfolge)
+
+    # -------------------- LOKALE SUCHE --------------------
+    def verschieben(self, j):
+        """Auftrag an die beste Stelle (auch in einer anderen Route) verschieben, True bei Verbesserung"""
+        r = self.route_von[j]
+        k = self.routen[r].index(j)
+        vorher = self.kosten[r]
+        if self.entfernen(j):
+            stelle = self.beste_stelle(j)
+            if stelle is not None and stelle[0] < vorher - self.kosten[r] - EPS:
+                self.einfuegen(j, stelle[1], stelle[2])
+                return True
+        self.einfuegen(j, r, k)
+        return False
+
+    def _ende_tauschen(self, r1, r2):
+        """Erste verbessernde 2-opt*-Verbindung zweier Routen anwenden (Routenenden tauschen)"""
+        route1, route2 = self.routen[r1], self.routen[r2]
+        n1, n2 = len(route1), len(route2)
+        ende1, ende2 = self.ende[r1], self.ende[r2]
+        spaet1, spaet2 = self.spaetest[r1], self.spaetest[r2]
+        bis1, bis2 = self.weg_bis[r1], self.weg_bis[r2]
+        wege1, wege2 = self.wege[r1], self.wege[r2]
+        vorher = self.kosten[r1] + self.kosten[r2]
+        for i in range(-1, n1):
+            a = route1[i] if i >= 0 else None
+            zeit_a = ende1[i] if i >= 0 else 0
+            weg_a = bis1[i] if i >= 0 else 0
+            d = route1[i + 1] if i + 1 < n1 else None
+            rest1 = wege1 - bis1[i + 1] if d is not None else 0
+            # Nachfolger b = route2[j+1] muss nach a noch beginnen können,
+            # Vorgänger c = route2[j] muss vor d fertig sein
+            erstes = max(bisect_left(spaet2, zeit_a) - 1, -1)
+            letztes = bisect_right(ende2, spaet1[i + 1]) - 1 if d is not None else n2 - 1
+            for j in range(erstes, letztes + 1):
+                if (i == -1 and j == -1) or (i == n1 - 1 and j == n2 - 1):
+                    continue
+                c = route2[j] if j >= 0 else None
+                b = route2[j + 1] if j + 1 < n2 else None
+                if b is not None:
+                    anfahrt = self.leer[a][b] if a is not None else self.ab_depot[b]
+                    if max(self.frueh[b], zeit_a + anfahrt) > spaet2[j + 1]:
+                        continue
+                    neu1 = weg_a + anfahrt + wege2 - bis2[j + 1]
+                else:
+                    neu1 = weg_a + (self.zum_depot[a] if a is not None else 0)
+                if d is not None:
+                    anfahrt = self.leer[c][d] if c is not None else self.ab_depot[d]
+                    if max(self.frueh[d], (ende2[j] if j >= 0 else 0) + anfahrt) > spaet1[i + 1]:
+                        continue
+                    neu2 = (bis2[j] if j >= 0 else 0) + anfahrt + rest1
+                else:
+                    neu2 = (bis2[j] if j >= 0 else 0) + (self.zum_depot[c] if c is not None else 0)
+                genutzt = (i >= 0 or b is not None) + (j >= 0 or d is not None)
+                if neu1 + neu2 + genutzt * self.fahrzeug_kosten < vorher - EPS:
+                    self.routen[r1] = route1[:i + 1] + route2[j + 1:]
+                    self.routen[r2] = route2[:j + 1] + route1[i + 1:]
+                    self.aktualisieren(r1)
+                    self.aktualisieren(r2)
+                    return True
+        return False
+
+    def enden_tauschen(self, frist):
+        verbessert = False
+        for r1 in range(len(self.routen)):
+            for r2 in range(r1 + 1, len(self.routen)):
+                if time.perf_counter() > frist:
+                    return verbessert
+                while self.routen[r1] and self.routen[r2] and self._ende_tauschen(r1, r2):
+                    verbessert = True
+        return verbessert
+
+    def offene_einplanen(self):
+        offen, self.offen = self.offen, []
+        self.einplanen(offen)
+        return len(self.offen) < len(offen)
+
+    def lokale_suche(self, frist):
+        verbessert = True
+        while verbessert and time.perf_counter() < frist:
+            verbessert = False
+            eingeplant = [j for j in range(len(self.auftraege)) if self.route_von[j] is not None]
+            self.zufall.shuffle(eingeplant)
+            for j in eingeplant:
+                if time.perf_counter() > frist:
+                    return
+                verbessert |= self.verschieben(j)
+            verbessert |= self.enden_tauschen(frist)
+            verbessert |= self.offene_einplanen()
+
+    # -------------------- RUIN & RECREATE --------------------
+    def _zustand(self):
+        return [list(route) for route in self.routen], list(self.offen)
+
+    def _zuruecksetzen(self, zustand):
+        routen, self.offen = zustand
+        for j in self.offen:
+            self.route_von[j] = None
+        for r, route in enumerate(routen):
+            self.routen[r] = route
+            self.aktualisieren(r)
+
+    def ruin_recreate(self):
+        """Zeitlich benachbarte Aufträge neu einplanen; True wenn das Ergebnis nicht schlechter ist"""
+        kandidaten = [j for j in range(len(self.auftraege)) if not self.fest[j] and self.route_von[j] is not None]
+        if len(kandidaten) < 2:
+            return False
+        vorher = self.ziel()
+        zustand = self._zustand()
+        if self.iterationen % ROUTE_AUFLOESEN_ALLE == 0:
+            # Eine kurze Route ganz auflösen, sonst sinkt die Zahl der Fahrzeuge kaum
+            genutzt = [r for r, route in enumerate(self.routen) if any(not self.fest[j] for j in route)]
+            genutzt.sort(key=lambda r: len(self.routen[r]) + self.zufall.random() * 3)
+            entfernt = [j for j in self.routen[genutzt[0]] if not self.fest[j]]
+        else:
+            zentrum = self.zufall.choice(kandidaten)
+            anzahl = max(2, int(len(kandidaten) * RUIN_ANTEIL))
+            kandidaten.sort(key=lambda j: abs(self.frueh[j] - self.frueh[zentrum]) + self.leer[zentrum][j]
+                            + self.zufall.random() * TOUR_TRENNEN_AB_MIN)
+            entfernt = kandidaten[:anzahl]
+        zulaessig = True
+        for j in entfernt:
+            zulaessig &= self.entfernen(j)
+        if zulaessig:
+            neu = entfernt + self.offen
+            self.offen = []
+            neu.sort(key=lambda j: self.spaet[j] + self.zufall.random() * TOUR_TRENNEN_AB_MIN)
+            self.einplanen(neu)
+        nachher = self.ziel()
+        if not zulaessig or (nachher[0], nachher[1] - EPS) > vorher:
+            self._zuruecksetzen(zustand)
+            return False
+        return True
+
+    def loesen(self, zeitbudget_ms):
+        frist = time.perf_counter() + zeitbudget_ms / 1000
+        self.konstruieren()
+        self.lokale_suche(frist)
+        while time.perf_counter() < frist:
+            self.iterationen += 1
+            vorher = self.ziel()
+            if self.ruin_recreate() and self.ziel() < vorher:
+                self.lokale_suche(frist)
+        return self
+
+    # -------------------- ERGEBNIS --------------------
+    def touren(self, r):
+        """
+        Plan eines Fahrzeugs als Touren: (beginn, ende, [(von, nach)], [Auftrags-Indizes])
+        Feste Aufträge und lange Wartezeiten trennen die Touren. Die Leerfahrt zu einem Auftrag
+        gehört zu dessen Tour, die zu einem festen Auftrag oder zurück ins Depot zur vorherigen.
+        """
+        route, beginn, ende = self.routen[r], self.beginn[r], self.ende[r]
+        touren = []
+        tour = None
+        ort = self.depot  # aktueller Standort, None = noch nicht losgefahren (ohne Depot)
+        for k, j in enumerate(route):
+            auftrag = self.auftraege[j]
+            anfahrt = (self.leer[route[k - 1]][j] if k else self.ab_depot[j])
+            if self.fest[j]:
+                if tour is not None:
+                    if ort != auftrag.von:
+                        tour[2].append((ort, auftrag.von))
+                    tour[1] = ende[k - 1] + anfahrt
+                    touren.append(tour)
+                    tour = None
+                ort = auftrag.nach
+                continue
+            abfahrt = beginn[k] - anfahrt
+            if tour is not None and abfahrt - tour[1] >= TOUR_TRENNEN_AB_MIN:
+                touren.append(tour)
+                tour = None
+            if tour is None:
+                tour = [abfahrt if ort is not None else beginn[k], None, [], []]
+            if ort is not None and ort != auftrag.von:
+                tour[2].append((ort, auftrag.von))
+            tour[2].append((auftrag.von, auftrag.nach))
+            tour[3].append(j)
+            tour[1] = ende[k]
+            ort = auftrag.nach
+        if tour is not None:
+            if self.depot is not None and ort != self.depot:
+                tour[2].append((ort, self.depot))
+                tour[1] += self.zum_depot[route[-1]]
+            touren.append(tour)
+        return [tuple(t) for t in touren]
+
+    def fahrzeugplaene(self):
+        """Genutzte Fahrzeuge mit ihren Stopps, in der Reihenfolge des frühesten Beginns"""
+        plaene = []
+        for r, route in enumerate(self.routen):
+            if not route or all(self.fest[j] for j in route):
+                continue
+            stopps = []
+            for k, j in enumerate(route):
+                a = self.auftraege[j]
+                stopps.append({
+                    "bezug": a.bezug, "version": a.version, "von": standorte.name(a.von),
+                    "nach": standorte.name(a.nach),
+                    "beginn": minuten_zu_zeit(self.beginn[r][k]), "ende": minuten_zu_zeit(min(self.ende[r][k], TAG_MIN)),
+                    "leerfahrt_min": self.leer[route[k - 1]][j] if k else self.ab_depot[j],
+                    "fest": a.fest,
+                })
+            plaene.append((self.beginn[r][0], {
+                "stopps": stopps,
+                "auftraege": sum(not self.fest[j] for j in route),
+                "leerfahrt_min": self.wege[r],
+                "touren": len(self.touren(r)),
+            }))
+        plaene.sort(key=lambda p: p[0])
+        return [plan for _, plan in plaene]
+
+
+# -------------------- DATENBANK --------------------
+def _minuten(tag_start, zeitpunkt):
+    return math.floor((zeitpunkt - tag_start).total_seconds() / 60)
+
+def auftraege_laden(db: Session, datum, fahrzeugtyp=None):
+    """
+    Aufträge und Fahrzeuganzahl je Fahrzeugtyp für einen Tag
+    Geplant werden Transporte mit Status offen, ohne Tour und ohne Fahrer; alle anderen
+    Buchungen des Tages sind feste Aufträge, so wie sie in der Zeitleiste zählen.
+    Rückgabe: {fahrzeugtyp: ([Auftrag], anzahl)}, [(bezug, grund)] nicht planbar, [(bezug, warnung)]
+    """
+    distanz_cache.sicherstellen(db)
+    tag_start = datetime.combine(datum, uhrzeit())
+    transporte = select(Transport.id, Transport.von_id, Transport.nach_id, Transport.fahrzeugtyp, Transport.startzeit,
+                        Transport.weg_min, Transport.zeitfenster, Transport.status, Transport.fahrer_id,
+                        Transport.version).where(
+        Transport.datum == datum,
+        Transport.fahrzeugtyp.isnot(None),
+        # Touren-Transporte sind über den Mehrfachtransport bereits belegt
+        Transport.mehrfachtransport_id.is_(None),
+    )
+    touren = select(Mehrfachtransport.id, Mehrfachtransport.fahrzeugtyp, Mehrfachtransport.startzeit,
+                    Mehrfachtransport.gesamt_weg_min, Mehrfachtransport.version).where(Mehrfachtransport.datum == datum)
+    routen = select(MehrfachtransportRoute.mehrfachtransport_id, MehrfachtransportRoute.von_id,
+                    MehrfachtransportRoute.nach_id).join(Mehrfachtransport).where(
+        Mehrfachtransport.datum == datum).order_by(MehrfachtransportRoute.mehrfachtransport_id,
+                                                   MehrfachtransportRoute.reihenfolge)
+    if fahrzeugtyp is not None:
+        transporte = transporte.where(Transport.fahrzeugtyp == fahrzeugtyp)
+        touren = touren.where(Mehrfachtransport.fahrzeugtyp == fahrzeugtyp)
+        routen = routen.where(Mehrfachtransport.fahrzeugtyp == fahrzeugtyp)
+
+    auftraege = {}
+    nicht_planbar = []
+    warnungen = []
+    for id, von, nach, typ, startzeit, weg_min, zeitfenster, status, fahrer_id, version in db.execute(transporte):
+        bezug = f"transport/{id}"
+        if status != "offen" or fahrer_id is not None:
+            try:
+                start, ende = intervall(startzeit, weg_min)
+            except (AttributeError, TypeError, ValueError):
+                continue  # belegt auch in der Zeitleiste nichts
+            auftraege.setdefault(typ, []).append(Auftrag(bezug, von, nach, start, start, ende - start, True, version))
+            continue
+        if von is None or nach is None:
+            nicht_planbar.append((bezug, "Start oder Ziel fehlt"))
+            continue
+        try:
+            frueh = zeit_zu_minuten(startzeit)
+        except (AttributeError, ValueError):
+            frueh = -1
+        if not 0 <= frueh < TAG_MIN:
+            nicht_planbar.append((bezug, f"Ungültige Startzeit: {startzeit}"))
+            continue
+        weg = distanz_cache.weg_min(von, nach)
+        weg = weg if weg is not None else weg_min
+        dauer = math.ceil(weg) if weg and weg > 0 else MINDEST_DAUER_MIN
+        spaet = TAG_MIN - 1
+        if zeitfenster is not None:
+            spaet = min(spaet, _minuten(tag_start, zeitfenster) - dauer)
+            if spaet < frueh:
+                # Frist schon bei pünktlichem Beginn nicht zu halten: zur gebuchten Zeit einplanen
+                warnungen.append((bezug, f"Frist {zeitfenster:%d.%m. %H:%M} ist ab {startzeit} nicht erreichbar"))
+                spaet = frueh
+        auftraege.setdefault(typ, []).append(Auftrag(bezug, von, nach, frueh, spaet, dauer, False, version))
+
+    tour_orte = {}
+    for tour_id, von, nach in db.execute(routen):
+        erster, _ = tour_orte.get(tour_id, (von, None))
+        tour_orte[tour_id] = (erster, nach)
+    for id, typ, startzeit, gesamt_weg_min, version in db.execute(touren):
+        try:
+            start, ende = intervall(startzeit, gesamt_weg_min)
+        except (AttributeError, TypeError, ValueError):
+            continue
+        von, nach = tour_orte.get(id, (None, None))
+        auftraege.setdefault(typ, []).append(Auftrag(f"tour/{id}", von, nach, start, start, ende - start, True, version))
+
+    # Nur Fahrzeugtypen mit etwas zu planen
+    auftraege = {typ: liste for typ, liste in auftraege.items() if not all(a.fest for a in liste)}
+    anzahl = dict(db.execute(select(Fahrzeugtyp.name, Fahrzeugtyp.anzahl_verfuegbar).where(
+        Fahrzeugtyp.name.in_(list(auftraege)))).all())
+    # Unbekannter Fahrzeugtyp: wie in der Zeitleiste ein Fahrzeug
+    daten = {typ: (liste, anzahl.get(typ) if anzahl.get(typ) is not None else 1) for typ, liste in auftraege.items()}
+    return daten, nicht_planbar, warnungen
+
+
+def tagesplan(db: Session, datum, fahrzeugtyp=None, depot=None, zeitbudget_ms=2000,
+              fahrzeug_kosten_min=FAHRZEUG_KOSTEN_MIN):
+    """Plan für alle Fahrzeugtypen; das Zeitbudget wird nach Anzahl der Aufträge aufgeteilt, depot ist eine Standort-ID"""
+    start = time.perf_counter()
+    daten, nicht_planbar, warnungen = auftraege_laden(db, datum, fahrzeugtyp)
+    gesamt = sum(len(liste) for liste, _ in daten.values()) or 1
+    fahrzeuge = []
+    nicht_eingeplant = [{"bezug": bezug, "grund": grund} for bezug, grund in nicht_planbar]
+    auftraege = len(nicht_planbar)
+    iterationen = 0
+    for typ in sorted(daten):
+        liste, anzahl = daten[typ]
+        planer = Planer(liste, anzahl, depot, fahrzeug_kosten_min).loesen(zeitbudget_ms * len(liste) / gesamt)
+        iterationen += planer.iterationen
+        auftraege += sum(not a.fest for a in liste)
+        for nr, plan in enumerate(planer.fahrzeugplaene(), start=1):
+            fahrzeuge.append({"fahrzeugtyp": typ, "fahrzeug": nr, **plan})
+        for j in planer.offen:
+            a = planer.auftraege[j]
+            grund = "Feste Buchung ohne freies Fahrzeug" if a.fest else f"Kein {typ} im Zeitfenster frei"
+            if a.fest:
+                warnungen.append((a.bezug, grund))
+            else:
+                nicht_eingeplant.append({"bezug": a.bezug, "grund": grund})
+    return {
+        "datum": datum,
+        "depot": standorte.name(depot),
+        "fahrzeuge": fahrzeuge,
+        "nicht_eingeplant": nicht_eingeplant,
+        "warnungen": [f"{bezug}: {meldung}" for bezug, meldung in warnungen],
+        "auftraege": auftraege,
+        "eingeplant": sum(f["auftraege"] for f in fahrzeuge),
+        "fahrzeuge_genutzt": len(fahrzeuge),
+        "leerfahrt_min": sum(f["leerfahrt_min"] for f in fahrzeuge),
+        "iterationen": iterationen,
+        "laufzeit_ms": round((time.perf_counter() - start) * 1000),
+    }
+
+
+def plan_uebernehmen(db: Session, datum, depot, fahrzeuge):
+    """
+    Legt die Fahrzeugpläne als Mehrfachtransporte an (eine Tour je zusammenhängendem Abschnitt)
+    depot: Standort-ID wie bei tagesplan()
+    fahrzeuge: [(fahrzeugtyp, [(bezug, version)])], z.B. die Fahrzeuge aus tagesplan()
+    Die Tage sind dabei gesperrt; jede Abweichung vom aktuellen Stand -> 409, nichts wird angelegt.
+    Rückgabe: ids der neuen Mehrfachtransporte
+    """
+    typen = sorted({typ for typ, _ in fahrzeuge})
+    with slots_gesperrt(db, [(typ, datum, slot) for typ in typen for slot in ALLE_SLOTS]):
+        daten, _, _ = auftraege_laden(db, datum)
+        neue_touren = []
+        zeiten = {}
+        for typ in typen:
+            if typ not in daten:
+                raise HTTPException(status_code=409, detail=f"Keine offenen Transporte für {typ} am {datum}")
+            liste, anzahl = daten[typ]
+            plaene = [stopps for t, stopps in fahrzeuge if t == typ]
+            if len(plaene) > anzahl:
+                raise HTTPException(status_code=409, detail=f"Nur {anzahl} {typ} verfügbar, Plan nutzt {len(plaene)}")
+            planer = Planer(liste, anzahl, depot)
+            index = {a.bezug: j for j, a in enumerate(liste)}
+            verplant = set()
+            for r, stopps in enumerate(plaene):
+                for bezug, version in stopps:
+                    j = index.get(bezug)
+                    if j is None:
+                        if bezug.startswith("transport/"):
+                            raise HTTPException(status_code=409, detail=f"{bezug} ist nicht mehr offen")
+                        continue  # gelöschte feste Buchung
+                    if j in verplant:
+                        raise HTTPException(status_code=400, detail=f"{bezug} ist mehrfach verplant")
+                    if version is not None and version != liste[j].version:
+                        raise HTTPException(status_code=409, detail=f"{bezug} wurde zwischenzeitlich geändert, bitte neu planen")
+                    verplant.add(j)
+                    planer.routen[r].append(j)
+            for r in range(len(plaene)):
+                if not planer.aktualisieren(r):
+                    raise HTTPException(status_code=409, detail=f"Plan für {typ} Fahrzeug {r + 1} hält die Zeitfenster nicht mehr ein")
+            # Feste Buchungen, die im Plan fehlen, auf freie Fahrzeuge verteilen
+            planer.einplanen([j for j, a in enumerate(liste) if a.fest and j not in verplant])
+
+            for r in range(len(plaene)):
+                position = {j: k for k, j in enumerate(planer.routen[r])}
+                touren = planer.touren(r)
+                for nr, (beginn, ende, strecken, auftraege) in enumerate(touren, start=1):
+                    name = f"Disposition {datum:%d.%m.%Y} {typ} {r + 1}" + (f"/{nr}" if len(touren) > 1 else "")
+                    mt = Mehrfachtransport(
+                        name=name, fahrzeugtyp=typ, datum=datum, startzeit=minuten_zu_zeit(beginn),
+                        # Dauer inkl. Wartezeiten, damit die Zeitleiste das Fahrzeug durchgehend belegt
+                        gesamt_weg_min=ende - beginn, erstellt_am=datetime.now(),
+                    )
+                    db.add(mt)
+                    neue_touren.append((mt, strecken))
+                    for j in auftraege:
+                        zeiten[int(liste[j].bezug.split("/")[1])] = (mt, planer.beginn[r][position[j]])
+
+        transporte = db.query(Transport).filter(Transport.id.in_(list(zeiten))).all()
+        db.flush()
+        # Teilstrecken aller Touren mit einem Mehrzeilen-INSERT
+        strecken = [{"mehrfachtransport_id": mt.id, "reihenfolge": k, "von_id": von, "nach_id": nach,
+                     "weg_min": distanz_cache.weg_min(von, nach) or 0}
+                    for mt, tour in neue_touren for k, (von, nach) in enumerate(tour, start=1)]
+        if strecken:
+            db.execute(insert(MehrfachtransportRoute), strecken)
+        for t in transporte:
+            mt, beginn = zeiten[t.id]
+            t.mehrfachtransport_id = mt.id
+            t.startzeit = minuten_zu_zeit(beginn)
+        db.flush()
+
+        # Absicherung: in den Slots der neuen Touren darf kein Fahrzeugtyp überbucht sein
+        for typ in typen:
+            zeitleiste = zeitleiste_laden(db, typ, datum)
+            belegung = zeitleiste.belegung_pro_slot()
+            for mt, _ in neue_touren:
+                if mt.fahrzeugtyp == typ and any(belegung[i] > zeitleiste.kapazitaet
+                                                 for i in slot_bereich(mt.startzeit, mt.gesamt_weg_min)):
+                    db.rollback()
+                    raise HTTPException(status_code=409, detail=f"Kein {typ} frei am {datum} um {mt.startzeit}")
+        db.commit()
+    return [mt.id for mt, _ in neue_touren]
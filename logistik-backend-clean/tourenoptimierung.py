@@ -0,0 +1,161 @@
+"""
+Reihenfolge-Optimierung für Mehrfachtransporte
+
+Der erste Stopp ist der Startort und bleibt fest. Bis EXAKT_MAX_STOPPS wird die
+optimale Reihenfolge exakt bestimmt (Held-Karp), darüber mit Nächster-Nachbar
+als Start und anschließender 2-opt/Or-opt-Verbesserung innerhalb eines Zeitbudgets.
+Alle Verfahren arbeiten auf einem vorberechneten NumPy-Distanzarray.
+"""
+import time
+import numpy as np
+from distanz_cache import distanz_cache
+
+EXAKT_MAX_STOPPS = 10
+FEHLENDE_STRECKE_MIN = 10_000.0
+OR_OPT_SEGMENTE = (1, 2, 3)
+
+
+def distanz_array(orte):
+    """Kürzeste Fahrzeiten zwischen allen Orten als float-Array, plus Liste fehlender Strecken"""
+    distanzen = distanz_cache.teilmatrix(orte)
+    fehlend = [(orte[i], orte[j]) for i, j in zip(*np.nonzero(np.isinf(distanzen)))]
+    # Nicht erreichbare Strecken bekommen eine hohe Strafzeit, damit der Optimierer sie meidet
+    distanzen[np.isinf(distanzen)] = FEHLENDE_STRECKE_MIN
+    return distanzen, fehlend
+
+def tour_kosten(distanzen, route):
+    route = np.asarray(route)
+    return float(distanzen[route[:-1], route[1:]].sum())
+
+
+# -------------------- EXAKT --------------------
+def held_karp(distanzen, rundreise=False):
+    """Dynamische Programmierung über Teilmengen, O(2^n * n^2), Start fest bei 0"""
+    n = len(distanzen)
+    voll = (1 << n) - 1
+    kosten = np.full((1 << n, n), np.inf)
+    vorgaenger = np.full((1 << n, n), -1, dtype=np.int64)
+    kosten[1, 0] = 0.0
+    alle = np.arange(n)
+
+    for maske in range(1, 1 << n, 2):  # nur Teilmengen mit dem Start
+        offen = alle[((maske >> alle) & 1) == 0]
+        if len(offen) == 0:
+            continue
+        neue_masken = maske | (1 << offen)
+        for j in np.flatnonzero(np.isfinite(kosten[maske])):
+            kandidat = kosten[maske, j] + distanzen[j, offen]
+            besser = kandidat < kosten[neue_masken, offen]
+            kosten[neue_masken[besser], offen[besser]] = kandidat[besser]
+            vorgaenger[neue_masken[besser], offen[besser]] = j
+
+    ende_kosten = kosten[voll] + (distanzen[:, 0] if rundreise else 0)
+    letzter = int(np.argmin(ende_kosten[1:]) + 1) if n > 1 else 0
+
+    route = []
+    maske = voll
+    while letzter != -1:
+        route.append(letzter)
+        vorheriger = int(vorgaenger[maske, letzter])
+        maske &= ~(1 << letzter)
+        letzter = vorheriger
+    route.reverse()
+    return route + [0] if rundreise else route
+
+
+# -------------------- HEURISTIK --------------------
+def naechster_nachbar(distanzen, rundreise=False):
+    n = len(distanzen)
+    besucht = np.zeros(n, dtype=bool)
+    besucht[0] = True
+    route = [0]
+    for _ in range(n - 1):
+        kandidaten = np.where(besucht, np.inf, distanzen[route[-1]])
+        naechster = int(np.argmin(kandidaten))
+        besucht[naechster] = True
+        route.append(naechster)
+    return route + [0] if rundreise else route
+
+def _praefixsummen(distanzen, route):
+    r = np.asarray(route)
+    vorwaerts = np.concatenate(([0.0], np.cumsum(distanzen[r[:-1], r[1:]])))
+    rueckwaerts = np.concatenate(([0.0], np.cumsum(distanzen[r[1:], r[:-1]])))
+    return vorwaerts, rueckwaerts
+
+def _letzte_position(route, rundreise):
+    """Letzte verschiebbare Position; bei einer Rundreise bleibt die Rückkehr zum Start fest"""
+    return len(route) - 2 if rundreise else len(route) - 1
+
+def zwei_opt(distanzen, route, rundreise, frist):
+    """
+    Erste verbessernde 2-opt-Umkehrung anwenden, True wenn eine gefunden wurde
+    Die Differenz ist O(1) über Präfixsummen, auch bei unsymmetrischen Fahrzeiten
+    """
+    vorwaerts, rueckwaerts = _praefixsummen(distanzen, route)
+    laenge = len(route)
+    letzte_position = _letzte_position(route, rundreise)
+    for i in range(1, letzte_position):
+        if time.perf_counter() > frist:
+            return False
+        a = route[i - 1]
+        for k in range(i + 1, letzte_position + 1):
+            b, c = route[i], route[k]
+            alt = distanzen[a, b] + (vorwaerts[k] - vorwaerts[i])
+            neu = distanzen[a, c] + (rueckwaerts[k] - rueckwaerts[i])
+            if k + 1 < laenge:
+                d = route[k + 1]
+                alt += distanzen[c, d]
+                neu += distanzen[b, d]
+            if neu < alt - 1e-9:
+                route[i:k + 1] = route[i:k + 1][::-1]
+                return True
+    return False
+
+def or_opt(distanzen, route, rundreise, frist):
+    """Erste verbessernde Verschiebung eines Abschnitts (1-3 Stopps) anwenden"""
+    laenge = len(route)
+    letzte_position = _letzte_position(route, rundreise)
+    for segment in OR_OPT_SEGMENTE:
+        for i in range(1, letzte_position - segment + 2):
+            if time.perf_counter() > frist:
+                return False
+            j = i + segment - 1
+            p, s0, s1 = route[i - 1], route[i], route[j]
+            n = route[j + 1] if j + 1 < laenge else None
+            gewinn = distanzen[p, s0] + (distanzen[s1, n] - distanzen[p, n] if n is not None else 0)
+            rest = route[:i] + route[j + 1:]
+            # Einfügen zwischen rest[e-1] und rest[e]: nie vor den Start, bei einer
+            # Rundreise nie hinter die Rückkehr zum Start
+            letztes_e = len(rest) - 1 if rundreise else len(rest)
+            for e in range(1, letztes_e + 1):
+                if e == i:
+                    continue
+                a = rest[e - 1]
+                b = rest[e] if e < len(rest) else None
+                kosten = distanzen[a, s0] + (distanzen[s1, b] - distanzen[a, b] if b is not None else 0)
+                if kosten < gewinn - 1e-9:
+                    route[:] = rest[:e] + route[i:j + 1] + rest[e:]
+                    return True
+    return False
+
+def lokale_suche(distanzen, route, rundreise, frist):
+    while time.perf_counter() < frist:
+        if zwei_opt(distanzen, route, rundreise, frist):
+            continue
+        if or_opt(distanzen, route, rundreise, frist):
+            continue
+        break
+    return route
+
+
+def optimieren(distanzen, rundreise=False, zeitbudget_ms=200):
+    """Beste gefundene Reihenfolge (Indizes) und das verwendete Verfahren"""
+    n = len(distanzen)
+    if n <= 2:
+        route = list(range(n))
+        return (route + [0] if rundreise else route), "trivial"
+    if n <= EXAKT_MAX_STOPPS:
+        return held_karp(distanzen, rundreise), "exakt"
+    frist = time.perf_counter() + zeitbudget_ms / 1000
+    route = naechster_nachbar(distanzen, rundreise)
+    return lokale_suche(distanzen, route, rundreise, frist), "heuristik"
@@ -0,0 +1,109 @@
+"""
+Sammelbuchung von Transporten
+
+Alle Zeilen werden zuerst geprüft (Schema, Standorte, Distanz aus dem Cache, Slot-Kapazität
+in der Zeitleiste, Schicht und Überschneidungen des Fahrers), danach werden alle
+gültigen Zeilen mit einem einzigen Mehrzeilen-INSERT in einer Transaktion angelegt.
+Unbekannte Standorte sind ein Fehler der Zeile, das Verzeichnis wird dafür höchstens einmal
+neu geladen (standorte.py).
+Die betroffenen Tage und Fahrer sind dabei gesperrt, parallele Buchungen warten (reservierung.py).
+"""
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from models import Transport
+from distanz_cache import distanz_cache
+from standorte import standorte
+from verfuegbarkeit import zeitleiste_laden
+from disposition import fahrt_intervall, disposition_laden
+from reservierung import ALLE_SLOTS, slots_gesperrt, fahrer_gesperrt
+import schemas
+
+
+def transporte_buchen(db: Session, zeilen, konflikte_pruefen=True):
+    """
+    Bucht eine Liste von Transport-Zeilen (dicts)
+    konflikte_pruefen=False nur für den Import (import_transporte.py --ohne-konfliktpruefung), nie über die API
+    Rückgabe: (ids der angelegten Transporte, [{"zeile": i, "fehler": "..."}])
+    """
+    distanz_cache.sicherstellen(db)
+    zeitleisten = {}
+    dispositionen = {}
+    fehler = []
+    gueltig = []
+    werte = []
+
+    for i, zeile in enumerate(zeilen):
+        try:
+            gueltig.append((i, schemas.TransportCreate(**zeile)))
+        except ValidationError as e:
+            meldung = "; ".join(f"{'.'.join(map(str, f['loc']))}: {f['msg']}" for f in e.errors())
+            fehler.append({"zeile": i, "fehler": meldung})
+
+    # Einmal vor der Sperre nachladen (anderer Worker), danach löst jede Zeile aus dem Speicher auf
+    if not standorte.bekannt(*(ort for _, t in gueltig for ort in (t.von, t.nach))):
+        standorte.laden()
+
+    # Fahrer und alle betroffenen Tage komplett sperren, bevor Dispositionen und Zeitleisten gelesen werden
+    # Touren-Transporte belegen kein eigenes Fahrzeug, ihre Tage brauchen keine Sperre
+    tage, fahrer = set(), set()
+    if konflikte_pruefen:
+        eigene = [t for _, t in gueltig if t.mehrfachtransport_id is None]
+        tage = {(t.fahrzeugtyp, t.datum) for t in eigene}
+        fahrer = {(t.fahrer_id, t.datum) for t in eigene if t.fahrer_id is not None}
+    with fahrer_gesperrt(db, fahrer), \
+            slots_gesperrt(db, [(typ, datum, slot) for typ, datum in tage for slot in ALLE_SLOTS]):
+        for i, transport in gueltig:
+            try:
+                von_id, nach_id = standorte.aufloesen(transport.von, transport.nach, nachladen=False)
+            except ValueError as e:
+                fehler.append({"zeile": i, "fehler": str(e)})
+                continue
+            weg_min = distanz_cache.weg_min(von_id, nach_id)
+
+            fahrt = None
+            if konflikte_pruefen and transport.fahrer_id is not None and transport.mehrfachtransport_id is None:
+                try:
+                    fahrt = fahrt_intervall(transport.datum, transport.startzeit, weg_min)
+                except ValueError:
+                    fehler.append({"zeile": i, "fehler": f"Ungültige Startzeit: {transport.startzeit}"})
+                    continue
+                if transport.datum not in dispositionen:
+                    dispositionen[transport.datum] = disposition_laden(db, transport.datum)
+                konflikte = dispositionen[transport.datum].pruefen(transport.fahrer_id, *fahrt)
+                if konflikte:
+                    fehler.append({"zeile": i, "fehler": "; ".join(k["meldung"] for k in konflikte)})
+                    continue
+
+            if konflikte_pruefen and transport.mehrfachtransport_id is None:
+                schluessel = (transport.fahrzeugtyp, transport.datum)
+                if schluessel not in zeitleisten:
+                    zeitleisten[schluessel] = zeitleiste_laden(db, *schluessel)
+                try:
+                    frei = zeitleisten[schluessel].reservieren(transport.startzeit, weg_min)
+                except ValueError:
+                    fehler.append({"zeile": i, "fehler": f"Ungültige Startzeit: {transport.startzeit}"})
+                    continue
+                if not frei:
+                    fehler.append({
+                        "zeile": i,
+                        "fehler": f"Kein {transport.fahrzeugtyp} frei am {transport.datum} um {transport.startzeit}",
+                    })
+                    continue
+
+            if fahrt is not None:
+                # Spätere Zeilen desselben Fahrers sehen diese Fahrt schon
+                dispositionen[transport.datum].buchen(transport.fahrer_id, *fahrt, f"zeile/{i}")
+
+            daten = transport.dict(exclude={"von", "nach"})
+            daten.update(von_id=von_id, nach_id=nach_id, weg_min=weg_min)
+            if transport.mehrfachtransport_id is not None:
+                daten["fahrer_id"] = None  # fährt der Fahrer der Tour
+            werte.append(daten)
+
+        ids = []
+        if werte:
+            ids = list(db.scalars(insert(Transport).returning(Transport.id), werte))
+            db.commit()
+    fehler.sort(key=lambda f: f["zeile"])
+    return ids, fehler
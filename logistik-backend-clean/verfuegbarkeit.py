@@ -0,0 +1,169 @@
+"""
+Verfügbarkeit von Fahrzeugen pro Fahrzeugtyp und Tag
+
+Jede Buchung belegt ein Fahrzeug von der Startzeit bis Startzeit + Fahrzeit.
+Die Belegung pro Zeitslot wird mit einem Sweep über die sortierten
+Start-/Endereignisse berechnet: O((n + Slots) log n) statt Listenvergleichen.
+"""
+import math
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from models import Transport, Mehrfachtransport, Fahrzeugtyp
+
+SLOT_MIN = 30
+TAG_MIN = 24 * 60
+
+# Buchungen ohne bekannte Fahrzeit belegen mindestens ihren Startslot
+MINDEST_DAUER_MIN = SLOT_MIN
+
+
+def zeit_zu_minuten(zeit):
+    """'08:30' -> 510"""
+    h, m = zeit.split(":")[:2]
+    return int(h) * 60 + int(m)
+
+def minuten_zu_zeit(minuten):
+    return f"{minuten // 60:02d}:{minuten % 60:02d}"
+
+def alle_slots():
+    return [minuten_zu_zeit(m) for m in range(0, TAG_MIN, SLOT_MIN)]
+
+def intervall(startzeit, dauer_min):
+    """(start, ende) in Minuten; Fahrten über Mitternacht werden am Tagesende abgeschnitten"""
+    start = zeit_zu_minuten(startzeit)
+    if not 0 <= start < TAG_MIN:
+        raise ValueError(f"Startzeit außerhalb des Tages: {startzeit}")
+    dauer = dauer_min if dauer_min and dauer_min > 0 else MINDEST_DAUER_MIN
+    return start, min(start + math.ceil(dauer), TAG_MIN)
+
+def slot_bereich(startzeit, dauer_min):
+    """Indizes aller Slots, die eine Fahrt berührt (mindestens der Startslot)"""
+    start, ende = intervall(startzeit, dauer_min)
+    return range(start // SLOT_MIN, max(math.ceil(ende / SLOT_MIN), start // SLOT_MIN + 1))
+
+
+class Zeitleiste:
+    """Belegungs-Zeitleiste eines Fahrzeugtyps an einem Tag"""
+
+    def __init__(self, kapazitaet):
+        self.kapazitaet = kapazitaet
+        self.intervalle = []
+        self._belegung = None
+
+    def buchung_hinzufuegen(self, startzeit, dauer_min):
+        try:
+            start, ende = intervall(startzeit, dauer_min)
+        except (AttributeError, ValueError):
+            # Alte Datensätze ohne gültige Startzeit belegen nichts
+            return
+        if ende > start:
+            self.intervalle.append((start, ende))
+            self._belegung = None
+
+    def belegung_pro_slot(self):
+        """Maximale Anzahl gleichzeitig belegter Fahrzeuge je Slot"""
+        ereignisse = [(s, 1) for s, _ in self.intervalle] + [(e, -1) for _, e in self.intervalle]
+        # Bei gleichem Zeitpunkt zuerst Enden (-1), dann Starts (+1)
+        ereignisse.sort()
+        n = len(ereignisse)
+        i = 0
+        belegt = 0
+        ergebnis = []
+        for slot_start in range(0, TAG_MIN, SLOT_MIN):
+            slot_ende = slot_start + SLOT_MIN
+            while i < n and ereignisse[i][0] <= slot_start:
+                belegt += ereignisse[i][1]
+                i += 1
+            spitze = belegt
+            while i < n and ereignisse[i][0] < slot_ende:
+                belegt += ereignisse[i][1]
+                spitze = max(spitze, belegt)
+                i += 1
+            ergebnis.append(spitze)
+        return ergebnis
+
+    def reservieren(self, startzeit, dauer_min):
+        """
+        Belegt ein Fahrzeug für die Fahrt, wenn in allen berührten Slots eins frei ist
+        Für Sammelbuchungen: die Slot-Belegung wird einmal berechnet und dann fortgeschrieben
+        """
+        if self._belegung is None:
+            self._belegung = self.belegung_pro_slot()
+        start, ende = intervall(startzeit, dauer_min)
+        slots = slot_bereich(startzeit, dauer_min)
+        if any(self._belegung[i] >= self.kapazitaet for i in slots):
+            return False
+        for i in slots:
+            self._belegung[i] += 1
+        self.intervalle.append((start, ende))
+        return True
+
+    def ist_frei(self, slots):
+        """Ist in allen angegebenen Slots noch mindestens ein Fahrzeug frei?"""
+        belegung = self.belegung_pro_slot()
+        return all(belegung[i] < self.kapazitaet for i in slots)
+
+    def frei_pro_slot(self, dauer_min=None):
+        """
+        Freie Fahrzeuge je Slot
+        Mit dauer_min muss das Fahrzeug über die ganze Fahrtdauer frei sein
+        """
+        frei = [max(self.kapazitaet - b, 0) for b in self.belegung_pro_slot()]
+        fenster = max(math.ceil(dauer_min / SLOT_MIN), 1) if dauer_min else 1
+        if fenster == 1:
+            return frei
+        # Minimum über die Slots, die die Fahrt überdeckt (Ende des Tages zählt als frei)
+        return [min(frei[i:i + fenster]) for i in range(len(frei))]
+
+
+def verfuegbarkeit_antwort(zeitleiste, dauer_min=None):
+    """Antwort für /verfuegbare-zeiten: verfügbar, solange mindestens ein Fahrzeug frei ist"""
+    frei = zeitleiste.frei_pro_slot(dauer_min)
+    slots = alle_slots()
+    return {
+        "verfuegbare_zeiten": [zeit for zeit, anzahl in zip(slots, frei) if anzahl > 0],
+        "freie_fahrzeuge": dict(zip(slots, frei)),
+        "kapazitaet": zeitleiste.kapazitaet,
+    }
+
+
+def _abfragen(fahrzeugtyp, datum, ohne_transport_id=None, ohne_tour_id=None):
+    """
+    Kapazität, Einzeltransporte und Mehrfachtransporte (nutzt den Index fahrzeugtyp, datum)
+    ohne_transport_id / ohne_tour_id: die gerade geänderte Buchung nicht mitzählen
+    """
+    kapazitaet = select(Fahrzeugtyp.anzahl_verfuegbar).where(Fahrzeugtyp.name == fahrzeugtyp)
+    transporte = select(Transport.startzeit, Transport.weg_min).where(
+        Transport.fahrzeugtyp == fahrzeugtyp,
+        Transport.datum == datum,
+        # Touren-Transporte sind über den Mehrfachtransport bereits belegt
+        Transport.mehrfachtransport_id.is_(None),
+    )
+    touren = select(Mehrfachtransport.startzeit, Mehrfachtransport.gesamt_weg_min).where(
+        Mehrfachtransport.fahrzeugtyp == fahrzeugtyp,
+        Mehrfachtransport.datum == datum,
+    )
+    if ohne_transport_id is not None:
+        transporte = transporte.where(Transport.id != ohne_transport_id)
+    if ohne_tour_id is not None:
+        touren = touren.where(Mehrfachtransport.id != ohne_tour_id)
+    return kapazitaet, transporte, touren
+
+def _zeitleiste_bauen(anzahl, buchungen):
+    # Unbekannter Fahrzeugtyp: wie bisher blockiert eine Buchung den Slot
+    zeitleiste = Zeitleiste(anzahl if anzahl is not None else 1)
+    for startzeit, dauer_min in buchungen:
+        zeitleiste.buchung_hinzufuegen(startzeit, dauer_min)
+    return zeitleiste
+
+def zeitleiste_laden(db: Session, fahrzeugtyp, datum, ohne_transport_id=None, ohne_tour_id=None):
+    """Baut die Zeitleiste aus Transporten und Mehrfachtransporten"""
+    kapazitaet, transporte, touren = _abfragen(fahrzeugtyp, datum, ohne_transport_id, ohne_tour_id)
+    buchungen = db.execute(transporte).all() + db.execute(touren).all()
+    return _zeitleiste_bauen(db.execute(kapazitaet).scalar(), buchungen)
+
+async def zeitleiste_laden_async(session, fahrzeugtyp, datum, ohne_transport_id=None, ohne_tour_id=None):
+    """Wie zeitleiste_laden, für AsyncSession"""
+    kapazitaet, transporte, touren = _abfragen(fahrzeugtyp, datum, ohne_transport_id, ohne_tour_id)
+    buchungen = (await session.execute(transporte)).all() + (await session.execute(touren)).all()
+    return _zeitleiste_bauen((await session.execute(kapazitaet)).scalar(), buchungen)
@@ -25,6 +25,7 @@ export default function Transportauftrag() {
     startzeit: ""
   });
   const [wegMin, setWegMin] = useState("");
+  const [neuLaden, setNeuLaden] = useState(0);
 
   // Fahrzeugtypen laden
   useEffect(() => {
@@ -52,20 +53,34 @@ export default function Transportauftrag() {
     } else {
       setGebuchteZeiten([]); // Keine gebuchten Zeiten wenn kein Fahrzeugtyp/Datum
     }
+  }, [data.fahrzeugtyp, data.datum, neuLaden]);
+
+  // Live-Änderungen per Server-Sent Events: es kommen nur die Slots, die sich geändert haben
+  useEffect(() => {
+    if (!data.fahrzeugtyp || !data.datum) return;
+    const quelle = new EventSource(
+      `http://127.0.0.1:8000/ereignisse?datum=${data.datum}&fahrzeugtyp=${encodeURIComponent(data.fahrzeugtyp)}&arten=verfuegbarkeit`
+    );
+    quelle.addEventListener("verfuegbarkeit", (e) => {
+      const delta = JSON.parse(e.data).daten.freie_fahrzeuge;
+      setGebuchteZeiten(alt => {
+        const gebucht = new Set(alt);
+        Object.entries(delta).forEach(([zeit, frei]) => (frei > 0 ? gebucht.delete(zeit) : gebucht.add(zeit)));
+        return alleZeitslots.filter(zeit => gebucht.has(zeit));
+      });
+    });
+    // Änderungen verpasst: einmal komplett neu laden
+    quelle.addEventListener("neu_laden", () => setNeuLaden(n => n + 1));
+    return () => quelle.close();
   }, [data.fahrzeugtyp, data.datum]);
 
   // Weg in Minuten laden
   useEffect(() => {
     if (data.abholort && data.zielort && data.abholort !== data.zielort) {
-      fetch("http://127.0.0.1:8000/distanzmatrix")
+      // Nur das gewählte Paar abfragen statt die ganze Matrix zu laden
+      fetch(`http://127.0.0.1:8000/distanzmatrix/weg?von=${encodeURIComponent(data.abholort)}&nach=${encodeURIComponent(data.zielort)}`)
         .then(res => res.json())
-        .then(all => {
-          const found = all.find(e =>
-            (e.von === data.abholort && e.nach === data.zielort) ||
-            (e.von === data.zielort && e.nach === data.abholort)
-          );
-          setWegMin(found ? found.weg_min : "");
-        })
+        .then(paar => setWegMin(paar.weg_min ?? ""))
         .catch(() => setWegMin(""));
     } else {
       setWegMin("");